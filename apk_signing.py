@@ -0,0 +1,465 @@
+"""APK signing.
+
+JAR (v1) signing: every entry is hashed with SHA-256 in a single streaming
+pass, entries are hashed concurrently on a thread pool (hashlib releases the
+GIL on large buffers, so signing a big APK is bound by I/O rather than by
+one hashing thread), and ``META-INF/MANIFEST.MF``, ``<NAME>.SF`` and a
+PKCS#7 ``<NAME>.RSA`` block are generated from the digests.
+
+APK Signature Scheme v2/v3: the finished zip is digested in 1 MiB chunks,
+also in parallel, and the signatures are placed in an APK Signing Block in
+front of the central directory.  Re-signing only rewrites that block and
+what follows it.
+"""
+import base64
+import hashlib
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from apk_writer import CHUNK_SIZE, RawEntry
+from signing_keys import Certificate, pkcs7_signature, pkcs7_signer_info, rsa_verify
+
+CREATED_BY = '1.0 (Android App Builder)'
+
+# Entries produced by signing, which are never themselves digested
+SIGNATURE_SUFFIXES = ('.SF', '.RSA', '.DSA', '.EC')
+
+# Bytes per manifest line, continuation lines start with a space (JAR spec)
+MAX_LINE = 72
+
+
+def is_signature_entry(name):
+    if not name.startswith('META-INF/') or name.count('/') != 1:
+        return False
+    base = name[len('META-INF/'):]
+    return base == 'MANIFEST.MF' or base.upper().endswith(SIGNATURE_SUFFIXES) or base.startswith('SIG-')
+
+
+def open_entry(source):
+    """Open an APK entry source (bytes, str, path or ``RawEntry``) for reading."""
+    if isinstance(source, RawEntry):
+        zf = zipfile.ZipFile(source.zip_path)
+        stream = zf.open(source.info)
+        # Close the archive together with the member stream
+        close = stream.close
+        stream.close = lambda: (close(), zf.close())
+        return stream
+    if isinstance(source, os.PathLike):
+        return open(source, 'rb')
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    return BytesIO(source)
+
+
+def entry_digest(source):
+    h = hashlib.sha256()
+    with open_entry(source) as stream:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.digest()
+
+
+def digest_entries(entries, workers=None):
+    """SHA-256 of every entry in ``entries``, hashed in parallel."""
+    names = list(entries)
+    workers = workers or min(32, os.cpu_count() or 1)
+    if workers == 1 or len(names) < 2:
+        return {name: entry_digest(entries[name]) for name in names}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(names, pool.map(entry_digest, (entries[name] for name in names))))
+
+
+def _line(key, value):
+    """One manifest attribute, wrapped at 72 bytes with continuation lines."""
+    data = f'{key}: {value}'.encode('utf-8')
+    lines = [data[:MAX_LINE]]
+    data = data[MAX_LINE:]
+    while data:
+        lines.append(b' ' + data[:MAX_LINE - 1])
+        data = data[MAX_LINE - 1:]
+    return b''.join(line + b'\r\n' for line in lines)
+
+
+def _b64(digest):
+    return base64.b64encode(digest).decode('ascii')
+
+
+def manifest_section(name, digest):
+    return _line('Name', name) + _line('SHA-256-Digest', _b64(digest)) + b'\r\n'
+
+
+def v1_signature_files(digests, signer, signed_schemes=()):
+    """Build MANIFEST.MF, the .SF file and the PKCS#7 block from entry digests.
+
+    ``signed_schemes`` lists the APK Signature Schemes (e.g. ``(2, 3)``) the
+    APK is also signed with, recorded so that Android rejects a stripped copy.
+    """
+    manifest = [_line('Manifest-Version', '1.0'), _line('Created-By', CREATED_BY), b'\r\n']
+    sections = []
+    for name in sorted(digests):
+        section = manifest_section(name, digests[name])
+        manifest.append(section)
+        sections.append(_line('Name', name) + _line('SHA-256-Digest', _b64(hashlib.sha256(section).digest())) + b'\r\n')
+    manifest = b''.join(manifest)
+
+    sf = [
+        _line('Signature-Version', '1.0'),
+        _line('Created-By', CREATED_BY),
+        _line('SHA-256-Digest-Manifest', _b64(hashlib.sha256(manifest).digest())),
+    ]
+    if signed_schemes:
+        sf.append(_line('X-Android-APK-Signed', ', '.join(str(s) for s in signed_schemes)))
+    sf = b''.join(sf) + b'\r\n' + b''.join(sections)
+
+    return {
+        'META-INF/MANIFEST.MF': manifest,
+        f'META-INF/{signer.name}.SF': sf,
+        f'META-INF/{signer.name}.RSA': pkcs7_signature(signer, sf),
+    }
+
+
+def sign_v1(entries, signer, workers=None, signed_schemes=()):
+    """Return ``entries`` with fresh v1 signature files added.
+
+    Existing signature files are dropped; everything else is kept as given.
+    """
+    unsigned = {name: source for name, source in entries.items() if not is_signature_entry(name)}
+    digests = digest_entries(unsigned, workers)
+    signed = dict(unsigned)
+    signed.update(v1_signature_files(digests, signer, signed_schemes))
+    return signed
+
+
+def _parse_sections(data):
+    """Split a manifest into ``{name: (attributes, raw section bytes)}``."""
+    sections = {}
+    for raw in data.split(b'\r\n\r\n'):
+        if not raw:
+            continue
+        lines = []
+        for line in raw.split(b'\r\n'):
+            if line.startswith(b' ') and lines:
+                lines[-1] += line[1:]
+            else:
+                lines.append(line)
+        attributes = dict(line.decode('utf-8').partition(': ')[::2] for line in lines)
+        sections[attributes.get('Name')] = (attributes, raw + b'\r\n\r\n')
+    return sections
+
+
+def verify_v1(apk_path, signer_name=None):
+    """Verify the v1 signature of ``apk_path``; return the signing certificate.
+
+    Raises ``ValueError`` describing the first problem found.
+    """
+    with zipfile.ZipFile(apk_path) as zf:
+        names = zf.namelist()
+        if signer_name is None:
+            signer_name = next((n[len('META-INF/'):-3] for n in names
+                                if n.startswith('META-INF/') and n.endswith('.SF')), None)
+            if signer_name is None:
+                raise ValueError('No v1 signature found')
+        manifest = zf.read('META-INF/MANIFEST.MF')
+        sf = zf.read(f'META-INF/{signer_name}.SF')
+        block = zf.read(f'META-INF/{signer_name}.RSA')
+
+        certificate, signature = pkcs7_signer_info(block)
+        if not rsa_verify(certificate.n, certificate.e, sf, signature):
+            raise ValueError('Signature block does not match the signature file')
+
+        sf_sections = _parse_sections(sf)
+        main = sf_sections.pop(None)[0]
+        if main.get('SHA-256-Digest-Manifest') != _b64(hashlib.sha256(manifest).digest()):
+            raise ValueError('Signature file does not match MANIFEST.MF')
+
+        mf_sections = _parse_sections(manifest)
+        mf_sections.pop(None, None)
+        for name, (attributes, raw) in mf_sections.items():
+            expected = sf_sections.get(name, ({},))[0].get('SHA-256-Digest')
+            if expected != _b64(hashlib.sha256(raw).digest()):
+                raise ValueError(f'Manifest section for {name} is not signed')
+
+        unsigned = [n for n in names if not is_signature_entry(n) and not n.endswith('/')]
+        if sorted(unsigned) != sorted(mf_sections):
+            raise ValueError('APK entries do not match MANIFEST.MF')
+        for name in unsigned:
+            h = hashlib.sha256()
+            with zf.open(name) as stream:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    h.update(chunk)
+            if mf_sections[name][0].get('SHA-256-Digest') != _b64(h.digest()):
+                raise ValueError(f'Digest mismatch for {name}')
+    return certificate
+
+
+# --- APK Signature Scheme v2 / v3 -----------------------------------------
+#
+# The v2/v3 schemes sign the whole file rather than individual entries.  The
+# file is split into the zip entries, the central directory and the end of
+# central directory record; each section is digested in 1 MiB chunks (done
+# in parallel here) and the chunk digests are digested again.  The resulting
+# signatures go into an "APK Signing Block" inserted right before the
+# central directory, so the entries themselves are never rewritten.
+
+SIGNING_BLOCK_MAGIC = b'APK Sig Block 42'
+V2_BLOCK_ID = 0x7109871A
+V3_BLOCK_ID = 0xF05368C0
+STRIPPING_PROTECTION_ATTR = 0xBEEFF00D
+RSA_PKCS1_SHA256 = 0x0103
+CONTENT_CHUNK_SIZE = 1024 * 1024
+
+# Android 9 (API 28) is the first release that reads v3 signatures
+V3_MIN_SDK = 28
+V3_MAX_SDK = 0x7FFFFFFF
+
+_EOCD_SIZE = 22
+
+
+def _u32(value):
+    return value.to_bytes(4, 'little')
+
+
+def _u64(value):
+    return value.to_bytes(8, 'little')
+
+
+def _prefixed(data):
+    return _u32(len(data)) + data
+
+
+def _prefixed_seq(items):
+    return _prefixed(b''.join(_prefixed(item) for item in items))
+
+
+def _read_prefixed(data, offset):
+    length = int.from_bytes(data[offset:offset + 4], 'little')
+    return data[offset + 4:offset + 4 + length], offset + 4 + length
+
+
+def _read_prefixed_seq(data):
+    items = []
+    offset = 0
+    while offset < len(data):
+        item, offset = _read_prefixed(data, offset)
+        items.append(item)
+    return items
+
+
+class ApkSource:
+    """Positional reads from bytes or a file, safe to share between threads."""
+
+    def __init__(self, data=None, fd=None):
+        self.data = memoryview(data) if data is not None else None
+        self.fd = fd
+
+    def size(self):
+        return len(self.data) if self.data is not None else os.fstat(self.fd).st_size
+
+    def read(self, offset, size):
+        if self.data is not None:
+            return self.data[offset:offset + size]
+        return os.pread(self.fd, size, offset)
+
+
+class ApkLayout:
+    """Offsets of the sections of a zip, and its existing signing block."""
+
+    def __init__(self, source):
+        size = source.size()
+        # The EOCD is the last record; this writer never adds a zip comment
+        # but others may, so search backwards through the maximum comment
+        tail_start = max(0, size - _EOCD_SIZE - 0xFFFF)
+        tail = bytes(source.read(tail_start, size - tail_start))
+        position = tail.rfind(b'PK\x05\x06')
+        if position < 0:
+            raise ValueError('Not a zip file: end of central directory not found')
+        self.eocd_offset = tail_start + position
+        self.eocd = tail[position:]
+        self.cd_size = int.from_bytes(self.eocd[12:16], 'little')
+        self.cd_offset = int.from_bytes(self.eocd[16:20], 'little')
+        self.central_directory = bytes(source.read(self.cd_offset, self.cd_size))
+
+        # An existing signing block ends with its size and the magic
+        self.block_offset = self.cd_offset
+        self.block = b''
+        if self.cd_offset >= 32:
+            footer = bytes(source.read(self.cd_offset - 24, 24))
+            if footer[8:] == SIGNING_BLOCK_MAGIC:
+                block_size = int.from_bytes(footer[:8], 'little')
+                self.block_offset = self.cd_offset - block_size - 8
+                self.block = bytes(source.read(self.block_offset, block_size + 8))
+
+    def eocd_for_digest(self):
+        # Digested as if the central directory started where the block does
+        return self.eocd[:16] + _u32(self.block_offset) + self.eocd[20:]
+
+
+def _chunk_digest(chunk):
+    return hashlib.sha256(b'\xa5' + _u32(len(chunk)) + chunk).digest()
+
+
+def chunk_count(size):
+    return -(-size // CONTENT_CHUNK_SIZE)
+
+
+def chunk_digests(source, end, indices=None, workers=None):
+    """Digest the 1 MiB chunks ``indices`` (default all) of ``source[:end]``."""
+    if indices is None:
+        indices = range(chunk_count(end))
+
+    def digest_chunk(index):
+        offset = index * CONTENT_CHUNK_SIZE
+        return _chunk_digest(source.read(offset, min(CONTENT_CHUNK_SIZE, end - offset)))
+
+    workers = workers or min(32, os.cpu_count() or 1)
+    if workers == 1 or len(indices) < 2:
+        return [digest_chunk(i) for i in indices]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(digest_chunk, indices))
+
+
+def content_digest(source, layout, workers=None, entry_chunks=None):
+    """The v2/v3 SHA-256 chunked digest over an APK's three signed sections.
+
+    ``entry_chunks`` are precomputed digests of the zip entries section, as
+    kept by incremental re-signing; otherwise that section is read and
+    digested in parallel.
+    """
+    if entry_chunks is None:
+        entry_chunks = chunk_digests(source, layout.block_offset, workers=workers)
+    cd = layout.central_directory
+    digests = list(entry_chunks)
+    digests.extend(_chunk_digest(cd[i:i + CONTENT_CHUNK_SIZE])
+                   for i in range(0, len(cd), CONTENT_CHUNK_SIZE))
+    digests.append(_chunk_digest(layout.eocd_for_digest()))
+    return top_level_digest(digests)
+
+
+def top_level_digest(chunk_digests):
+    return hashlib.sha256(b'\x5a' + _u32(len(chunk_digests)) + b''.join(chunk_digests)).digest()
+
+
+def _signer_block(signer, digest, scheme, schemes):
+    cert = signer.certificate
+    digests = _prefixed_seq([_u32(RSA_PKCS1_SHA256) + _prefixed(digest)])
+    certificates = _prefixed_seq([cert.der])
+    if scheme == 2:
+        # Tell v2 verifiers a v3 signature exists, so it cannot be stripped
+        attributes = _prefixed_seq([_u32(STRIPPING_PROTECTION_ATTR) + _u32(3)] if 3 in schemes else [])
+        signed_data = digests + certificates + attributes
+        sdk_range = b''
+    else:
+        sdk_range = _u32(V3_MIN_SDK) + _u32(V3_MAX_SDK)
+        signed_data = digests + certificates + sdk_range + _prefixed_seq([])
+    signatures = _prefixed_seq([_u32(RSA_PKCS1_SHA256) + _prefixed(signer.sign(signed_data))])
+    return _prefixed(signed_data) + sdk_range + signatures + _prefixed(cert.public_key)
+
+
+def signing_block(signer, digest, schemes=(2, 3)):
+    """Build an APK Signing Block holding v2 and/or v3 signatures."""
+    pairs = b''
+    for scheme in schemes:
+        block_id = V2_BLOCK_ID if scheme == 2 else V3_BLOCK_ID
+        value = _prefixed_seq([_signer_block(signer, digest, scheme, schemes)])
+        pairs += _u64(len(value) + 4) + _u32(block_id) + value
+    size = len(pairs) + 8 + len(SIGNING_BLOCK_MAGIC)
+    return _u64(size) + pairs + _u64(size) + SIGNING_BLOCK_MAGIC
+
+
+def signed_tail(signer, source, layout, schemes=(2, 3), workers=None, entry_chunks=None):
+    """Signing block, central directory and end record that follow the entries."""
+    block = signing_block(signer, content_digest(source, layout, workers, entry_chunks), schemes)
+    eocd = layout.eocd[:16] + _u32(layout.block_offset + len(block)) + layout.eocd[20:]
+    return block + layout.central_directory + eocd
+
+
+def sign_v2_v3_bytes(data, signer, schemes=(2, 3), workers=None):
+    """Return ``data`` (a v1-signed or unsigned APK) with a fresh signing block."""
+    source = ApkSource(data=data)
+    layout = ApkLayout(source)
+    tail = signed_tail(signer, source, layout, schemes, workers)
+    return bytes(source.read(0, layout.block_offset)) + tail
+
+
+def sign_v2_v3_file(path, signer, schemes=(2, 3), workers=None):
+    """Add or replace the signing block of the APK at ``path`` in place.
+
+    Only the bytes from the signing block onwards are rewritten; the zip
+    entries are left untouched on disk.
+    """
+    with open(path, 'r+b') as f:
+        source = ApkSource(fd=f.fileno())
+        layout = ApkLayout(source)
+        tail = signed_tail(signer, source, layout, schemes, workers)
+        f.seek(layout.block_offset)
+        f.write(tail)
+        f.truncate()
+
+
+def _parse_block(block):
+    pairs = {}
+    offset = 8
+    end = len(block) - 24
+    while offset < end:
+        length = int.from_bytes(block[offset:offset + 8], 'little')
+        pair_id = int.from_bytes(block[offset + 8:offset + 12], 'little')
+        pairs[pair_id] = block[offset + 12:offset + 8 + length]
+        offset += 8 + length
+    return pairs
+
+
+def verify_v2_v3(apk, workers=None):
+    """Verify the v2/v3 signatures of an APK (path or bytes).
+
+    Returns ``{scheme: Certificate}`` for each valid scheme present and
+    raises ``ValueError`` on the first invalid one.
+    """
+    if isinstance(apk, (bytes, bytearray, memoryview)):
+        return _verify(ApkSource(data=apk), workers)
+    with open(apk, 'rb') as f:
+        return _verify(ApkSource(fd=f.fileno()), workers)
+
+
+def _verify(source, workers):
+    layout = ApkLayout(source)
+    if not layout.block:
+        raise ValueError('APK has no signing block')
+    pairs = _parse_block(layout.block)
+    digest = None
+    found = {}
+    for scheme, block_id in ((2, V2_BLOCK_ID), (3, V3_BLOCK_ID)):
+        if block_id not in pairs:
+            continue
+        for signer in _read_prefixed_seq(_read_prefixed(pairs[block_id], 0)[0]):
+            signed_data, offset = _read_prefixed(signer, 0)
+            if scheme == 3:
+                offset += 8
+            signatures, offset = _read_prefixed(signer, offset)
+            public_key, _ = _read_prefixed(signer, offset)
+
+            digests, offset = _read_prefixed(signed_data, 0)
+            certificates, _ = _read_prefixed(signed_data, offset)
+            certificate = Certificate.from_der(_read_prefixed_seq(certificates)[0])
+            if certificate.public_key != public_key:
+                raise ValueError(f'v{scheme}: public key does not match certificate')
+
+            signature = _read_prefixed_seq(signatures)[0]
+            if int.from_bytes(signature[:4], 'little') != RSA_PKCS1_SHA256:
+                raise ValueError(f'v{scheme}: unsupported signature algorithm')
+            if not rsa_verify(certificate.n, certificate.e, signed_data, _read_prefixed(signature, 4)[0]):
+                raise ValueError(f'v{scheme}: signature does not verify')
+
+            if digest is None:
+                digest = content_digest(source, layout, workers)
+            expected = _read_prefixed(_read_prefixed_seq(digests)[0], 4)[0]
+            if expected != digest:
+                raise ValueError(f'v{scheme}: APK contents do not match the signed digest')
+            found[scheme] = certificate
+    if not found:
+        raise ValueError('APK signing block has no v2 or v3 signature')
+    return found
@@ -0,0 +1,311 @@
+"""Streaming APK (zip) writer with zipalign-compatible entry alignment.
+
+Android memory-maps uncompressed entries straight out of the APK, so their
+data must start on an aligned offset: 4 bytes for ordinary stored entries
+such as ``resources.arsc`` and a full page for native libraries.  Python's
+``zipfile`` cannot do that, which is why APKs written with it have to be
+re-packed by real tooling.  ``ApkWriter`` pads each local header's extra
+field the way ``zipalign`` does, streams entry data in fixed-size chunks so
+memory stays bounded whatever the APK size, and can copy already-compressed
+entries from another zip without inflating them.
+"""
+import os
+import struct
+import zipfile
+import zlib
+from collections import namedtuple
+
+from memory_guard import checkpoint
+
+CHUNK_SIZE = 1024 * 1024
+
+ALIGNMENT = 4
+PAGE_ALIGNMENT = 4096
+
+# Extra field used by zipalign to record alignment padding
+ALIGNMENT_EXTRA_ID = 0xD935
+
+# Entries that are stored rather than deflated: Android needs these mapped
+# directly, and already-compressed media does not shrink further.
+STORED_NAMES = ('resources.arsc',)
+STORED_SUFFIXES = (
+    '.so', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp3', '.ogg', '.mp4',
+    '.wav', '.zip', '.jar', '.apk',
+)
+
+# Fixed timestamp (1981-01-01 00:00) so identical input gives identical output
+DOS_TIME = 0
+DOS_DATE = (1 << 9) | (1 << 5) | 1
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+_LOCAL_SIGNATURE = 0x04034B50
+_CENTRAL_SIGNATURE = 0x02014B50
+_END_SIGNATURE = 0x06054B50
+
+# A compressed entry copied verbatim out of an existing zip
+RawEntry = namedtuple('RawEntry', 'zip_path info')
+
+
+def entry_order(name):
+    """Sort key giving the conventional APK entry order."""
+    if name == 'META-INF/MANIFEST.MF':
+        rank = 0
+    elif name.startswith('META-INF/'):
+        rank = 1
+    elif name == 'AndroidManifest.xml':
+        rank = 2
+    elif name.startswith('classes') and name.endswith('.dex') and '/' not in name:
+        # classes.dex, classes2.dex, ... in numeric order
+        number = name[len('classes'):-len('.dex')]
+        return (3, int(number) if number.isdigit() else 1, name)
+    elif name == 'resources.arsc':
+        rank = 4
+    elif name.startswith('res/'):
+        rank = 5
+    elif name.startswith('assets/'):
+        rank = 6
+    elif name.startswith('lib/'):
+        rank = 7
+    else:
+        rank = 8
+    return (rank, 0, name)
+
+
+def should_store(name):
+    return name in STORED_NAMES or name.lower().endswith(STORED_SUFFIXES)
+
+
+def alignment_for(name, alignment=ALIGNMENT, page_alignment=PAGE_ALIGNMENT):
+    return page_alignment if name.endswith('.so') else alignment
+
+
+class _Record:
+    __slots__ = ('name', 'method', 'crc', 'compress_size', 'file_size', 'offset', 'flags')
+
+
+def padding_extra(size, align=1):
+    """An alignment extra field of exactly ``size`` bytes (0 or at least 6)."""
+    if not size:
+        return b''
+    if size < 6:
+        raise ValueError('Padding extra field needs at least 6 bytes')
+    return struct.pack('<HHH', ALIGNMENT_EXTRA_ID, size - 4, align) + b'\0' * (size - 6)
+
+
+def local_header(name, method, crc, compress_size, file_size, extra=b'', flags=0):
+    """Local file header for ``name`` (bytes), followed by name and extra."""
+    return _LOCAL_HEADER.pack(
+        _LOCAL_SIGNATURE, 20, flags, method, DOS_TIME, DOS_DATE,
+        crc, compress_size, file_size, len(name), len(extra)) + name + extra
+
+
+def central_directory(records, cd_offset):
+    """Central directory and end record for ``records`` starting at ``cd_offset``.
+
+    ``records`` need ``name`` (bytes), ``flags``, ``method``, ``crc``,
+    ``compress_size``, ``file_size`` and ``offset`` attributes.
+    """
+    parts = []
+    for r in records:
+        parts.append(_CENTRAL_HEADER.pack(
+            _CENTRAL_SIGNATURE, 20, 20, r.flags, r.method, DOS_TIME, DOS_DATE,
+            r.crc, r.compress_size, r.file_size, len(r.name), 0, 0, 0, 0, 0, r.offset))
+        parts.append(r.name)
+    cd = b''.join(parts)
+    count = len(records)
+    if count > 0xFFFF:
+        raise ValueError('Too many APK entries; zip64 is not supported')
+    return cd + _END_RECORD.pack(_END_SIGNATURE, 0, 0, count, count, len(cd), cd_offset, 0)
+
+
+class ApkWriter:
+    """Write an APK entry by entry to a seekable binary file object.
+
+    Entries are written in the order they are added; use ``write_apk`` to
+    get the conventional order.  Each local header is written first with
+    zero sizes and patched once the entry's data has been streamed.
+
+    ``reserve`` pads the header of every compressed entry with that many
+    spare bytes, so the entry can later be replaced in place by a somewhat
+    larger one (see ``incremental_signing``).
+    """
+
+    def __init__(self, fileobj, alignment=ALIGNMENT, page_alignment=PAGE_ALIGNMENT,
+                 compresslevel=6, reserve=0):
+        self.fileobj = fileobj
+        self.alignment = alignment
+        self.page_alignment = page_alignment
+        self.compresslevel = compresslevel
+        self.reserve = reserve and max(reserve, 6)
+        self._records = []
+        self._names = set()
+        self._start = fileobj.tell()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+    def _tell(self):
+        return self.fileobj.tell() - self._start
+
+    def _begin(self, name, method, flags=0):
+        if name in self._names:
+            raise ValueError(f'Duplicate APK entry: {name}')
+        self._names.add(name)
+        encoded = name.encode('utf-8')
+        flags |= 0x800 if not encoded.isascii() else 0
+
+        record = _Record()
+        record.name = encoded
+        record.method = method
+        record.flags = flags
+        record.offset = self._tell()
+
+        extra = b''
+        if method == zipfile.ZIP_STORED:
+            align = alignment_for(name, self.alignment, self.page_alignment)
+            data_offset = record.offset + _LOCAL_HEADER.size + len(encoded) + 6
+            padding = (-data_offset) % align
+            extra = padding_extra(6 + padding, align)
+        elif self.reserve:
+            extra = padding_extra(self.reserve)
+
+        self.fileobj.write(local_header(encoded, method, 0, 0, 0, extra, flags))
+        return record
+
+    def _finish(self, record, crc, compress_size, file_size):
+        record.crc = crc
+        record.compress_size = compress_size
+        record.file_size = file_size
+        if self._tell() > 0xFFFFFFFF:
+            raise ValueError('APK exceeds 4 GiB; zip64 is not supported')
+        end = self.fileobj.tell()
+        self.fileobj.seek(self._start + record.offset + 14)
+        self.fileobj.write(struct.pack('<III', crc, compress_size, file_size))
+        self.fileobj.seek(end)
+        self._records.append(record)
+
+    def write_stream(self, name, stream, compress=None):
+        """Add ``name`` with data read in chunks from the binary ``stream``."""
+        if compress is None:
+            compress = not should_store(name)
+        method = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        record = self._begin(name, method)
+
+        crc = 0
+        file_size = 0
+        compress_size = 0
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -15) if compress else None
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            file_size += len(chunk)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            compress_size += len(chunk)
+            self.fileobj.write(chunk)
+        if compressor is not None:
+            chunk = compressor.flush()
+            compress_size += len(chunk)
+            self.fileobj.write(chunk)
+        self._finish(record, crc, compress_size, file_size)
+
+    def write_bytes(self, name, data, compress=None):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.write_stream(name, _BytesReader(data), compress)
+
+    def write_file(self, name, path, compress=None):
+        with open(path, 'rb') as f:
+            self.write_stream(name, f, compress)
+
+    def write_raw(self, zip_path, info, name=None):
+        """Copy an entry's compressed bytes from ``zip_path`` without inflating.
+
+        Stored entries are re-aligned; the data itself is copied verbatim.
+        """
+        name = info.filename if name is None else name
+        record = self._begin(name, info.compress_type, info.flag_bits & 0x0800)
+        with open(zip_path, 'rb') as src:
+            src.seek(info.header_offset)
+            header = _LOCAL_HEADER.unpack(src.read(_LOCAL_HEADER.size))
+            src.seek(header[9] + header[10], os.SEEK_CUR)
+            remaining = info.compress_size
+            while remaining:
+                chunk = src.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError(f'Truncated entry in {zip_path}: {info.filename}')
+                self.fileobj.write(chunk)
+                remaining -= len(chunk)
+        self._finish(record, info.CRC, info.compress_size, info.file_size)
+
+    def write_entry(self, name, source, compress=None):
+        """Add ``name`` from bytes/``str``, an ``os.PathLike`` or a ``RawEntry``."""
+        checkpoint()
+        if isinstance(source, RawEntry):
+            self.write_raw(source.zip_path, source.info, name)
+        elif isinstance(source, os.PathLike):
+            self.write_file(name, source, compress)
+        else:
+            self.write_bytes(name, source, compress)
+
+    @property
+    def records(self):
+        """Entries written so far, with their offsets, sizes and CRCs."""
+        return list(self._records)
+
+    def close(self):
+        """Write the central directory and end record."""
+        self.fileobj.write(central_directory(self._records, self._tell()))
+
+
+class _BytesReader:
+    def __init__(self, data):
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def read(self, size):
+        chunk = self._view[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+
+def write_apk(fileobj, entries, **kwargs):
+    """Write ``entries`` to ``fileobj`` in the conventional APK order.
+
+    ``entries`` maps entry names to ``bytes``/``str`` content, an
+    ``os.PathLike`` of a file to stream, or a ``RawEntry`` to copy verbatim.
+    """
+    with ApkWriter(fileobj, **kwargs) as writer:
+        for name in sorted(entries, key=entry_order):
+            writer.write_entry(name, entries[name])
+
+
+def raw_entries(zip_path):
+    """Return ``{name: RawEntry}`` for every file entry in ``zip_path``."""
+    with zipfile.ZipFile(zip_path) as zf:
+        return {
+            info.filename: RawEntry(zip_path, info)
+            for info in zf.infolist() if not info.is_dir()
+        }
+
+
+def is_aligned(zip_path, alignment=ALIGNMENT, page_alignment=PAGE_ALIGNMENT):
+    """Check stored entries the way ``zipalign -c`` does."""
+    with zipfile.ZipFile(zip_path) as zf, open(zip_path, 'rb') as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                continue
+            f.seek(info.header_offset)
+            header = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+            data_offset = info.header_offset + _LOCAL_HEADER.size + header[9] + header[10]
+            if data_offset % alignment_for(info.filename, alignment, page_alignment):
+                return False
+    return True
@@ -0,0 +1,266 @@
+"""Content-addressed store for the archives served by the build routes.
+
+``/api/build-apk``, ``/api/sign-apk`` and ``/api/prepare-for-android-studio``
+are deterministic functions of the (normalized) project and their build
+options, so each artifact is stored under ``artifact_key`` of those inputs.
+An artifact is built once and materialized as a file in ``ARTIFACT_DIR``;
+responses are then served straight from that file, which lets the WSGI
+server use ``sendfile`` and answer ``Range`` / ``If-Range`` requests
+without holding archives in memory.
+
+The store keeps at most ``ARTIFACT_CACHE_BYTES`` on disk and deletes the
+least recently used files past that budget.  The budget covers the whole
+directory, not just what this process built: it is scanned when the
+store is created and again on every miss, so files left by earlier runs
+or by other (possibly recycled) worker processes are counted, adopted
+when requested and evicted, oldest first, when nobody uses them.
+Concurrent requests for the same missing artifact build it once.
+
+Every artifact carries a strong ETag (the SHA-256 of its bytes), saved
+with its download name and type in a ``<key>.json`` file next to it.
+Keys are salted with ``ARTIFACT_FORMAT`` and a digest of the modules
+that produce artifacts (``ARTIFACT_SOURCES``), so a code change never
+serves a file built by the previous version.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+from importlib.util import find_spec
+
+ARTIFACT_CACHE_BYTES = int(os.environ.get('ARTIFACT_CACHE_BYTES', 256 * 1024 * 1024))
+ARTIFACT_DIR = os.environ.get('ARTIFACT_DIR', os.path.join('data', 'artifacts'))
+
+# Cache-Control max-age of artifact responses, in seconds
+ARTIFACT_MAX_AGE = int(os.environ.get('ARTIFACT_MAX_AGE', 3600))
+
+# Bump when the layout of stored artifacts changes
+ARTIFACT_FORMAT = 2
+
+# Modules whose code determines artifact bytes
+ARTIFACT_SOURCES = (
+    'apk_signing', 'apk_writer', 'axml', 'demo_templates', 'file_roles', 'github_import',
+    'incremental_signing', 'project_assembly', 'resource_table', 'server',
+)
+
+Artifact = namedtuple('Artifact', 'key path etag size download_name mimetype')
+
+_HASH_CHUNK = 1024 * 1024
+_META = '.json'
+_TMP = '.tmp-'
+
+
+def code_version(modules=ARTIFACT_SOURCES):
+    """Digest of the source files of ``modules`` (without importing them)."""
+    h = hashlib.sha256()
+    for name in modules:
+        spec = find_spec(name)
+        if spec is not None and spec.origin and os.path.isfile(spec.origin):
+            with open(spec.origin, 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+CODE_VERSION = code_version()
+
+
+def artifact_key(kind, **inputs):
+    """Digest of an artifact kind, the code version and everything its bytes depend on."""
+    canonical = json.dumps(inputs, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    salt = f'{ARTIFACT_FORMAT}.{CODE_VERSION}'
+    return hashlib.sha256(f'{salt}\0{kind}\0{canonical}'.encode('utf-8')).hexdigest()
+
+
+def _file_etag(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    """Thread-safe LRU of on-disk artifacts bounded by their total size."""
+
+    def __init__(self, directory=ARTIFACT_DIR, max_bytes=ARTIFACT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+        with self._lock:
+            self._scan()
+            self._evict()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key)
+
+    def _scan(self):
+        """Sync the index with the directory; call with the lock held.
+
+        Files this process has not seen are indexed oldest first, ahead of
+        everything it used, with their metadata read when first requested.
+        """
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.is_file() and not entry.name.startswith(_TMP) and not entry.name.endswith(_META)]
+        except FileNotFoundError:
+            entries = []
+        on_disk = {entry.name for entry in entries}
+        for key in [key for key in self._data if key not in on_disk]:
+            self.bytes -= self._data.pop(key).size
+        found = []
+        for entry in entries:
+            if entry.name not in self._data:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, Artifact(entry.name, entry.path, None, stat.st_size, None, None)))
+        for _, artifact in sorted(found, reverse=True):
+            self._data[artifact.key] = artifact
+            self._data.move_to_end(artifact.key, last=False)
+            self.bytes += artifact.size
+
+    def _adopt(self, key):
+        """Artifact for a file materialized by another process (or run)."""
+        path = self.path_for(key)
+        try:
+            with open(path + _META) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        etag = meta.get('etag') or _file_etag(path)
+        return Artifact(key, path, etag, os.path.getsize(path),
+                        meta.get('download_name') or key, meta.get('mimetype') or 'application/octet-stream')
+
+    def get(self, key):
+        with self._lock:
+            artifact = self._data.get(key)
+            if artifact is None or artifact.etag is not None:
+                if artifact is not None:
+                    self._data.move_to_end(key)
+                return artifact
+        try:
+            artifact = self._adopt(key)
+        except FileNotFoundError:
+            self.discard(key)
+            return None
+        with self._lock:
+            self._index(artifact)
+        return artifact
+
+    def _remove(self, artifact):
+        for path in (artifact.path, artifact.path + _META):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self._data) > 1:
+            _, evicted = self._data.popitem(last=False)
+            self.bytes -= evicted.size
+            self.evictions += 1
+            self._remove(evicted)
+
+    def _index(self, artifact):
+        if artifact.key in self._data:
+            self.bytes -= self._data.pop(artifact.key).size
+        self._data[artifact.key] = artifact
+        self.bytes += artifact.size
+        self._evict()
+
+    def _write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=_TMP)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def _materialize(self, key, data, meta):
+        os.makedirs(self.directory, exist_ok=True)
+        # Metadata first: a visible artifact file always has its metadata
+        self._write(self.path_for(key) + _META, json.dumps(meta).encode('utf-8'))
+        self._write(self.path_for(key), data)
+
+    def get_or_build(self, key, build, download_name=None, mimetype='application/octet-stream'):
+        """Return ``(artifact, hit)``, calling ``build()`` for bytes on a miss."""
+        while True:
+            with self._lock:
+                artifact = self._data.get(key)
+                if artifact is not None and artifact.etag is not None:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return artifact, True
+                pending = self._building.get(key)
+                if pending is None:
+                    pending = self._building[key] = threading.Event()
+                    break
+            # Another request is building the same artifact; wait and retry
+            pending.wait()
+
+        try:
+            path = self.path_for(key)
+            hit = os.path.exists(path)
+            if hit:
+                artifact = self._adopt(key)._replace(download_name=download_name or key, mimetype=mimetype)
+            else:
+                data = build()
+                artifact = Artifact(key, path, hashlib.sha256(data).hexdigest(), len(data),
+                                    download_name or key, mimetype)
+                self._materialize(key, data, {
+                    'etag': artifact.etag, 'download_name': artifact.download_name, 'mimetype': mimetype})
+            with self._lock:
+                if hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    # Count what other processes wrote since the last look
+                    self._scan()
+                self._index(artifact)
+            return artifact, hit
+        finally:
+            with self._lock:
+                del self._building[key]
+            pending.set()
+
+    def discard(self, key):
+        """Forget ``key``, e.g. after its file was removed by another process."""
+        with self._lock:
+            artifact = self._data.pop(key, None)
+            if artifact is not None:
+                self.bytes -= artifact.size
+
+    def clear(self):
+        with self._lock:
+            for artifact in self._data.values():
+                self._remove(artifact)
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'directory': self.directory,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+artifacts = ArtifactCache()
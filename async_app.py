@@ -0,0 +1,231 @@
+"""ASGI application serving the I/O-bound routes on an event loop.
+
+    uvicorn async_app:app --workers 4      # or: python serve.py --server uvicorn
+
+``/api/test-gemini``, ``/api/generate-android-code``,
+``/api/regenerate-files`` and ``/api/import-from-github`` spend nearly
+all their time waiting on Gemini or GitHub.  Here the shared ``handlers``
+run as coroutines using ``async_http``, so a waiting request costs a
+socket and a small task instead of an OS thread.  The CPU-bound part of
+an import (unpacking the archive and writing the project zip) runs in a
+process pool so it never stalls the loop.
+
+Every other request is passed to the Flask ``server.app`` through a WSGI
+adapter that runs it on a thread pool, streaming its response body, so
+the whole API is served from one ASGI application.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+import async_http
+import handlers
+import metrics
+import rate_limits
+import server
+
+# Processes for CPU-bound archive work, threads for the Flask fallback
+PROCESS_WORKERS = int(os.environ.get('ASYNC_PROCESS_WORKERS', os.cpu_count() or 1))
+WSGI_THREADS = int(os.environ.get('ASYNC_WSGI_THREADS', 32))
+
+_processes = None
+_threads = None
+
+
+def process_pool():
+    global _processes
+    if _processes is None:
+        # Not fork: the parent has running threads and an event loop
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _processes = ProcessPoolExecutor(PROCESS_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _processes
+
+
+def thread_pool():
+    global _threads
+    if _threads is None:
+        _threads = ThreadPoolExecutor(WSGI_THREADS, thread_name_prefix='wsgi')
+    return _threads
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def send_response(send, status, body, headers):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def cors_headers(scope):
+    """Mirror Flask-CORS' default, allow-all policy of ``server.app``."""
+    if any(name == b'origin' for name, _ in scope['headers']):
+        return [('Access-Control-Allow-Origin', '*')]
+    return []
+
+
+async def send_json(scope, send, data, status=200, headers=()):
+    body = json.dumps(data).encode('utf-8')
+    await send_response(send, status, body, [
+        ('Content-Type', 'application/json'),
+        ('Content-Length', str(len(body))),
+    ] + cors_headers(scope) + list(headers))
+
+
+async def send_artifact(scope, send, key):
+    """Serve a stored artifact through Flask's ``/api/artifacts/<key>``.
+
+    That route answers Range, If-Range and If-None-Match, so downloads
+    from this app resume like the Flask ones.
+    """
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    await call_wsgi(server.app, dict(scope, method='GET', path=f'/api/artifacts/{key}', query_string=b''),
+                    receive, send)
+
+
+def shared_route(route):
+    """ASGI handler running the shared ``handlers`` generator ``route``."""
+    async def handle(scope, send, data):
+        result = await handlers.arun(route(data), process_pool(), scope['path'])
+        if isinstance(result, handlers.Attachment):
+            return await send_artifact(scope, send, result.artifact.key)
+        await send_json(scope, send, result, headers=rate_limits.current_headers().items())
+    return handle
+
+
+ROUTES = {
+    '/api/test-gemini': shared_route(handlers.test_gemini),
+    '/api/generate-android-code': shared_route(handlers.generate_android_code),
+    '/api/regenerate-files': shared_route(handlers.regenerate_files),
+    '/api/import-from-github': shared_route(handlers.import_from_github),
+}
+
+
+def wsgi_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body)),
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ[name] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def call_wsgi(wsgi_app, scope, receive, send):
+    """Run a WSGI app on the thread pool, streaming its body to ``send``."""
+    body = await read_body(receive)
+    loop = asyncio.get_running_loop()
+    pool = thread_pool()
+    started = {}
+    written = []
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+        return written.append
+
+    iterable = await loop.run_in_executor(pool, wsgi_app, wsgi_environ(scope, body), start_response)
+    try:
+        chunks = iter(iterable)
+        chunk = await loop.run_in_executor(pool, next, chunks, None)
+        await send({
+            'type': 'http.response.start',
+            'status': started['status'],
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in started['headers']],
+        })
+        if written:
+            await send({'type': 'http.response.body', 'body': b''.join(written), 'more_body': True})
+        while chunk is not None:
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            chunk = await loop.run_in_executor(pool, next, chunks, None)
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            await loop.run_in_executor(pool, close)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_http.close()
+            if _processes is not None:
+                _processes.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    handler = ROUTES.get(scope['path'])
+    if handler is None or scope['method'] != 'POST':
+        # Flask records its own request metrics
+        return await call_wsgi(server.app, scope, receive, send)
+
+    start = time.perf_counter()
+    status = 500
+    metrics.http_in_flight.inc()
+
+    async def send_recording(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        await send(message)
+
+    try:
+        try:
+            data = json.loads(await read_body(receive) or b'null')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return await send_json(scope, send_recording, {'status': 'error', 'message': 'JSON body required'}, 400)
+        rate_limits.reset_current()
+        await handler(scope, send_recording, data)
+    finally:
+        metrics.http_in_flight.dec()
+        metrics.http_requests.inc((scope['path'], 'POST', str(status)))
+        metrics.http_latency.observe(time.perf_counter() - start, (scope['path'], 'POST'))
@@ -0,0 +1,89 @@
+"""Small async HTTP client for the asyncio routes in ``async_app``.
+
+With aiohttp installed, requests share one pooled ``ClientSession`` per
+event loop, so thousands of slow upstream calls cost sockets rather than
+threads.  Without it, each request runs ``requests`` in the loop's
+default executor: still correct, but bounded by that executor's threads.
+"""
+import asyncio
+import json as jsonlib
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Connections per session; aiohttp's default of 100 is low for long-polling
+CONNECTION_LIMIT = 1000
+READ_CHUNK = 1024 * 1024
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+class Response:
+    def __init__(self, status_code, content, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return jsonlib.loads(self.content)
+
+
+_sessions = {}
+
+
+def _session():
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _sessions[loop] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=CONNECTION_LIMIT))
+    return session
+
+
+def _check_size(size, max_bytes):
+    if max_bytes is not None and size > max_bytes:
+        raise ResponseTooLarge(f'response body exceeds {max_bytes} bytes')
+
+
+def _blocking_request(method, url, json, headers, timeout, max_bytes):
+    response = requests.request(method, url, json=json, headers=headers, timeout=timeout, stream=True)
+    chunks, size = [], 0
+    for chunk in response.iter_content(chunk_size=READ_CHUNK):
+        size += len(chunk)
+        _check_size(size, max_bytes)
+        chunks.append(chunk)
+    return Response(response.status_code, b''.join(chunks), dict(response.headers))
+
+
+async def request(method, url, json=None, headers=None, timeout=30, max_bytes=None):
+    """Send a request and return a ``Response`` with the whole body read.
+
+    Raises ``ResponseTooLarge`` as soon as the body exceeds ``max_bytes``.
+    """
+    if aiohttp is None:
+        return await asyncio.to_thread(_blocking_request, method, url, json, headers, timeout, max_bytes)
+    async with _session().request(method, url, json=json, headers=headers,
+                                  timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        chunks, size = [], 0
+        async for chunk in response.content.iter_chunked(READ_CHUNK):
+            size += len(chunk)
+            _check_size(size, max_bytes)
+            chunks.append(chunk)
+        return Response(response.status, b''.join(chunks), dict(response.headers))
+
+
+async def close():
+    """Close the session of the running loop (on application shutdown)."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
@@ -0,0 +1,674 @@
+"""Binary XML (AXML) encoder for AndroidManifest.xml and layout files.
+
+Android only reads XML resources in the compiled chunk format that aapt2
+produces: a string pool, a resource map giving the framework attribute ID
+of each attribute name, then a flat stream of namespace, element and text
+nodes with typed attribute values.  ``encode_xml`` produces that format
+from source XML using expat, so an APK can be assembled without aapt2.
+
+Attribute values are typed with the format of the framework attribute
+(``FRAMEWORK_ATTRS``); references such as ``@string/app_name`` are
+resolved against the ``resources`` map (``'type/name' -> id``) produced by
+the resource table compiler.  Attributes the table does not know are kept
+as strings, as aapt2 does for attributes of unknown libraries.
+
+``encode_batch`` encodes a project's manifest and layouts, in a process
+pool for large batches, with results cached by content hash.  The pool is
+started on the first large batch and reused by every later one, so a
+request does not pay for starting processes.
+"""
+import hashlib
+import multiprocessing
+import os
+import re
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from xml.parsers import expat
+
+from caching import LRUCache
+
+ANDROID_NS = 'http://schemas.android.com/apk/res/android'
+# Design-time attributes, dropped from compiled output as aapt2 does
+TOOLS_NS = 'http://schemas.android.com/tools'
+
+# Chunk types (ResourceTypes.h)
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_TYPE = 0x0003
+RES_XML_START_NAMESPACE_TYPE = 0x0100
+RES_XML_END_NAMESPACE_TYPE = 0x0101
+RES_XML_START_ELEMENT_TYPE = 0x0102
+RES_XML_END_ELEMENT_TYPE = 0x0103
+RES_XML_CDATA_TYPE = 0x0104
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+
+UTF8_FLAG = 1 << 8
+NO_INDEX = 0xFFFFFFFF
+
+# Res_value data types
+TYPE_NULL = 0x00
+TYPE_REFERENCE = 0x01
+TYPE_ATTRIBUTE = 0x02
+TYPE_STRING = 0x03
+TYPE_FLOAT = 0x04
+TYPE_DIMENSION = 0x05
+TYPE_FRACTION = 0x06
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+TYPE_INT_BOOLEAN = 0x12
+TYPE_INT_COLOR_ARGB8 = 0x1C
+TYPE_INT_COLOR_RGB8 = 0x1D
+TYPE_INT_COLOR_ARGB4 = 0x1E
+TYPE_INT_COLOR_RGB4 = 0x1F
+
+DIMENSION_UNITS = {'px': 0, 'dp': 1, 'dip': 1, 'sp': 2, 'pt': 3, 'in': 4, 'mm': 5}
+FRACTION_UNITS = {'%': 0, '%p': 1}
+
+# Symbolic values of framework enum and flag attributes
+_GRAVITY = {
+    'top': 0x30, 'bottom': 0x50, 'left': 0x03, 'right': 0x05,
+    'center_vertical': 0x10, 'fill_vertical': 0x70, 'center_horizontal': 0x01,
+    'fill_horizontal': 0x07, 'center': 0x11, 'fill': 0x77, 'clip_vertical': 0x80,
+    'clip_horizontal': 0x08, 'start': 0x00800003, 'end': 0x00800005,
+}
+_LAYOUT_SIZE = {'match_parent': -1, 'fill_parent': -1, 'wrap_content': -2}
+ENUMS = {
+    'layout_size': _LAYOUT_SIZE,
+    'orientation': {'horizontal': 0, 'vertical': 1},
+    'visibility': {'visible': 0, 'invisible': 1, 'gone': 2},
+    'scaleType': {
+        'matrix': 0, 'fitXY': 1, 'fitStart': 2, 'fitCenter': 3, 'fitEnd': 4,
+        'center': 5, 'centerCrop': 6, 'centerInside': 7,
+    },
+    'screenOrientation': {
+        'unspecified': -1, 'landscape': 0, 'portrait': 1, 'user': 2, 'behind': 3,
+        'sensor': 4, 'nosensor': 5, 'sensorLandscape': 6, 'sensorPortrait': 7,
+        'reverseLandscape': 8, 'reversePortrait': 9, 'fullSensor': 10,
+        'userLandscape': 11, 'userPortrait': 12, 'fullUser': 13, 'locked': 14,
+    },
+    'launchMode': {'standard': 0, 'singleTop': 1, 'singleTask': 2, 'singleInstance': 3},
+    'installLocation': {'auto': 0, 'internalOnly': 1, 'preferExternal': 2},
+}
+FLAGS = {
+    'gravity': _GRAVITY,
+    'textStyle': {'normal': 0, 'bold': 1, 'italic': 2},
+    'inputType': {
+        'none': 0x0, 'text': 0x1, 'textCapCharacters': 0x1001, 'textCapWords': 0x2001,
+        'textCapSentences': 0x4001, 'textAutoCorrect': 0x8001, 'textMultiLine': 0x20001,
+        'textUri': 0x11, 'textEmailAddress': 0x21, 'textPersonName': 0x61,
+        'textPassword': 0x81, 'textVisiblePassword': 0x91, 'number': 0x2,
+        'numberSigned': 0x1002, 'numberDecimal': 0x2002, 'numberPassword': 0x12,
+        'phone': 0x3, 'datetime': 0x4, 'date': 0x14, 'time': 0x24,
+    },
+    'protectionLevel': {'normal': 0, 'dangerous': 1, 'signature': 2, 'signatureOrSystem': 3},
+    'windowSoftInputMode': {
+        'stateUnspecified': 0x0, 'stateUnchanged': 0x1, 'stateHidden': 0x2,
+        'stateAlwaysHidden': 0x3, 'stateVisible': 0x4, 'stateAlwaysVisible': 0x5,
+        'adjustUnspecified': 0x00, 'adjustResize': 0x10, 'adjustPan': 0x20, 'adjustNothing': 0x30,
+    },
+    'configChanges': {
+        'mcc': 0x1, 'mnc': 0x2, 'locale': 0x4, 'touchscreen': 0x8, 'keyboard': 0x10,
+        'keyboardHidden': 0x20, 'navigation': 0x40, 'orientation': 0x80,
+        'screenLayout': 0x100, 'uiMode': 0x200, 'screenSize': 0x400,
+        'smallestScreenSize': 0x800, 'density': 0x1000, 'layoutDirection': 0x2000,
+        'fontScale': 0x40000000,
+    },
+}
+
+# android: attribute name -> (resource ID, format).  Formats follow
+# attrs.xml: a '|' separated list of string, boolean, integer, float,
+# dimension, color, reference, and enum:<table> / flags:<table>.
+FRAMEWORK_ATTRS = {
+    # manifest
+    'theme': (0x01010000, 'reference'),
+    'label': (0x01010001, 'reference|string'),
+    'icon': (0x01010002, 'reference'),
+    'name': (0x01010003, 'string'),
+    'permission': (0x01010006, 'string'),
+    'protectionLevel': (0x01010009, 'flags:protectionLevel'),
+    'enabled': (0x0101000E, 'boolean'),
+    'debuggable': (0x0101000F, 'boolean'),
+    'exported': (0x01010010, 'boolean'),
+    'process': (0x01010011, 'string'),
+    'taskAffinity': (0x01010012, 'string'),
+    'authorities': (0x01010018, 'string'),
+    'grantUriPermissions': (0x0101001B, 'boolean'),
+    'priority': (0x0101001C, 'integer'),
+    'launchMode': (0x0101001D, 'enum:launchMode'),
+    'screenOrientation': (0x0101001E, 'enum:screenOrientation'),
+    'configChanges': (0x0101001F, 'flags:configChanges'),
+    'description': (0x01010020, 'reference|string'),
+    'value': (0x01010024, 'string|integer|color|float|boolean|dimension'),
+    'resource': (0x01010025, 'reference'),
+    'mimeType': (0x01010026, 'string'),
+    'scheme': (0x01010027, 'string'),
+    'host': (0x01010028, 'string'),
+    'port': (0x01010029, 'string'),
+    'path': (0x0101002A, 'string'),
+    'pathPrefix': (0x0101002B, 'string'),
+    'pathPattern': (0x0101002C, 'string'),
+    'minSdkVersion': (0x0101020C, 'integer|string'),
+    'versionCode': (0x0101021B, 'integer'),
+    'versionName': (0x0101021C, 'string'),
+    'windowSoftInputMode': (0x0101022B, 'flags:windowSoftInputMode'),
+    'targetSdkVersion': (0x01010270, 'integer|string'),
+    'maxSdkVersion': (0x01010271, 'integer'),
+    'allowBackup': (0x01010280, 'boolean'),
+    'required': (0x0101028E, 'boolean'),
+    'installLocation': (0x010102B7, 'enum:installLocation'),
+    'hardwareAccelerated': (0x010102D3, 'boolean'),
+    'largeHeap': (0x0101035A, 'boolean'),
+    'parentActivityName': (0x010103A7, 'string'),
+    'supportsRtl': (0x010103AF, 'boolean'),
+    'usesCleartextTraffic': (0x010104EC, 'boolean'),
+    'roundIcon': (0x0101052C, 'reference'),
+    'compileSdkVersion': (0x01010572, 'integer'),
+    'compileSdkVersionCodename': (0x01010573, 'string'),
+    # views and layouts
+    'textSize': (0x01010095, 'dimension'),
+    'textStyle': (0x01010097, 'flags:textStyle'),
+    'textColor': (0x01010098, 'reference|color'),
+    'gravity': (0x010100AF, 'flags:gravity'),
+    'layout_gravity': (0x010100B3, 'flags:gravity'),
+    'orientation': (0x010100C4, 'enum:orientation'),
+    'id': (0x010100D0, 'reference'),
+    'background': (0x010100D4, 'reference|color'),
+    'padding': (0x010100D5, 'dimension'),
+    'paddingLeft': (0x010100D6, 'dimension'),
+    'paddingTop': (0x010100D7, 'dimension'),
+    'paddingRight': (0x010100D8, 'dimension'),
+    'paddingBottom': (0x010100D9, 'dimension'),
+    'visibility': (0x010100DC, 'enum:visibility'),
+    'layout_width': (0x010100F4, 'dimension|enum:layout_size'),
+    'layout_height': (0x010100F5, 'dimension|enum:layout_size'),
+    'layout_margin': (0x010100F6, 'dimension'),
+    'layout_marginLeft': (0x010100F7, 'dimension'),
+    'layout_marginTop': (0x010100F8, 'dimension'),
+    'layout_marginRight': (0x010100F9, 'dimension'),
+    'layout_marginBottom': (0x010100FA, 'dimension'),
+    'src': (0x01010119, 'reference|color'),
+    'scaleType': (0x0101011D, 'enum:scaleType'),
+    'text': (0x0101014F, 'string'),
+    'hint': (0x01010150, 'string'),
+    'layout_weight': (0x01010181, 'float'),
+    'inputType': (0x01010220, 'flags:inputType'),
+    'onClick': (0x0101026F, 'string'),
+    'contentDescription': (0x01010273, 'string'),
+    'paddingStart': (0x010103B3, 'dimension'),
+    'paddingEnd': (0x010103B4, 'dimension'),
+    'layout_marginStart': (0x010103B5, 'dimension'),
+    'layout_marginEnd': (0x010103B6, 'dimension'),
+    'fontFamily': (0x010103AC, 'string'),
+    # themes
+    'textColorPrimary': (0x01010036, 'reference|color'),
+    'textColorSecondary': (0x01010038, 'reference|color'),
+    'colorBackground': (0x01010031, 'reference|color'),
+    'windowBackground': (0x01010054, 'reference|color'),
+    'windowNoTitle': (0x01010056, 'boolean'),
+    'windowActionBar': (0x010102CD, 'boolean'),
+    'colorControlNormal': (0x01010429, 'reference|color'),
+    'colorControlActivated': (0x0101042A, 'reference|color'),
+    'colorPrimary': (0x01010433, 'reference|color'),
+    'colorPrimaryDark': (0x01010434, 'reference|color'),
+    'colorAccent': (0x01010435, 'reference|color'),
+    'statusBarColor': (0x01010451, 'reference|color'),
+    'navigationBarColor': (0x01010452, 'reference|color'),
+    'windowLightStatusBar': (0x010104E0, 'boolean'),
+}
+
+# Framework resources that may be referenced as @android:type/name
+FRAMEWORK_RESOURCES = {
+    'color/white': 0x0106000B,
+    'color/black': 0x0106000C,
+    'color/transparent': 0x0106000D,
+    'drawable/sym_def_app_icon': 0x01080093,
+    'mipmap/sym_def_app_icon': 0x010D0000,
+    'style/Theme.Material': 0x01030224,
+    'style/Theme.Material.NoActionBar': 0x0103022E,
+    'style/Theme.Material.Light': 0x01030237,
+    'style/Theme.Material.Light.DarkActionBar': 0x01030238,
+    'style/Theme.Material.Light.NoActionBar': 0x01030241,
+}
+FRAMEWORK_ATTR_IDS = {name: attr[0] for name, attr in FRAMEWORK_ATTRS.items()}
+
+# Number of uncached files from which a batch is encoded in worker processes
+PARALLEL_THRESHOLD = 64
+ENCODE_WORKERS = int(os.environ.get('AXML_WORKERS', os.cpu_count() or 1))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def process_pool(workers=None):
+    """The shared encoding pool of this process, started on first use."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A pool inherited through fork (serve.py --preload) has no workers here
+        if _pool is None or _pool_pid != os.getpid():
+            # Not fork: the server has running threads
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(workers or ENCODE_WORKERS, mp_context=multiprocessing.get_context(method))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+CACHE_SIZE = 1024
+
+_REFERENCE = re.compile(r'^([@?])(\+?)(?:([\w.]+):)?(?:(\w+)/)?([\w.]+)$')
+_NUMBER = re.compile(r'^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$')
+_DIMENSION = re.compile(r'^([-+]?(?:\d+\.?\d*|\.\d+))\s*(px|dp|dip|sp|pt|in|mm|%p|%)$')
+_COLOR = re.compile(r'^#([0-9a-fA-F]{3,4}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})$')
+
+_encoded = LRUCache(CACHE_SIZE)
+
+
+def _chunk(chunk_type, header, body):
+    header_size = 8 + len(header)
+    return struct.pack('<HHI', chunk_type, header_size, header_size + len(body)) + header + body
+
+
+def _pad4(data):
+    return data + b'\0' * (-len(data) % 4)
+
+
+def _length_utf16(n):
+    if n > 0x7FFF:
+        return struct.pack('<HH', 0x8000 | (n >> 16), n & 0xFFFF)
+    return struct.pack('<H', n)
+
+
+def _length_utf8(n):
+    if n > 0x7F:
+        return bytes((0x80 | (n >> 8), n & 0xFF))
+    return bytes((n,))
+
+
+def encode_string_pool(strings, utf8=False):
+    """A ResStringPool chunk holding ``strings`` in order (no styles)."""
+    offsets = []
+    data = bytearray()
+    for string in strings:
+        offsets.append(len(data))
+        if utf8:
+            encoded = string.encode('utf-8')
+            data += _length_utf8(len(string.encode('utf-16-le')) // 2)
+            data += _length_utf8(len(encoded)) + encoded + b'\0'
+        else:
+            encoded = string.encode('utf-16-le')
+            data += _length_utf16(len(encoded) // 2) + encoded + b'\0\0'
+    data = _pad4(bytes(data))
+    strings_start = 28 + 4 * len(offsets)
+    header = struct.pack('<IIIII', len(offsets), 0, UTF8_FLAG if utf8 else 0,
+                         strings_start if offsets else 0, 0)
+    return _chunk(RES_STRING_POOL_TYPE, header, struct.pack(f'<{len(offsets)}I', *offsets) + data)
+
+
+class StringPool:
+    """Deduplicating string pool; strings keep the order they were added in."""
+
+    def __init__(self):
+        self.strings = []
+        self._index = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def add(self, string, key=None):
+        key = string if key is None else key
+        index = self._index.get(key)
+        if index is None:
+            index = self._index[key] = len(self.strings)
+            self.strings.append(string)
+        return index
+
+    def encode(self, utf8=False):
+        return encode_string_pool(self.strings, utf8)
+
+
+def complex_value(value, unit):
+    """Encode ``value`` in Android's fixed-point complex format (aapt's rounding)."""
+    negative = value < 0
+    bits = int(abs(value) * (1 << 23) + 0.5)
+    if bits & 0x7FFFFF == 0:
+        radix, shift = 0, 23
+    elif bits & ~0x7FFFFF == 0:
+        radix, shift = 3, 0
+    elif bits & ~0x7FFFFFFF == 0:
+        radix, shift = 2, 8
+    elif bits & ~0x7FFFFFFFFF == 0:
+        radix, shift = 1, 16
+    else:
+        radix, shift = 0, 23
+    mantissa = (bits >> shift) & 0xFFFFFF
+    if negative:
+        mantissa = -mantissa & 0xFFFFFF
+    return (mantissa << 8) | (radix << 4) | unit
+
+
+def _float_bits(value):
+    return struct.unpack('<I', struct.pack('<f', value))[0]
+
+
+def _color(text):
+    digits = text[1:]
+    if len(digits) == 3:
+        return TYPE_INT_COLOR_RGB4, int('ff' + ''.join(c * 2 for c in digits), 16)
+    if len(digits) == 4:
+        return TYPE_INT_COLOR_ARGB4, int(''.join(c * 2 for c in digits), 16)
+    if len(digits) == 6:
+        return TYPE_INT_COLOR_RGB8, int('ff' + digits, 16)
+    return TYPE_INT_COLOR_ARGB8, int(digits, 16)
+
+
+def resolve_reference(text, resources=None):
+    """Resolve ``@type/name``, ``@android:type/name`` or ``?attr`` to ``(type, id)``.
+
+    Returns ``None`` if ``text`` is not a reference and raises ``ValueError``
+    if it is one that cannot be resolved.
+    """
+    if text == '@null':
+        return TYPE_REFERENCE, 0
+    match = _REFERENCE.match(text)
+    if match is None:
+        return None
+    sigil, create, package, res_type, name = match.groups()
+    if sigil == '?':
+        res_type = res_type or 'attr'
+    elif res_type is None:
+        return None
+    key = f'{res_type}/{name}'
+    if package == 'android':
+        ids = FRAMEWORK_ATTR_IDS if res_type == 'attr' else FRAMEWORK_RESOURCES
+        resource_id = ids.get(name if res_type == 'attr' else key)
+    else:
+        resource_id = (resources or {}).get(key)
+    if resource_id is None:
+        raise ValueError(f'Unresolved resource reference: {text}')
+    return (TYPE_ATTRIBUTE if sigil == '?' else TYPE_REFERENCE), resource_id
+
+
+def compile_value(text, fmt='string', resources=None):
+    """Type ``text`` for an attribute of format ``fmt``: ``(data_type, data)``.
+
+    Returns ``(TYPE_STRING, None)`` when the value stays a string.
+    """
+    reference = resolve_reference(text, resources) if text[:1] in '@?' else None
+    if reference is not None:
+        return reference
+    value = text.strip()
+    for kind in fmt.split('|'):
+        kind, _, table = kind.partition(':')
+        if kind == 'boolean' and value in ('true', 'false'):
+            return TYPE_INT_BOOLEAN, 0xFFFFFFFF if value == 'true' else 0
+        if kind == 'color' and _COLOR.match(value):
+            return _color(value)
+        if kind == 'integer':
+            try:
+                if value.lower().startswith(('0x', '-0x')):
+                    return TYPE_INT_HEX, int(value, 16) & 0xFFFFFFFF
+                return TYPE_INT_DEC, int(value) & 0xFFFFFFFF
+            except ValueError:
+                pass
+        if kind == 'float' and _NUMBER.match(value):
+            return TYPE_FLOAT, _float_bits(float(value))
+        if kind == 'dimension':
+            match = _DIMENSION.match(value)
+            if match:
+                number, unit = float(match.group(1)), match.group(2)
+                if unit in FRACTION_UNITS:
+                    return TYPE_FRACTION, complex_value(number / 100, FRACTION_UNITS[unit])
+                return TYPE_DIMENSION, complex_value(number, DIMENSION_UNITS[unit])
+        if kind == 'enum' and value in ENUMS[table]:
+            return TYPE_INT_DEC, ENUMS[table][value] & 0xFFFFFFFF
+        if kind == 'flags':
+            names = [flag.strip() for flag in value.split('|')]
+            if all(flag in FLAGS[table] for flag in names):
+                data = 0
+                for flag in names:
+                    data |= FLAGS[table][flag]
+                return TYPE_INT_HEX, data
+        if kind == 'string':
+            return TYPE_STRING, None
+    if fmt == 'reference':
+        raise ValueError(f'Expected a resource reference, got {text!r}')
+    return TYPE_STRING, None
+
+
+class _Collector:
+    """Expat handlers that record the XML as a flat list of nodes."""
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.nodes = []
+        self.pending_ns = []
+        self.ns_stack = []
+        self.text = []
+        self.text_line = 0
+
+    def _flush_text(self):
+        text = ''.join(self.text)
+        self.text = []
+        if text.strip():
+            self.nodes.append(('text', self.text_line, text))
+
+    def start_namespace(self, prefix, uri):
+        self._flush_text()
+        self.pending_ns.append((prefix or '', uri))
+        self.nodes.append(('start_ns', self.parser.CurrentLineNumber, prefix or '', uri))
+
+    def end_namespace(self, prefix):
+        self._flush_text()
+        uri = next(uri for p, uri in reversed(self.ns_stack) if p == (prefix or ''))
+        self.ns_stack.remove((prefix or '', uri))
+        self.nodes.append(('end_ns', self.parser.CurrentLineNumber, prefix or '', uri))
+
+    def start_element(self, name, attributes):
+        self._flush_text()
+        self.ns_stack.extend(self.pending_ns)
+        self.pending_ns = []
+        pairs = [(attributes[i], attributes[i + 1]) for i in range(0, len(attributes), 2)]
+        self.nodes.append(('start', self.parser.CurrentLineNumber, _split(name), pairs))
+
+    def end_element(self, name):
+        self._flush_text()
+        self.nodes.append(('end', self.parser.CurrentLineNumber, _split(name)))
+
+    def character_data(self, data):
+        if not self.text:
+            self.text_line = self.parser.CurrentLineNumber
+        self.text.append(data)
+
+
+def _split(name):
+    uri, _, local = name.rpartition(' ')
+    return uri, local
+
+
+def _parse(data):
+    parser = expat.ParserCreate(namespace_separator=' ')
+    parser.ordered_attributes = True
+    collector = _Collector(parser)
+    parser.StartNamespaceDeclHandler = collector.start_namespace
+    parser.EndNamespaceDeclHandler = collector.end_namespace
+    parser.StartElementHandler = collector.start_element
+    parser.EndElementHandler = collector.end_element
+    parser.CharacterDataHandler = collector.character_data
+    parser.Parse(data, True)
+    return collector.nodes
+
+
+def _typed_attribute(uri, name, value, resources):
+    """``(resource_id or None, data_type, data)`` for one attribute."""
+    if uri == ANDROID_NS:
+        attr = FRAMEWORK_ATTRS.get(name)
+        if attr is not None:
+            data_type, data = compile_value(value, attr[1], resources)
+            return attr[0], data_type, data
+    if value[:1] in '@?':
+        try:
+            reference = resolve_reference(value, resources)
+        except ValueError:
+            reference = None
+        if reference is not None:
+            return None, reference[0], reference[1]
+    return None, TYPE_STRING, None
+
+
+def encode_xml(data, resources=None):
+    """Compile source XML (bytes or str) into binary AXML bytes.
+
+    ``resources`` maps ``'type/name'`` to the app's resource IDs; ``@+id``
+    references look up ``'id/name'``.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    nodes = _parse(data)
+
+    # Type attribute values first: attribute names with resource IDs must
+    # lead the string pool, in the same order as the resource map
+    typed = []
+    ids = {}
+    for node in nodes:
+        if node[0] != 'start':
+            continue
+        attributes = []
+        for qualified, value in node[3]:
+            uri, name = _split(qualified)
+            if uri == TOOLS_NS:
+                continue
+            resource_id, data_type, value_data = _typed_attribute(uri, name, value, resources)
+            if resource_id is not None:
+                ids[(name, resource_id)] = resource_id
+            attributes.append((resource_id, uri, name, value, data_type, value_data))
+        # Framework lookups binary-search attributes by resource ID
+        attributes.sort(key=lambda a: (a[0] is None, a[0] or 0, a[1], a[2]))
+        typed.append(attributes)
+
+    pool = StringPool()
+    resource_map = sorted(ids.items(), key=lambda item: item[1])
+    for key, _ in resource_map:
+        pool.add(key[0], key)
+
+    def ref(string):
+        return pool.add(string) if string else NO_INDEX
+
+    def attr_name(name, resource_id):
+        return pool.add(name, (name, resource_id)) if resource_id is not None else pool.add(name)
+
+    body = []
+    typed_iter = iter(typed)
+    for node in nodes:
+        kind, line = node[0], node[1]
+        header = struct.pack('<II', line, NO_INDEX)
+        if kind in ('start_ns', 'end_ns'):
+            chunk_type = RES_XML_START_NAMESPACE_TYPE if kind == 'start_ns' else RES_XML_END_NAMESPACE_TYPE
+            body.append(_chunk(chunk_type, header, struct.pack('<II', ref(node[2]), ref(node[3]))))
+        elif kind == 'start':
+            uri, name = node[2]
+            attributes = next(typed_iter)
+            encoded = []
+            id_index = class_index = style_index = 0
+            for position, (resource_id, attr_uri, attr, value, data_type, value_data) in enumerate(attributes, 1):
+                if data_type == TYPE_STRING:
+                    raw = value_data = pool.add(value)
+                else:
+                    raw = NO_INDEX
+                encoded.append(struct.pack('<IIIHBBI', ref(attr_uri), attr_name(attr, resource_id),
+                                           raw, 8, 0, data_type, value_data))
+                if attr_uri == ANDROID_NS and attr == 'id':
+                    id_index = position
+                elif not attr_uri and attr == 'class':
+                    class_index = position
+                elif not attr_uri and attr == 'style':
+                    style_index = position
+            extension = struct.pack('<IIHHHHHH', ref(uri), pool.add(name), 20, 20, len(encoded),
+                                    id_index, class_index, style_index)
+            body.append(_chunk(RES_XML_START_ELEMENT_TYPE, header, extension + b''.join(encoded)))
+        elif kind == 'end':
+            uri, name = node[2]
+            body.append(_chunk(RES_XML_END_ELEMENT_TYPE, header, struct.pack('<II', ref(uri), pool.add(name))))
+        else:
+            index = pool.add(node[2])
+            body.append(_chunk(RES_XML_CDATA_TYPE, header,
+                               struct.pack('<IHBBI', index, 8, 0, TYPE_STRING, index)))
+
+    resource_ids = [resource_id for _, resource_id in resource_map]
+    chunks = pool.encode() + _chunk(RES_XML_RESOURCE_MAP_TYPE, b'',
+                                    struct.pack(f'<{len(resource_ids)}I', *resource_ids))
+    return _chunk(RES_XML_TYPE, b'', chunks + b''.join(body))
+
+
+def resources_key(resources):
+    """Stable digest of a resource ID map, for use in cache keys."""
+    h = hashlib.sha256()
+    for key, resource_id in sorted((resources or {}).items()):
+        h.update(f'{key}={resource_id:08x}\n'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def _encode_item(item):
+    data, resources = item
+    return encode_xml(data, resources)
+
+
+def encode_batch(files, resources=None, workers=None):
+    """Encode ``{path: source XML}`` and return ``{path: AXML bytes}``.
+
+    Results are cached by the SHA-256 of the source and the resource map,
+    so unchanged files cost one hash.  Large uncached batches are encoded
+    in the shared pool of worker processes (``process_pool``; ``workers``
+    sizes it if this call starts it), since encoding is CPU-bound Python.
+    """
+    map_key = resources_key(resources)
+    encoded = {}
+    pending = {}
+    for path, data in files.items():
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        key = (hashlib.sha256(data).digest(), map_key)
+        cached = _encoded.get(key)
+        if cached is not None:
+            encoded[path] = cached
+        else:
+            pending[path] = (key, data)
+
+    # Identical sources in one batch are encoded once
+    unique = {}
+    for path, (key, data) in pending.items():
+        unique.setdefault(key, (path, data))
+    paths = [path for path, _ in unique.values()]
+    items = [(pending[path][1], resources) for path in paths]
+    results = None
+    if len(paths) >= PARALLEL_THRESHOLD and (workers or ENCODE_WORKERS) > 1:
+        pool = process_pool(workers)
+        try:
+            results = list(pool.map(_encode_item, items, chunksize=16))
+        except BrokenProcessPool:
+            # A worker died; start a new pool next time and encode here now
+            _discard_pool(pool)
+    if results is None:
+        results = [_encode_item(item) for item in items]
+    by_key = {}
+    for path, result in zip(paths, results):
+        by_key[pending[path][0]] = result
+        _encoded.put(pending[path][0], result)
+    for path, (key, _) in pending.items():
+        encoded[path] = by_key[key]
+    return encoded
+
+
+def is_binary_xml(data):
+    return data[:4] == struct.pack('<HH', RES_XML_TYPE, 8)
+
+
+def cache_stats():
+    return {'axml_hits': _encoded.hits, 'axml_misses': _encoded.misses}
@@ -0,0 +1,471 @@
+"""End-to-end benchmark: every /api route of a real server against local stubs.
+
+Run from the repository root:
+
+    python benchmarks/bench_e2e.py [--sizes 10,1000,50000] [--concurrency 8] [--requests 50]
+                                   [--output run.json] [--baseline previous.json]
+
+Starts the Gemini and GitHub stand-ins of ``stubs.py``, then ``serve.py``
+as a subprocess pointed at them (``GEMINI_API_ROOT``, ``GITHUB_ROOT``)
+with its artifact and build directories in a temporary directory, so a run
+neither calls the internet nor touches ``data/``.  The Gemini rate limiter
+is off unless ``GEMINI_RPM`` / ``GEMINI_TPM`` are set.  Each scenario
+sends ``--requests`` requests from ``--concurrency`` keep-alive clients.
+Routes that take a project (export, Android Studio, GitHub import,
+builds) are run once per ``--sizes`` file count; the rest once.  Every
+request uses a fresh app name so the artifact cache misses, unless
+``--warm``.
+
+Build jobs and artifacts are stored on disk, so with ``--workers``
+above 1 the follow-up requests of ``builds`` and ``build-apk`` are
+served by whichever worker they reach.
+
+For each scenario it reports p50/p95/p99 latency, throughput, response
+bytes and errors (HTTP errors and ``"status": "error"`` bodies), plus the
+peak RSS of the whole server process tree.  ``--output`` writes the report
+as JSON; ``--baseline`` compares against an earlier report and exits
+non-zero if any p95 or throughput regressed by more than
+``--max-regression``.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import resource
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import StubServer, canned_responses, synthetic_files  # noqa: E402
+
+DEFAULT_SIZES = (10, 1000)
+API_KEY = 'bench-key'
+
+
+class Scenario:
+    """One route; ``request(n, size)`` gives ``(method, path, body)`` of the n-th call."""
+
+    def __init__(self, name, request, sized=False, follow=None):
+        self.name = name
+        self.request = request
+        self.sized = sized
+        self.follow = follow
+
+
+def post(path, **fields):
+    return 'POST', path, fields
+
+
+def project_scenarios(file_bytes):
+    files = {}
+
+    def project(size):
+        if size not in files:
+            files[size] = synthetic_files(size, file_bytes)
+        return files[size]
+
+    return [
+        Scenario('export-project', lambda n, size: post(
+            '/api/export-project', appName=f'Bench{n}', code=project(size)), sized=True),
+        Scenario('prepare-for-android-studio', lambda n, size: post(
+            '/api/prepare-for-android-studio', appName=f'Bench{n}', project_files=project(size)), sized=True),
+        Scenario('import-from-github', lambda n, size: post(
+            '/api/import-from-github', appName=f'Bench{n}',
+            github_url=f'https://github.com/bench/files-{size}-{file_bytes}', branch='main'), sized=True),
+        Scenario('builds', lambda n, size: post(
+            '/api/builds', appName=f'Bench{n}', project_files=project(size),
+            projectId=f'bench-{size}-{n % 4}'), sized=True, follow=follow_build),
+    ]
+
+
+def scenarios(file_bytes):
+    prompt = 'Reply with OK'
+    canned = canned_responses()
+    return [
+        Scenario('generate-ui', lambda n, size: post('/api/generate-ui', prompt=prompt)),
+        Scenario('test-gemini', lambda n, size: post('/api/test-gemini', api_key=API_KEY, prompt=prompt)),
+        Scenario('generate-android-code', lambda n, size: post(
+            '/api/generate-android-code', api_key=API_KEY, appName=f'Bench{n}', description='A todo list')),
+        Scenario('regenerate-files', lambda n, size: post(
+            '/api/regenerate-files', api_key=API_KEY, appName=f'Bench{n}', code=canned[n % len(canned)],
+            files=['activity_main.xml'], instructions='Use a darker theme')),
+        Scenario('build-apk-demo', lambda n, size: post(
+            '/api/build-apk', appName=f'Bench{n}', description='A fitness tracker')),
+        Scenario('build-apk', lambda n, size: post('/api/build-apk', appName=f'Bench{n}', format='apk'),
+                 follow=follow_artifact),
+        Scenario('sign-apk', lambda n, size: post('/api/sign-apk', appName=f'Bench{n}')),
+        Scenario('load-api-key', lambda n, size: ('GET', '/api/load-api-key', None)),
+        Scenario('export-to-github', lambda n, size: post('/api/export-to-github', appName=f'Bench{n}')),
+        Scenario('cache-stats', lambda n, size: ('GET', '/api/cache-stats', None)),
+    ] + project_scenarios(file_bytes)
+
+
+class Client:
+    """A keep-alive connection to the server under test."""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        """``(status, headers, body)``, reconnecting once if the server closed the connection."""
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+        headers = dict(headers or {})
+        if payload is not None:
+            headers['Content-Type'] = 'application/json'
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, payload, headers)
+                response = self.conn.getresponse()
+                data = response.read()
+            except (ConnectionError, http.client.BadStatusLine, http.client.RemoteDisconnected):
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if response.will_close:
+                self.close()
+            return response.status, response, data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def failed(status, response, data):
+    if status >= 400:
+        return f'HTTP {status}'
+    if response.getheader('Content-Type', '').startswith('application/json'):
+        try:
+            result = json.loads(data)
+        except ValueError:
+            return 'invalid JSON'
+        if isinstance(result, dict) and result.get('status') == 'error':
+            return result.get('message', 'error')[:200]
+    return None
+
+
+def follow_artifact(client, response, data):
+    """Fetch the cached artifact again through its ``Content-Location``."""
+    location = response.getheader('Content-Location')
+    if location is None:
+        return 0, None
+    status, response, data = client.request('GET', location)
+    return len(data), failed(status, response, data)
+
+
+def follow_build(client, response, data):
+    """Wait for a submitted build through its log stream, then download the APK."""
+    location = response.getheader('Location')
+    if location is None:
+        return 0, 'no Location'
+    status, response, log = client.request('GET', f'{location}/log')
+    if status != 200 or b'event: end' not in log:
+        return len(log), f'log stream ended without result (HTTP {status})'
+    status, response, apk = client.request('GET', f'{location}/artifact')
+    return len(log) + len(apk), failed(status, response, apk)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest-rank
+    index = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def run_scenario(scenario, size, url, concurrency, requests, timeout, warm, counter):
+    parsed = urlsplit(url)
+    local = threading.local()
+    clients = []
+    lock = threading.Lock()
+
+    def one(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = Client(parsed.hostname, parsed.port, timeout)
+            with lock:
+                clients.append(client)
+        method, path, body = scenario.request(0 if warm else next(counter), size)
+        start = time.perf_counter()
+        try:
+            status, response, data = client.request(method, path, body)
+            received, error = len(data), failed(status, response, data)
+            if error is None and scenario.follow is not None:
+                extra, error = scenario.follow(client, response, data)
+                received += extra
+        except (OSError, http.client.HTTPException) as e:
+            client.close()
+            received, error = 0, f'{type(e).__name__}: {e}'
+        return time.perf_counter() - start, received, error
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        client.close()
+
+    latencies = [latency for latency, _, error in results if error is None]
+    errors = [error for _, _, error in results if error is not None]
+    return {
+        'scenario': scenario.name,
+        'files': size,
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'seconds': round(elapsed, 4),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'bytes_out': sum(received for _, received, _ in results),
+    }
+
+
+def ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def process_tree(pid):
+    """``pid`` and all its descendants, from ``/proc``."""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, ()))
+    return tree
+
+
+def rss_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler:
+    """Peak summed RSS of a process tree, sampled in the background."""
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.available = os.path.isdir('/proc')
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        if self.available:
+            self.peak = max(self.peak, sum(rss_bytes(pid) for pid in process_tree(self.pid)))
+        return self.peak
+
+    def reset(self):
+        self.peak = 0
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, stubs, workdir, server, workers, threads):
+    env = dict(os.environ, **stubs.environ())
+    env.update({
+        'ARTIFACT_DIR': os.path.join(workdir, 'artifacts'),
+        'BUILD_ROOT': os.path.join(workdir, 'builds'),
+        'WORKSPACE_ROOT': os.path.join(workdir, 'builds', 'workspaces'),
+        'BUILD_BACKEND': 'fake',
+    })
+    # The stub has no quota; measure the server, not the client-side limiter
+    env.setdefault('GEMINI_RPM', '0')
+    env.setdefault('GEMINI_TPM', '0')
+    command = [sys.executable, os.path.join(REPO_ROOT, 'serve.py'), '--host', '127.0.0.1', '--port', str(port),
+               '--server', server, '--workers', str(workers), '--threads', str(threads), '--max-requests', '0']
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE, start_new_session=True)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited: {process.stderr.read().decode(errors="replace")[-2000:]}')
+        try:
+            status, _, _ = Client('127.0.0.1', port, 5).request('GET', '/api/cache-stats')
+            if status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError('server did not become ready within 60 s')
+
+
+def stop_server(process):
+    if process.poll() is None:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+
+def run(sizes, concurrency, requests, file_bytes=200, server='stdlib', workers=1, threads=8,
+        upstream_latency=0.05, timeout=300, warm=False, only=None):
+    workdir = tempfile.mkdtemp(prefix='bench-e2e-')
+    stubs = StubServer(latency=upstream_latency).start()
+    port = free_port()
+    process = start_server(port, stubs, workdir, server, workers, threads)
+    sampler = RssSampler(process.pid).start()
+    counter = itertools.count(1)
+    results = []
+    try:
+        for scenario in scenarios(file_bytes):
+            if only and scenario.name not in only:
+                continue
+            for size in (sizes if scenario.sized else (None,)):
+                sampler.reset()
+                result = run_scenario(scenario, size, f'http://127.0.0.1:{port}', concurrency, requests,
+                                      timeout, warm, counter)
+                result['peak_rss_bytes'] = sampler.sample() or None
+                results.append(result)
+    finally:
+        sampler.stop()
+        stop_server(process)
+        stubs.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    peak_rss = sampler.peak if sampler.available else None
+    if not peak_rss:
+        # No /proc: the largest reaped child is the best available figure
+        peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    return {
+        'config': {
+            'server': server, 'workers': workers, 'threads': threads, 'concurrency': concurrency,
+            'requests': requests, 'sizes': list(sizes), 'file_bytes': file_bytes,
+            'upstream_latency': upstream_latency, 'warm': warm, 'canned_responses': len(canned_responses()),
+            'python': sys.version.split()[0],
+        },
+        'peak_rss_bytes': max([peak_rss] + [r['peak_rss_bytes'] or 0 for r in results]),
+        'results': results,
+    }
+
+
+def compare(report, baseline, max_regression):
+    """Regressions of ``report`` against ``baseline``, as printable lines."""
+    previous = {(r['scenario'], r['files']): r for r in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        before = previous.get((result['scenario'], result['files']))
+        if before is None:
+            continue
+        name = result['scenario'] + (f' [{result["files"]} files]' if result['files'] else '')
+        if before['p95_ms'] and result['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + max_regression):
+            regressions.append(f'{name}: p95 {before["p95_ms"]} -> {result["p95_ms"]} ms')
+        if (before['throughput_rps'] and result['throughput_rps'] is not None
+                and result['throughput_rps'] < before['throughput_rps'] * (1 - max_regression)):
+            regressions.append(f'{name}: throughput {before["throughput_rps"]} -> {result["throughput_rps"]} req/s')
+        if result['errors'] > before['errors']:
+            regressions.append(f'{name}: errors {before["errors"]} -> {result["errors"]}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma-separated project file counts (10 to 50000)')
+    parser.add_argument('--file-bytes', type=int, default=200, help='bytes per synthetic file')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50, help='requests per scenario')
+    parser.add_argument('--scenarios', default='', help='comma-separated subset of scenarios')
+    parser.add_argument('--server', default='stdlib', choices=('stdlib', 'gunicorn', 'waitress', 'uvicorn'))
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--upstream-latency', type=float, default=0.05,
+                        help='seconds the stubs wait before answering')
+    parser.add_argument('--timeout', type=float, default=300, help='per-request timeout in seconds')
+    parser.add_argument('--warm', action='store_true', help='repeat one app name so cached artifacts are hit')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='allowed relative p95/throughput regression against the baseline')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    only = set(s for s in args.scenarios.split(',') if s)
+    report = run(sizes, args.concurrency, args.requests, args.file_bytes, args.server, args.workers,
+                 args.threads, args.upstream_latency, args.timeout, args.warm, only)
+
+    print(f'{"scenario":<28}{"files":>7}{"req/s":>9}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+          f'{"MiB out":>9}{"RSS MiB":>9}{"errors":>8}')
+    for r in report['results']:
+        print(f'{r["scenario"]:<28}{r["files"] or "":>7}{r["throughput_rps"] or 0:>9.1f}'
+              f'{r["p50_ms"] or 0:>10.1f}{r["p95_ms"] or 0:>10.1f}{r["p99_ms"] or 0:>10.1f}'
+              f'{r["bytes_out"] / 2 ** 20:>9.1f}{(r["peak_rss_bytes"] or 0) / 2 ** 20:>9.0f}{r["errors"]:>8}')
+        if r['first_error']:
+            print(f'    first error: {r["first_error"]}')
+    print(f'peak RSS of the server: {report["peak_rss_bytes"] / 2 ** 20:.0f} MiB')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Microbenchmark: per-role ``any(endswith)`` scans vs. the single-pass index.
+
+Run from the repository root:
+
+    python benchmarks/bench_file_roles.py [--sizes 100,1000,10000,50000]
+
+For each project size it reports the time to answer the eight skeleton
+questions the old ``prepare_for_android_studio`` asked (one full scan per
+question), the one-off cost of ``build_index``, and the cost of the same
+eight questions against the built index.  Scan time grows linearly with
+the file count while indexed lookups stay flat; the index itself is a single
+pass that also produces the routing table, and is built once per request.
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_roles import build_index  # noqa: E402
+
+# The eight questions the old route answered with a full scan each
+SUFFIX_QUESTIONS = (
+    ('build.gradle',),
+    ('settings.gradle',),
+    ('AndroidManifest.xml',),
+    ('MainActivity.java', 'MainActivity.kt'),
+    ('activity_main.xml',),
+    ('strings.xml',),
+    ('colors.xml',),
+    ('styles.xml',),
+)
+ROLE_QUESTIONS = (
+    'module_build', 'settings', 'manifest', 'main_activity',
+    'main_layout', 'strings', 'colors', 'styles',
+)
+
+
+def synthetic_paths(count):
+    """Project paths that answer "no" to every question, the worst case."""
+    paths = []
+    for i in range(count):
+        bucket = i % 4
+        if bucket == 0:
+            paths.append(f'app/src/main/java/com/example/app/pkg{i // 100}/Class{i}.java')
+        elif bucket == 1:
+            paths.append(f'app/src/main/res/layout/item_{i}.xml')
+        elif bucket == 2:
+            paths.append(f'app/src/main/res/drawable/icon_{i}.png')
+        else:
+            paths.append(f'docs/page_{i}.md')
+    return paths
+
+
+def scan(paths):
+    return [any(p.endswith(suffixes) for p in paths) for suffixes in SUFFIX_QUESTIONS]
+
+
+def lookup(index):
+    return [index.has(role) for role in ROLE_QUESTIONS]
+
+
+def best_of(func, repeat):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(sizes, repeat=5):
+    results = []
+    for size in sizes:
+        paths = synthetic_paths(size)
+        index = build_index(paths, 'com.example.app', route=False)
+        assert scan(paths) == lookup(index)
+        results.append({
+            'files': size,
+            'scan_s': best_of(lambda: scan(paths), repeat),
+            'index_build_s': best_of(lambda: build_index(paths, 'com.example.app', route=False), repeat),
+            'lookup_s': best_of(lambda: lookup(index), repeat),
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000,50000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    print(f"{'files':>8} {'8 scans':>12} {'build index':>12} {'8 lookups':>12}")
+    for row in run(sizes, args.repeat):
+        print(f"{row['files']:>8} {row['scan_s'] * 1e6:>10.1f}us "
+              f"{row['index_build_s'] * 1e6:>10.1f}us {row['lookup_s'] * 1e6:>10.2f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""Microbenchmarks of the archive assembly and parsing hot spots.
+
+Run from the repository root:
+
+    python benchmarks/bench_micro.py [--files 10,1000,10000] [--file-bytes 200,4096]
+                                     [--cases zip_stored,zip_deflate] [--save baseline.json]
+    python benchmarks/bench_micro.py --baseline baseline.json [--max-regression 0.25]
+
+Each case runs on a synthetic project of every ``--files`` x
+``--file-bytes`` combination (the file mix of ``stubs.synthetic_files``)
+and reports the best time of ``--repeat`` runs, per call and per file:
+
+* ``zip_stored`` / ``zip_deflate``: ``ApkWriter.write_entry`` of every file,
+  stored and deflated, into memory
+* ``project_zip``: ``build_project_zip`` with its caches cleared
+* ``skeleton``: ``assemble_project`` with its caches cleared, i.e. the
+  role index over the provided files plus rendering the missing skeleton
+* ``file_roles``: ``build_index`` routing the bare and full paths
+* ``model_output``: decoding a Gemini response whose candidate is a fenced
+  JSON file map, through ``gemini_client.parse_response`` and
+  ``regeneration.parse_code_files``
+* ``project_dumps`` / ``project_loads``: the JSON body of a project route
+
+``--save`` writes the results as JSON.  ``--baseline`` compares against a
+saved run and exits non-zero when a case got slower by more than its
+threshold: ``--max-regression``, widened for the cases in
+``NOISY_CASES`` whose short timings vary more between runs.  Baselines
+are only comparable on the same machine and Python version.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from io import BytesIO
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import gemini_client  # noqa: E402
+import project_assembly  # noqa: E402
+from apk_writer import ApkWriter  # noqa: E402
+from file_roles import build_index  # noqa: E402
+from project_assembly import ProjectModel, assemble_project, build_project_zip  # noqa: E402
+from regeneration import parse_code_files  # noqa: E402
+from stubs import synthetic_files  # noqa: E402
+
+APP_NAME = 'BenchApp'
+PACKAGE = 'com.example.benchapp'
+
+# Cases with sub-millisecond timings at small sizes; allowed twice the regression
+NOISY_CASES = frozenset(('file_roles', 'skeleton', 'model_output'))
+
+
+def bare_names(files):
+    """Every other path reduced to its file name, as model output gives them."""
+    return {(os.path.basename(path) if i % 2 else path): content
+            for i, (path, content) in enumerate(files.items())}
+
+
+def write_entries(files, compress):
+    with ApkWriter(BytesIO()) as writer:
+        for path, content in files.items():
+            writer.write_entry(path, content, compress)
+
+
+def zip_stored(files):
+    return lambda: write_entries(files, False)
+
+
+def zip_deflate(files):
+    return lambda: write_entries(files, True)
+
+
+def project_zip(files):
+    model = ProjectModel.from_files(APP_NAME, files)
+
+    def build():
+        project_assembly.clear_caches()
+        build_project_zip(model)
+    return build
+
+
+def skeleton(files):
+    model = ProjectModel.from_files(APP_NAME, files)
+
+    def render():
+        project_assembly.clear_caches()
+        assemble_project(model)
+    return render
+
+
+def file_roles(files):
+    names = list(bare_names(files))
+    return lambda: build_index(names, PACKAGE)
+
+
+def model_output(files):
+    code = '```json\n' + json.dumps(bare_names(files), indent=2) + '\n```'
+    body = json.dumps({'candidates': [{'content': {'parts': [{'text': code}]}}]})
+
+    def parse():
+        parse_code_files(gemini_client.parse_response(200, body, json.loads(body)))
+    return parse
+
+
+def project_dumps(files):
+    project = {'appName': APP_NAME, 'project_files': files}
+    return lambda: json.dumps(project)
+
+
+def project_loads(files):
+    body = json.dumps({'appName': APP_NAME, 'project_files': files})
+    return lambda: json.loads(body)
+
+
+CASES = {
+    'zip_stored': zip_stored,
+    'zip_deflate': zip_deflate,
+    'project_zip': project_zip,
+    'skeleton': skeleton,
+    'file_roles': file_roles,
+    'model_output': model_output,
+    'project_dumps': project_dumps,
+    'project_loads': project_loads,
+}
+
+
+def best_of(func, repeat):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(cases, counts, sizes, repeat=5):
+    results = []
+    for count in counts:
+        for size in sizes:
+            files = synthetic_files(count, size)
+            for name in cases:
+                seconds = best_of(CASES[name](files), repeat)
+                results.append({
+                    'case': name,
+                    'files': count,
+                    'file_bytes': size,
+                    'seconds': seconds,
+                    'per_file_us': seconds / count * 1e6,
+                })
+    return results
+
+
+def compare(results, baseline, max_regression):
+    """Cases slower than in ``baseline`` beyond their threshold, as printable lines."""
+    previous = {(r['case'], r['files'], r['file_bytes']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['case'], result['files'], result['file_bytes']))
+        if before is None:
+            continue
+        allowed = max_regression * (2 if result['case'] in NOISY_CASES else 1)
+        ratio = result['seconds'] / before['seconds']
+        if ratio > 1 + allowed:
+            regressions.append(f"{result['case']} [{result['files']} x {result['file_bytes']} B]: "
+                               f"{before['seconds'] * 1e3:.3f} -> {result['seconds'] * 1e3:.3f} ms "
+                               f"(+{(ratio - 1) * 100:.0f}%, allowed +{allowed * 100:.0f}%)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', default='10,1000,10000', help='comma-separated file counts')
+    parser.add_argument('--file-bytes', default='200,4096', help='comma-separated bytes per file')
+    parser.add_argument('--cases', default=','.join(CASES), help='comma-separated subset of cases')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help='write the results as JSON here')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='allowed relative slowdown against the baseline')
+    args = parser.parse_args(argv)
+
+    cases = [c for c in args.cases.split(',') if c]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+    counts = [int(n) for n in args.files.split(',')]
+    sizes = [int(n) for n in args.file_bytes.split(',')]
+
+    results = run(cases, counts, sizes, args.repeat)
+    print(f"{'case':<15} {'files':>7} {'bytes':>6} {'time':>12} {'per file':>12}")
+    for row in results:
+        print(f"{row['case']:<15} {row['files']:>7} {row['file_bytes']:>6} "
+              f"{row['seconds'] * 1e3:>10.3f}ms {row['per_file_us']:>10.2f}us")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""Local stand-ins for the Gemini API and GitHub archive downloads.
+
+Used by ``bench_e2e.py``; can also be run on its own to point a manually
+started server at them:
+
+    python benchmarks/stubs.py [--port 8765] [--latency 0.05]
+    GEMINI_API_ROOT=http://127.0.0.1:8765/gemini GITHUB_ROOT=http://127.0.0.1:8765/github python serve.py
+
+The Gemini stub answers ``POST .../<model>:generateContent`` with the
+canned ``code`` payloads of ``data/*.json`` in turn, after ``--latency``
+seconds.  The GitHub stub serves ``GET /<owner>/<repo>/archive/refs/heads/
+<branch>.zip`` as a synthetic repository whose repo name gives its size:
+``files-<count>`` (optionally ``files-<count>-<bytes per file>``).
+Archives are generated once per size and kept in memory.
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REPO_PATTERN = re.compile(r'^/github/[^/]+/files-(\d+)(?:-(\d+))?/archive/refs/heads/([^/]+)\.zip$')
+DEFAULT_FILE_BYTES = 200
+
+
+def canned_responses(pattern=os.path.join(REPO_ROOT, 'data', '*.json')):
+    """The ``code`` payloads of saved projects, as Gemini would return them."""
+    responses = []
+    for path in sorted(glob.glob(pattern)):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if isinstance(data, dict) and isinstance(data.get('code'), str):
+            responses.append(data['code'])
+    return responses or ['{"MainActivity.java": "class MainActivity {}"}']
+
+
+def synthetic_files(count, file_bytes=DEFAULT_FILE_BYTES):
+    """``{path: content}`` of a plausible Android project with ``count`` files."""
+    files = {}
+    filler = ('// ' + 'x' * 76 + '\n') * (file_bytes // 80 + 1)
+    for i in range(count):
+        bucket = i % 4
+        if bucket == 0:
+            path = f'app/src/main/java/com/example/bench/pkg{i // 100}/Class{i}.java'
+            content = f'package com.example.bench.pkg{i // 100};\n\nclass Class{i} {{}}\n'
+        elif bucket == 1:
+            path = f'app/src/main/res/layout/item_{i}.xml'
+            content = '<?xml version="1.0" encoding="utf-8"?>\n<FrameLayout />\n'
+        elif bucket == 2:
+            path = f'app/src/main/assets/data_{i}.txt'
+            content = ''
+        else:
+            path = f'docs/page_{i}.md'
+            content = f'# Page {i}\n'
+        files[path] = (content + filler)[:max(file_bytes, len(content))]
+    return files
+
+
+@lru_cache(maxsize=16)
+def synthetic_archive(count, file_bytes=DEFAULT_FILE_BYTES, branch='main'):
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for path, content in synthetic_files(count, file_bytes).items():
+            zf.writestr(f'bench-{branch}/{path}', content)
+    return buf.getvalue()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.startswith('/gemini/') or ':generateContent' not in self.path:
+            return self._send(404, b'{}', 'application/json')
+        time.sleep(self.server.latency)
+        text = next(self.server.responses)
+        prompt_tokens, output_tokens = len(request) // 4, len(text) // 4
+        body = json.dumps({
+            'candidates': [{'content': {'parts': [{'text': text}]}}],
+            'usageMetadata': {'promptTokenCount': prompt_tokens, 'candidatesTokenCount': output_tokens,
+                              'totalTokenCount': prompt_tokens + output_tokens},
+        }).encode('utf-8')
+        self._send(200, body, 'application/json')
+
+    def do_GET(self):
+        match = REPO_PATTERN.match(self.path)
+        if match is None:
+            return self._send(404, b'Not Found', 'text/plain')
+        count, file_bytes, branch = match.groups()
+        time.sleep(self.server.latency)
+        archive = synthetic_archive(int(count), int(file_bytes or DEFAULT_FILE_BYTES), branch)
+        self._send(200, archive, 'application/zip')
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.05):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.responses = itertools.cycle(canned_responses())
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def environ(self):
+        """Environment pointing a server at these stubs."""
+        return {'GEMINI_API_ROOT': f'{self.url}/gemini', 'GITHUB_ROOT': f'{self.url}/github'}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='stubs', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    server = StubServer(args.port, args.latency)
+    for name, value in server.environ().items():
+        print(f'{name}={value}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,571 @@
+"""Queue of real (or fake) Android builds run by a bounded worker pool.
+
+``BuildScheduler.submit`` queues a ``BuildJob`` for a ``ProjectModel`` and
+returns at once.  A fixed number of worker threads take jobs off the
+queue, sync each project into its persistent workspace (see
+``workspaces``) and hand it to a builder.  Builder output is appended to the job's log line by line, and
+``BuildJob.follow`` lets any number of readers stream it (the server sends
+it as Server-Sent Events) while the build runs.
+
+``serve.py`` runs several worker processes, and a client's next request
+may reach any of them.  So a job's state and log live in a directory under
+``BUILD_ROOT/jobs`` rather than in the process that runs it: status, log
+streaming, cancelling and the APK download work from every process.
+
+Builders are pluggable through ``BUILDERS``:
+
+* ``GradleBuilder`` runs Gradle with the daemon enabled and a fixed Gradle
+  user home, so consecutive jobs reuse one warm daemon instead of paying
+  JVM startup and configuration each time; ``warm_up`` starts it early.
+* ``FakeBuilder`` needs no toolchain: it replays a typical Gradle log and
+  emits a small unsigned APK, for offline tests and demos.
+
+Building a project runs its Gradle scripts, i.e. code sent by the client,
+so the server uses ``FakeBuilder`` unless ``BUILD_BACKEND=gradle`` is set
+explicitly, and only then registers ``GradleBuilder``.  Clients do not
+pick the builder, the task is one of ``BUILD_TASKS`` and project ids are
+checked and namespaced by package before they name a workspace.
+"""
+import json
+import os
+import queue
+import re
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+from apk_writer import write_apk
+from project_assembly import assemble_project
+from workspaces import WorkspacePool, sync
+
+BUILD_ROOT = os.environ.get('BUILD_ROOT', os.path.join('data', 'builds'))
+BUILD_WORKERS = int(os.environ.get('BUILD_WORKERS', 2))
+BUILD_TIMEOUT = int(os.environ.get('BUILD_TIMEOUT', 30 * 60))
+DEFAULT_BUILDER = os.environ.get('BUILD_BACKEND', 'fake')
+
+# Finished jobs kept for status, logs and downloads; older ones are purged
+MAX_FINISHED_JOBS = 100
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+DEBUG_APK = os.path.join('app', 'build', 'outputs', 'apk', 'debug', 'app-debug.apk')
+RELEASE_APK = os.path.join('app', 'build', 'outputs', 'apk', 'release', 'app-release-unsigned.apk')
+
+# The only Gradle tasks a client may ask for, and the APK each one produces
+BUILD_TASKS = {
+    'assembleDebug': DEBUG_APK,
+    'assembleRelease': RELEASE_APK,
+}
+
+PROJECT_ID = re.compile(r'[A-Za-z0-9_.-]{1,64}')
+JOB_ID = re.compile(r'[0-9a-f]{32}')
+
+# How often a log stream checks for new lines and the job's state, in seconds
+FOLLOW_INTERVAL = 0.2
+
+
+class BuildError(Exception):
+    pass
+
+
+class BuildCancelled(BuildError):
+    pass
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists, but signalling it is not allowed (or not supported)
+        return True
+    return True
+
+
+class BuildJob:
+    """One build request, its state and its log.
+
+    The state is kept in ``<root>/jobs/<id>/job.json`` and the log in
+    ``log`` beside it, so every server process can report, stream and
+    cancel a job, while only the process that queued it runs it (``model``
+    and ``process`` are only set there).  ``load`` reads a job back; a job
+    whose process has gone away without finishing it is reported failed.
+    """
+
+    # Saved in job.json
+    FIELDS = ('id', 'app_name', 'project', 'builder', 'task', 'state', 'error', 'created',
+              'started', 'finished', 'output', 'sync', 'owner', 'pid')
+
+    def __init__(self, model, builder, task, project=None, root=BUILD_ROOT):
+        self.id = uuid.uuid4().hex
+        self.model = model
+        self.app_name = model.app_name
+        # Namespaced so a client id can only share workspaces within its package
+        self.project = f'{model.package}/{project}' if project else model.package
+        self.builder = builder
+        self.task = task
+        self.state = QUEUED
+        self.error = None
+        self.workspace = None
+        self.sync = None
+        self.output = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.owner = os.getpid()
+        self.pid = None
+        self.process = None
+        self.directory = os.path.join(root, 'jobs', self.id)
+        self._cancelled = False
+        self._lines = 0
+        self._log_file = None
+        self._lock = threading.Condition()
+        os.makedirs(self.directory, exist_ok=True)
+        open(self.log_path, 'w').close()
+        self._save()
+
+    @classmethod
+    def load(cls, directory):
+        """The job saved in ``directory``, as last written by its process."""
+        with open(os.path.join(directory, 'job.json')) as f:
+            data = json.load(f)
+        job = cls.__new__(cls)
+        job.__dict__.update({name: data[name] for name in cls.FIELDS})
+        job.model = job.process = job.workspace = job._log_file = None
+        job.directory = directory
+        job._cancelled = False
+        job._lines = None
+        job._lock = threading.Condition()
+        if not job.done and not process_alive(job.owner):
+            job.state, job.error = FAILED, 'Build process exited'
+        return job
+
+    @property
+    def log_path(self):
+        return os.path.join(self.directory, 'log')
+
+    def _save(self):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({name: getattr(self, name) for name in self.FIELDS}, f)
+            os.replace(tmp, os.path.join(self.directory, 'job.json'))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def log(self, line):
+        with self._lock:
+            if self._log_file is None:
+                self._log_file = open(self.log_path, 'a', encoding='utf-8', buffering=1)
+            self._log_file.write(line.rstrip('\n') + '\n')
+            self._lines += 1
+            self._lock.notify_all()
+
+    def _set_state(self, state, error=None):
+        with self._lock:
+            self.state = state
+            self.error = error
+            if state == RUNNING:
+                self.started = time.time()
+            elif state in FINISHED_STATES:
+                self.finished = time.time()
+                if self._log_file is not None:
+                    self._log_file.close()
+                    self._log_file = None
+            self._save()
+            self._lock.notify_all()
+
+    def set_process(self, process):
+        """Record the running build process, so any server process can cancel it."""
+        self.process = process
+        self.pid = process and process.pid
+        self._save()
+
+    @property
+    def variant(self):
+        return self.task[len('assemble'):].lower()
+
+    @property
+    def done(self):
+        return self.state in FINISHED_STATES
+
+    @property
+    def cancel_requested(self):
+        return self._cancelled or os.path.exists(os.path.join(self.directory, 'cancel'))
+
+    def request_cancel(self):
+        self._cancelled = True
+        open(os.path.join(self.directory, 'cancel'), 'w').close()
+
+    def _refresh(self):
+        """Re-read the state of a job run by another process."""
+        if self.model is None:
+            try:
+                current = self.load(self.directory)
+            except (OSError, ValueError):
+                return
+            self.__dict__.update({name: getattr(current, name) for name in self.FIELDS})
+
+    def _wait(self, lines):
+        """Wait up to ``FOLLOW_INTERVAL`` for a log line past ``lines`` or the end."""
+        with self._lock:
+            # Only the running process is notified; others just poll
+            if self.model is None or (self._lines <= lines and not self.done):
+                self._lock.wait(FOLLOW_INTERVAL)
+
+    def follow(self, start=0, timeout=15):
+        """Yield ``(index, line)`` from ``start`` until the job finishes.
+
+        Yields ``(None, None)`` after ``timeout`` seconds without output so
+        callers can send keep-alives.  The log file is polled, so this works
+        from any process; in the process running the job, new output wakes
+        the reader at once.
+        """
+        index = 0
+        idle = 0.0
+        partial = ''
+        finished = False
+        with open(self.log_path, encoding='utf-8') as f:
+            while True:
+                line = f.readline()
+                if line.endswith('\n'):
+                    if index >= start:
+                        yield index, partial + line[:-1]
+                    partial = ''
+                    index += 1
+                    idle = 0.0
+                    continue
+                partial += line
+                if finished:
+                    return
+                self._refresh()
+                # Read once more after the job is seen finished, for its last lines
+                finished = self.done
+                if not finished:
+                    waited = time.monotonic()
+                    self._wait(index)
+                    idle += time.monotonic() - waited
+                    if idle >= timeout:
+                        idle = 0.0
+                        yield None, None
+
+    def log_lines(self):
+        if self._lines is not None:
+            return self._lines
+        try:
+            with open(self.log_path, 'rb') as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'app_name': self.app_name,
+            'project': self.project,
+            'builder': self.builder,
+            'task': self.task,
+            'state': self.state,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'log_lines': self.log_lines(),
+            'has_output': self.output is not None,
+            'sync': self.sync,
+        }
+
+
+class FakeBuilder:
+    """Pretends to run Gradle; writes a small unsigned APK."""
+
+    TASKS = (
+        ':app:preBuild', ':app:generateDebugResources', ':app:processDebugManifest',
+        ':app:compileDebugJavaWithJavac', ':app:dexBuilderDebug', ':app:packageDebug',
+        ':app:assembleDebug',
+    )
+
+    def __init__(self, step_delay=0.0, fail=False):
+        self.step_delay = step_delay
+        self.fail = fail
+
+    def run(self, job, workspace):
+        job.log(f'> Configure project :app ({job.model.app_name})')
+        for task in self.TASKS:
+            if job.cancel_requested:
+                raise BuildCancelled('Build cancelled')
+            job.log(f'> Task {task}')
+            time.sleep(self.step_delay)
+        if self.fail:
+            job.log('BUILD FAILED')
+            raise BuildError('Fake build failure')
+        output = os.path.join(workspace, BUILD_TASKS[job.task])
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'wb') as f:
+            write_apk(f, {
+                'AndroidManifest.xml': assemble_project(job.model)['app/src/main/AndroidManifest.xml'],
+                'classes.dex': b'# Dalvik executable placeholder',
+            })
+        job.log('BUILD SUCCESSFUL')
+        return output
+
+
+def kill_process_tree(process):
+    """Kill ``process`` and, on POSIX, the rest of its process group."""
+    if os.name == 'posix':
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        process.kill()
+
+
+def terminate_process_tree(pid, process=None):
+    """Ask the process group ``pid`` of a build to stop with SIGTERM.
+
+    Where the group cannot be signalled, falls back to killing ``process``
+    (when it belongs to this process) with ``kill_process_tree``.
+    """
+    if os.name == 'posix':
+        try:
+            os.killpg(pid, signal.SIGTERM)
+            return
+        except ProcessLookupError:
+            return
+        except OSError:
+            pass
+    if process is not None:
+        kill_process_tree(process)
+
+
+class GradleBuilder:
+    """Runs a Gradle task against a shared, long-lived Gradle daemon.
+
+    The daemon is only reused when every build uses the same Gradle
+    installation, user home and JVM arguments, so those are fixed here
+    rather than taken from each project.
+    """
+
+    def __init__(self, gradle=None, user_home=None, jvm_args='-Xmx2g -Dfile.encoding=UTF-8'):
+        self.gradle = gradle or os.environ.get('GRADLE_CMD') or shutil.which('gradle')
+        self.user_home = os.path.abspath(user_home or os.environ.get(
+            'GRADLE_USER_HOME', os.path.join('data', 'gradle-home')))
+        self.jvm_args = jvm_args
+        self._warm = threading.Lock()
+        self.warmed = False
+
+    def _command(self, *args):
+        if not self.gradle:
+            raise BuildError('Gradle not found; set GRADLE_CMD or install gradle')
+        return [self.gradle, '--daemon', '--console=plain', f'-Dorg.gradle.jvmargs={self.jvm_args}', *args]
+
+    def _env(self):
+        env = dict(os.environ)
+        env['GRADLE_USER_HOME'] = self.user_home
+        return env
+
+    def warm_up(self):
+        """Start the daemon ahead of the first job (no-op once warm)."""
+        with self._warm:
+            if self.warmed or not self.gradle:
+                return
+            scratch = tempfile.mkdtemp()
+            try:
+                with open(os.path.join(scratch, 'settings.gradle'), 'w') as f:
+                    f.write("rootProject.name = 'warmup'\n")
+                subprocess.run(self._command('-q', 'help'), cwd=scratch, env=self._env(),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=BUILD_TIMEOUT)
+                self.warmed = True
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+    def run(self, job, workspace):
+        if job.task not in BUILD_TASKS:
+            raise BuildError(f'Unknown build task: {job.task}')
+        self.warm_up()
+        # Own process group, so a kill also reaches children holding stdout
+        process = subprocess.Popen(
+            self._command(job.task), cwd=workspace, env=self._env(),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+            start_new_session=os.name == 'posix')
+        job.set_process(process)
+        # Killed from a timer: a build that hangs without output never
+        # reaches a check in the read loop
+        timed_out = threading.Event()
+
+        def expire():
+            timed_out.set()
+            kill_process_tree(process)
+
+        timer = threading.Timer(BUILD_TIMEOUT, expire)
+        timer.daemon = True
+        timer.start()
+        try:
+            for line in process.stdout:
+                job.log(line)
+            code = process.wait()
+        finally:
+            timer.cancel()
+            job.set_process(None)
+        if timed_out.is_set():
+            raise BuildError(f'Build timed out after {BUILD_TIMEOUT}s')
+        if job.cancel_requested:
+            raise BuildCancelled('Build cancelled')
+        if code != 0:
+            raise BuildError(f'Gradle exited with status {code}')
+        output = os.path.join(workspace, BUILD_TASKS[job.task])
+        return output if os.path.exists(output) else None
+
+
+BUILDERS = {
+    'fake': FakeBuilder(),
+}
+if DEFAULT_BUILDER == 'gradle':
+    # Runs client-supplied build scripts, so only when explicitly enabled
+    BUILDERS['gradle'] = GradleBuilder()
+
+
+class BuildScheduler:
+    """Bounded pool of worker threads consuming a FIFO queue of jobs.
+
+    Jobs are queued and run in the process that accepted them, but stored
+    under ``root``, so ``get``, ``cancel`` and ``jobs`` see the jobs of
+    every server process sharing it.
+    """
+
+    def __init__(self, builders=BUILDERS, workers=BUILD_WORKERS, root=BUILD_ROOT, workspaces=None):
+        self.builders = builders
+        self.workers = workers
+        self.root = root
+        self.workspaces = workspaces or WorkspacePool(os.path.join(root, 'workspaces'))
+        self._queue = queue.Queue()
+        # Jobs of this process that are not finished yet
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'build-worker-{len(self._threads)}',
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, model, builder=DEFAULT_BUILDER, task='assembleDebug', project=None):
+        if builder not in self.builders:
+            raise ValueError(f'Unknown builder: {builder}')
+        if task not in BUILD_TASKS:
+            raise ValueError(f"Unknown build task: {task} (one of {', '.join(BUILD_TASKS)})")
+        if project is not None and not (isinstance(project, str) and PROJECT_ID.fullmatch(project)):
+            raise ValueError('Invalid project id: use 1-64 letters, digits, ".", "_" or "-"')
+        job = BuildJob(model, builder, task, project, self.root)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._start()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        if not JOB_ID.fullmatch(job_id):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        try:
+            return BuildJob.load(os.path.join(self.root, 'jobs', job_id))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def jobs(self):
+        try:
+            names = os.listdir(os.path.join(self.root, 'jobs'))
+        except FileNotFoundError:
+            return []
+        jobs = [self.get(name) for name in names]
+        return sorted((job for job in jobs if job is not None), key=lambda job: job.created)
+
+    def queued(self):
+        return self._queue.qsize()
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.done:
+            return job
+        job.request_cancel()
+        if job.pid is not None:
+            # The whole group: Gradle's children hold its stdout open.  The
+            # pid is recorded, so this works from any server process.
+            terminate_process_tree(job.pid, job.process)
+        return job
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+                self._queue.task_done()
+                self._purge()
+
+    def _run(self, job):
+        if job.cancel_requested:
+            job._set_state(CANCELLED, 'Build cancelled')
+            return
+        job._set_state(RUNNING)
+        try:
+            with self.workspaces.lease(job.project) as workspace:
+                job.workspace = workspace
+                synced = sync(workspace, assemble_project(job.model))
+                job.sync = {
+                    'written': len(synced['written']),
+                    'removed': len(synced['removed']),
+                    'unchanged': synced['unchanged'],
+                }
+                job.log(f"> Workspace synced: {job.sync['written']} written, "
+                        f"{job.sync['removed']} removed, {job.sync['unchanged']} unchanged")
+                output = self.builders[job.builder].run(job, workspace)
+                if output is not None:
+                    # The next build of this project reuses the workspace,
+                    # so keep a copy of the output that belongs to this job
+                    job.output = os.path.join(self.root, 'outputs', f'{job.id}.apk')
+                    os.makedirs(os.path.dirname(job.output), exist_ok=True)
+                    shutil.copyfile(output, job.output)
+            job._set_state(SUCCEEDED)
+        except BuildCancelled as e:
+            job._set_state(CANCELLED, str(e))
+        except Exception as e:
+            job.log(f'error: {e}')
+            job._set_state(FAILED, str(e))
+        finally:
+            self.workspaces.collect()
+
+    def _purge(self):
+        """Drop the oldest finished jobs and their outputs."""
+        finished = [job for job in self.jobs() if job.done]
+        finished.sort(key=lambda job: job.finished or job.created)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            if job.output:
+                try:
+                    os.remove(job.output)
+                except FileNotFoundError:
+                    pass
+            shutil.rmtree(job.directory, ignore_errors=True)
+
+
+scheduler = BuildScheduler()
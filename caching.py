@@ -0,0 +1,53 @@
+"""In-memory caches shared by the project, resource and APK builders."""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping holding at most ``size`` entries.
+
+    With ``max_bytes`` the entries' total ``sizeof`` is bounded as well;
+    a value larger than the whole budget is not cached at all.
+    """
+
+    def __init__(self, size, max_bytes=None, sizeof=len):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        nbytes = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._data[key] = (value, nbytes)
+            self.bytes += nbytes
+            while len(self._data) > self.size or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
@@ -0,0 +1,109 @@
+"""Circuit breaker for calls to an unreliable backend.
+
+Closed, every call goes through and consecutive failures are counted;
+``failure_threshold`` of them in a row open the circuit.  Open, ``allow``
+refuses calls so the caller answers from its fallback at once instead of
+waiting on a backend that is down.  After ``reset_timeout`` seconds the
+circuit is half-open: one call at a time is let through as a probe, and
+its outcome closes the circuit again or re-opens it for another
+``reset_timeout``.
+
+Only exceptions that ``counts(exc)`` accepts are failures; anything else
+(a rejected API key, say) shows the backend is up and counts as success.
+
+    if breaker.allow():
+        try:
+            result = call_backend()
+        except Exception as e:
+            breaker.record(e)
+            result = fallback()
+        else:
+            breaker.record()
+    else:
+        result = fallback()
+
+State is per process.  ``circuit_breaker_state`` on ``/metrics`` reports
+it (0 closed, 1 half-open, 2 open).
+"""
+import os
+import threading
+import time
+
+import metrics
+
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', 5))
+BREAKER_RESET_TIMEOUT = float(os.environ.get('BREAKER_RESET_TIMEOUT', 30))
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKERS = {}
+
+transitions = metrics.register(metrics.Counter(
+    'circuit_breaker_transitions_total', 'Circuit breaker state changes, by new state.', ('breaker', 'state')))
+metrics.register(metrics.Collector(
+    'circuit_breaker_state', 'Circuit breaker state: 0 closed, 1 half-open, 2 open.', ('breaker',),
+    lambda: {(name,): STATE_VALUES[breaker.state] for name, breaker in BREAKERS.items()}))
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_TIMEOUT,
+                 counts=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.counts = counts or (lambda exc: True)
+        self.failures = 0
+        self.opened_at = None
+        self._state = CLOSED
+        self._probing = False
+        self._lock = threading.Lock()
+        BREAKERS[name] = self
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def _set(self, state):
+        if state != self._state:
+            self._state = state
+            transitions.inc((self.name, state))
+
+    def allow(self):
+        """Whether a call may go to the backend now; a ``True`` must be followed by ``record``."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._set(HALF_OPEN)
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record(self, exc=None):
+        """Outcome of an allowed call: ``None`` for success, or the exception it raised."""
+        with self._lock:
+            self._probing = False
+            if exc is None or not self.counts(exc):
+                self.failures = 0
+                self._set(CLOSED)
+                return
+            self.failures += 1
+            if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set(OPEN)
+
+    def retry_after(self):
+        """Seconds until the next probe is allowed (0 unless open)."""
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
@@ -0,0 +1,82 @@
+"""Registry of the standalone HTML demo apps returned by ``/api/build-apk``.
+
+Each archetype is a plain HTML file under ``templates/demo/`` using
+``{{name}}`` placeholders, so CSS and JavaScript braces need no escaping.
+The files are read and split into literal/placeholder parts once at import
+time; rendering is a join, and rendered pages are cached per
+``(app_name, archetype, build_date)``.
+"""
+import html
+import os
+import re
+from functools import lru_cache
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'demo')
+
+# archetype -> (template file, description keywords that select it)
+ARCHETYPES = {
+    'weather': ('weather.html', (
+        'weather', 'forecast', 'temperature', 'rain', 'climate', 'wind', 'humidity',
+    )),
+    'fitness': ('fitness.html', (
+        'fitness', 'workout', 'exercise', 'calorie', 'calories', 'gym', 'health',
+        'steps', 'running', 'training',
+    )),
+    'list_detail': ('list_detail.html', (
+        'list', 'todo', 'task', 'tasks', 'note', 'notes', 'catalog', 'shop',
+        'shopping', 'recipe', 'recipes', 'contacts', 'inventory', 'library',
+    )),
+}
+
+# Used when the description matches no archetype (the original demo)
+DEFAULT_ARCHETYPE = 'weather'
+
+_PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+_WORD = re.compile(r'[a-z]+')
+
+
+class DemoTemplate:
+    """A template pre-split into alternating literal text and field names."""
+
+    def __init__(self, text):
+        parts = _PLACEHOLDER.split(text)
+        self.literals = parts[0::2]
+        self.fields = parts[1::2]
+
+    def render(self, **values):
+        out = [self.literals[0]]
+        for field, literal in zip(self.fields, self.literals[1:]):
+            out.append(html.escape(str(values[field])))
+            out.append(literal)
+        return ''.join(out)
+
+
+def _load_templates():
+    templates = {}
+    for archetype, (file_name, _) in ARCHETYPES.items():
+        with open(os.path.join(TEMPLATE_DIR, file_name), 'r', encoding='utf-8') as f:
+            templates[archetype] = DemoTemplate(f.read())
+    return templates
+
+
+TEMPLATES = _load_templates()
+
+
+def select_archetype(description):
+    """Pick the archetype whose keywords occur most often in ``description``."""
+    words = _WORD.findall((description or '').lower())
+    best, best_score = DEFAULT_ARCHETYPE, 0
+    for archetype, (_, keywords) in ARCHETYPES.items():
+        score = sum(1 for word in words if word in keywords)
+        if score > best_score:
+            best, best_score = archetype, score
+    return best
+
+
+@lru_cache(maxsize=256)
+def render_demo(app_name, archetype, build_date):
+    """Return the demo page for ``archetype`` as UTF-8 bytes."""
+    template = TEMPLATES.get(archetype)
+    if template is None:
+        raise ValueError(f'Unknown demo archetype: {archetype}')
+    return template.render(app_name=app_name, build_date=build_date).encode('utf-8')
@@ -0,0 +1,169 @@
+"""Single-pass classification of project files by their role.
+
+The export routes used to ask "does the project already have a manifest /
+strings.xml / MainActivity ...?" with one ``any(path.endswith(...))`` scan
+per question, and routed bare generator file names with a separate chain of
+``endswith`` checks.  ``build_index`` walks the file list once, classifying
+each path with dictionary lookups, and returns both a role index and the
+routing table, so every later question is a constant-time lookup.
+
+A ``build.gradle`` is the project (root) build script when a settings
+script sits next to it, or at the top of the tree; any other one belongs
+to a module.  So a project imported inside a subdirectory, such as
+``MyAwesomeApp/build.gradle`` beside ``MyAwesomeApp/settings.gradle``, is
+still recognised.
+"""
+from collections import defaultdict
+
+# Roles that are recognised by exact file name
+ROLE_BY_NAME = {
+    'build.gradle': 'module_build',
+    'build.gradle.kts': 'module_build',
+    'project_build.gradle': 'root_build',
+    'settings.gradle': 'settings',
+    'settings.gradle.kts': 'settings',
+    'gradle.properties': 'gradle_properties',
+    'gradle-wrapper.properties': 'wrapper_properties',
+    'gradle-wrapper.jar': 'wrapper_jar',
+    'gradlew': 'gradlew',
+    'gradlew.bat': 'gradlew_bat',
+    'AndroidManifest.xml': 'manifest',
+    'MainActivity.java': 'main_activity',
+    'MainActivity.kt': 'main_activity',
+    'activity_main.xml': 'main_layout',
+    'strings.xml': 'strings',
+    'colors.xml': 'colors',
+    'styles.xml': 'styles',
+    'themes.xml': 'themes',
+    'README.md': 'readme',
+    '.gitignore': 'gitignore',
+}
+
+# Fallback roles by extension
+ROLE_BY_EXTENSION = {
+    'java': 'source',
+    'kt': 'source',
+    'xml': 'values',
+}
+
+# Bare XML names with one of these prefixes are layouts rather than values
+LAYOUT_PREFIXES = ('activity_', 'fragment_', 'item_', 'dialog_', 'layout_')
+
+SETTINGS_NAMES = ('settings.gradle', 'settings.gradle.kts')
+
+# Bare generator names whose role differs from the same path in a project
+GENERATOR_ROLES = {
+    'build.gradle': 'module_build',
+    'build.gradle.kts': 'module_build',
+}
+
+# Where bare generator file names are placed, by role.  {package_dir} is the
+# package path of the app, {name} the file name itself.
+ROUTES = {
+    'module_build': 'app/{name}',
+    'root_build': 'build.gradle',
+    'manifest': 'app/src/main/AndroidManifest.xml',
+    'main_activity': 'app/src/main/java/{package_dir}/{name}',
+    'source': 'app/src/main/java/{package_dir}/{name}',
+    'main_layout': 'app/src/main/res/layout/{name}',
+    'layout': 'app/src/main/res/layout/{name}',
+    'strings': 'app/src/main/res/values/{name}',
+    'colors': 'app/src/main/res/values/{name}',
+    'styles': 'app/src/main/res/values/{name}',
+    'themes': 'app/src/main/res/values/{name}',
+    'values': 'app/src/main/res/values/{name}',
+    'wrapper_properties': 'gradle/wrapper/{name}',
+    'wrapper_jar': 'gradle/wrapper/{name}',
+}
+
+
+def normalize_path(path):
+    """Use forward slashes and drop leading ``/`` and ``./`` components."""
+    path = path.replace('\\', '/')
+    while path.startswith(('./', '/')):
+        path = path[1:] if path[0] == '/' else path[2:]
+    return path
+
+
+def root_directories(paths):
+    """Directories holding a Gradle root project: the top and any with a settings script."""
+    roots = {''}
+    for path in paths:
+        directory, _, name = path.rpartition('/')
+        if name in SETTINGS_NAMES:
+            roots.add(directory)
+    return roots
+
+
+def classify(path, roots=('',)):
+    """Return the role of a normalized project path.
+
+    ``roots`` are the directories of root projects (``root_directories``).
+    """
+    directory, slash, name = path.rpartition('/')
+    role = ROLE_BY_NAME.get(name)
+    if role is not None:
+        if role == 'module_build' and directory in roots:
+            return 'root_build'
+        return role
+    stem, dot, extension = name.rpartition('.')
+    role = ROLE_BY_EXTENSION.get(extension, 'other') if stem else 'other'
+    if role == 'values':
+        if not slash:
+            if name.startswith(LAYOUT_PREFIXES) or 'layout' in name:
+                return 'layout'
+        elif '/layout' in path:
+            return 'layout'
+        elif '/values' not in path:
+            return 'xml'
+    return role
+
+
+class FileIndex:
+    """Role index and routing table for one set of project files.
+
+    ``routes`` maps every input name to its path in the project tree and
+    ``roles`` maps each role to the routed paths that have it.
+    """
+
+    def __init__(self, routes, roles):
+        self.routes = routes
+        self.roles = roles
+
+    def has(self, role):
+        return role in self.roles
+
+    def paths(self, role):
+        return self.roles.get(role, ())
+
+
+def build_index(names, package, route=True):
+    """Classify and, if ``route`` is set, route ``names``.
+
+    Names are normalized (and settings scripts noted) first, then each
+    is classified and routed once.
+
+    With ``route`` a bare name such as ``build.gradle`` or ``strings.xml``
+    is treated as generator output and placed in the module layout; paths
+    that already contain a directory are always kept as they are.
+    """
+    package_dir = package.replace('.', '/')
+    paths = {}
+    for name in names:
+        path = name
+        if '\\' in path or path.startswith(('/', './')):
+            path = normalize_path(path)
+        paths[name] = path
+    roots = root_directories(paths.values())
+    routes = {}
+    roles = defaultdict(list)
+    for name, path in paths.items():
+        role = classify(path, roots)
+        if route and '/' not in path:
+            role = GENERATOR_ROLES.get(path, role)
+            template = ROUTES.get(role)
+            if template is not None:
+                path = template.format(package_dir=package_dir, name=path)
+        routes[name] = path
+        roles[role].append(path)
+    return FileIndex(routes, dict(roles))
@@ -0,0 +1,153 @@
+"""Gemini ``generateContent`` calls shared by the sync and async routes.
+
+``generate`` uses ``requests`` for the Flask routes and ``agenerate`` the
+async client for ``async_app``; both build the same request and go
+through ``parse_response``, so they fail with the same ``GeminiError``
+messages.  Each attempt waits for budget from ``rate_limits.limiter``,
+and transient failures are retried by ``retry_policy`` (see ``retries``).
+Calls without a key of their own take one from ``key_pool`` per attempt,
+so a retry after a quota error moves on to another key.
+"""
+import asyncio
+import os
+import time
+
+import requests
+
+import async_http
+import metrics
+from key_pool import PoolExhausted, key_pool
+from rate_limits import RateLimitExceeded, estimate_tokens, limiter
+from retries import RetryPolicy
+
+API_ROOT = os.environ.get('GEMINI_API_ROOT', 'https://generativelanguage.googleapis.com/v1beta/models')
+DEFAULT_MODEL = 'gemini-2.0-flash-exp'
+TIMEOUT = 30
+
+# Refusals of the request itself (bad key, bad model or prompt), not outages
+REJECTED_STATUS = frozenset((400, 401, 403, 404))
+
+# generateContent has no side effects, so failed calls can be repeated
+retry_policy = RetryPolicy('gemini')
+
+
+class GeminiError(Exception):
+    def __init__(self, message, status_code=None, error_class=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error_class = error_class
+
+
+def request_args(api_key, prompt, model=DEFAULT_MODEL):
+    """``(url, headers, payload)`` of a generateContent request."""
+    url = f'{API_ROOT}/{model}:generateContent?key={api_key}'
+    headers = {
+        'Content-Type': 'application/json',
+    }
+    payload = {
+        'contents': [{'parts': [{'text': prompt}]}]
+    }
+    return url, headers, payload
+
+
+def parse_response(status_code, text, result=None):
+    """Text of the first candidate, or ``GeminiError``."""
+    if status_code != 200:
+        error_detail = text if text else f'Status code: {status_code}'
+        raise GeminiError(f'API error: {error_detail}', status_code)
+    if 'candidates' in result and len(result['candidates']) > 0:
+        return result['candidates'][0]['content']['parts'][0]['text']
+    raise GeminiError('No response from API', error_class='empty_response')
+
+
+def used_tokens(result):
+    """``totalTokenCount`` of a response, if Gemini reported it."""
+    if isinstance(result, dict):
+        return result.get('usageMetadata', {}).get('totalTokenCount')
+    return None
+
+
+def reserve(api_key, prompt, model):
+    """``(budget, estimated tokens, seconds to wait)`` for a call."""
+    tokens = estimate_tokens(prompt)
+    try:
+        budget, wait = limiter.reserve(api_key, model, tokens)
+    except RateLimitExceeded as e:
+        raise GeminiError(str(e), error_class='rate_limited')
+    return budget, tokens, wait
+
+
+def settle(budget, tokens, status_code, result):
+    if status_code == 429:
+        budget.throttled()
+    budget.settle(tokens, used_tokens(result))
+
+
+def generate_once(api_key, prompt, model=DEFAULT_MODEL, timeout=TIMEOUT):
+    url, headers, payload = request_args(api_key, prompt, model)
+    budget, tokens, wait = reserve(api_key, prompt, model)
+    if wait:
+        time.sleep(wait)
+    with metrics.upstream('gemini'):
+        response = requests.post(url, headers=headers, json=payload, timeout=timeout)
+        result = response.json() if response.status_code == 200 else None
+        settle(budget, tokens, response.status_code, result)
+        return parse_response(response.status_code, response.text, result)
+
+
+async def agenerate_once(api_key, prompt, model=DEFAULT_MODEL, timeout=TIMEOUT):
+    url, headers, payload = request_args(api_key, prompt, model)
+    budget, tokens, wait = reserve(api_key, prompt, model)
+    if wait:
+        await asyncio.sleep(wait)
+    with metrics.upstream('gemini'):
+        response = await async_http.request('POST', url, json=payload, headers=headers, timeout=timeout)
+        result = response.json() if response.status_code == 200 else None
+        settle(budget, tokens, response.status_code, result)
+        return parse_response(response.status_code, response.text, result)
+
+
+def pooled_key():
+    try:
+        return key_pool.acquire()
+    except PoolExhausted as e:
+        raise GeminiError(str(e), error_class=e.error_class)
+
+
+def generate_pooled(api_key, prompt, model=DEFAULT_MODEL, timeout=TIMEOUT):
+    """``generate_once`` with a pooled key if ``api_key`` is pooled or empty."""
+    if not key_pool.serves(api_key):
+        return generate_once(api_key, prompt, model, timeout)
+    pooled = pooled_key()
+    try:
+        result = generate_once(pooled.key, prompt, model, timeout)
+    except Exception as e:
+        key_pool.release(pooled, e)
+        raise
+    key_pool.release(pooled)
+    return result
+
+
+async def agenerate_pooled(api_key, prompt, model=DEFAULT_MODEL, timeout=TIMEOUT):
+    if not key_pool.serves(api_key):
+        return await agenerate_once(api_key, prompt, model, timeout)
+    pooled = pooled_key()
+    try:
+        result = await agenerate_once(pooled.key, prompt, model, timeout)
+    except BaseException as e:
+        # Also a hedge cancelled after losing
+        key_pool.release(pooled, e if isinstance(e, Exception) else None)
+        raise
+    key_pool.release(pooled)
+    return result
+
+
+def generate(api_key, prompt, model=DEFAULT_MODEL, timeout=TIMEOUT):
+    """Text of the response, retrying transient failures; ``timeout`` is per attempt."""
+    return retry_policy.call(
+        lambda timeout: generate_pooled(api_key, prompt, model, timeout), timeout)
+
+
+async def agenerate(api_key, prompt, model=DEFAULT_MODEL, timeout=TIMEOUT):
+    return await retry_policy.acall(
+        lambda timeout: agenerate_pooled(api_key, prompt, model, timeout), timeout)
@@ -0,0 +1,112 @@
+"""Turn a GitHub repository archive into an Android Studio project zip.
+
+``parse_github_url`` and ``archive_url`` are cheap; ``download_archive``
+is network-bound and ``build_import_zip`` CPU-bound.  The latter is a
+plain top-level function of bytes so ``async_app`` can run it in a
+process pool.
+"""
+import os
+import zipfile
+from io import BytesIO
+
+import requests
+
+import metrics
+from memory_guard import checkpoint
+from project_assembly import ProjectModel, build_project_zip
+
+# Where archives are downloaded from; a mirror or local stand-in can replace it
+GITHUB_ROOT = os.environ.get('GITHUB_ROOT', 'https://github.com')
+DOWNLOAD_TIMEOUT = 60
+DOWNLOAD_CHUNK = 1024 * 1024
+
+
+class GitHubImportError(Exception):
+    """Import failure whose message is shown to the user as is."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_github_url(github_url):
+    """``(owner, repo)`` of an https or ssh GitHub URL.
+
+    Supports formats like:
+    - https://github.com/owner/repo
+    - https://github.com/owner/repo.git
+    - git@github.com:owner/repo.git
+    """
+    if 'github.com' not in github_url:
+        raise GitHubImportError('Invalid GitHub URL')
+
+    if github_url.startswith('git@github.com:'):
+        repo_part = github_url.split('git@github.com:')[1]
+    else:
+        repo_part = github_url.split('github.com/')[1]
+    if repo_part.endswith('.git'):
+        repo_part = repo_part[:-4]
+    owner_repo = repo_part.split('/')
+
+    if len(owner_repo) < 2:
+        raise GitHubImportError('Invalid GitHub repository format')
+    return owner_repo[0], owner_repo[1]
+
+
+def archive_url(owner, repo, branch):
+    return f'{GITHUB_ROOT}/{owner}/{repo}/archive/refs/heads/{branch}.zip'
+
+
+def check_download(status_code):
+    if status_code != 200:
+        raise GitHubImportError(f'Failed to download repository: HTTP {status_code}', status_code)
+
+
+def download_archive(owner, repo, branch, timeout=DOWNLOAD_TIMEOUT):
+    with metrics.upstream('github'):
+        response = requests.get(archive_url(owner, repo, branch), stream=True, timeout=timeout)
+        check_download(response.status_code)
+        chunks = []
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK):
+            chunks.append(chunk)
+            checkpoint()
+    return b''.join(chunks)
+
+
+def repository_files(archive):
+    """``{relative path: bytes}`` of a GitHub archive, minus its top directory."""
+    files = {}
+    with zipfile.ZipFile(BytesIO(archive)) as zf:
+        for info in zf.infolist():
+            checkpoint()
+            if info.is_dir():
+                continue
+            parts = info.filename.split('/')
+            rel_path = '/'.join(parts[1:])
+            if len(parts) < 2 or '..' in parts or info.filename.startswith('/'):
+                continue
+            files[rel_path] = zf.read(info)
+    if not files:
+        raise GitHubImportError('Failed to extract repository')
+    return files
+
+
+def build_import_zip(archive, app_name, github_url, branch):
+    """Project zip for a downloaded repository archive."""
+    repo_files = repository_files(archive)
+
+    is_android_project = (
+        any(path == 'app' or path.startswith('app/') for path in repo_files) and
+        'build.gradle' in repo_files and
+        'settings.gradle' in repo_files
+    )
+
+    # Android projects are passed through untouched; anything else gets
+    # the shared skeleton around it
+    model = ProjectModel(
+        app_name=app_name,
+        files=tuple(sorted(repo_files.items())),
+        readme=f'This project was imported from GitHub: {github_url}\nBranch: {branch}',
+        skeleton=not is_android_project,
+    )
+    return build_project_zip(model)
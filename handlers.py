@@ -0,0 +1,437 @@
+"""Request handling shared by the Flask and ASGI routes.
+
+``/api/test-gemini``, ``/api/generate-android-code``,
+``/api/regenerate-files`` and ``/api/import-from-github`` are served both
+by ``server`` (threads, blocking I/O) and by ``async_app`` (an event
+loop).  Each is written once here, as a generator that yields the I/O it
+needs -- ``Generate`` a Gemini completion, ``SaveKey``, ``Download`` a
+GitHub archive, ``Build`` an artifact -- and is sent the result back, or
+has the error thrown in at the ``yield``.  It returns the response: a
+JSON-able dict, or an ``Attachment`` for a stored artifact.
+
+``run`` drives a handler with blocking calls and ``arun`` with
+coroutines, so the entry points only translate requests and responses.
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import async_http
+import gemini_client
+import memory_guard
+import metrics
+from artifacts import artifact_key, artifacts
+from circuit_breaker import CircuitBreaker
+from gemini_client import REJECTED_STATUS, GeminiError
+from github_import import (
+    DOWNLOAD_TIMEOUT, GitHubImportError, archive_url, build_import_zip, check_download, download_archive,
+    parse_github_url,
+)
+from key_pool import CONFIG_PATH, key_pool
+from project_assembly import ProjectModel, skeleton_file
+from regeneration import RegenerationError, merge_files, parse_code_files, regeneration_prompt
+
+# /api/test-gemini without a client key spends the server's pooled keys,
+# so anonymous tests are refused unless this is set
+TEST_WITH_POOLED_KEYS = os.environ.get('GEMINI_TEST_POOLED_KEYS', '') not in ('', '0', 'false')
+
+# I/O a handler yields; see ``perform`` / ``aperform``
+Generate = namedtuple('Generate', 'api_key prompt')
+SaveKey = namedtuple('SaveKey', 'api_key')
+Download = namedtuple('Download', 'owner repo branch')
+# ``func(*args)`` (a picklable top-level function) builds the bytes of
+# artifact ``key``, counted by ``metrics.produced`` as ``kind``
+Build = namedtuple('Build', 'key kind func args download_name mimetype')
+
+# A built artifact to send back as the response
+Attachment = namedtuple('Attachment', 'build artifact hit')
+
+
+def save_api_key(api_key):
+    try:
+        # Create a secure way to store the API key, keeping the rest of the
+        # config (the key pool) intact
+        config_data = {}
+        if os.path.exists(CONFIG_PATH):
+            with open(CONFIG_PATH, 'r') as f:
+                config_data = json.load(f)
+        config_data.update({'api_key': api_key, 'last_saved': datetime.datetime.now().isoformat()})
+        with open(CONFIG_PATH, 'w') as f:
+            json.dump(config_data, f)
+    except Exception as e:
+        print(f"Error saving API key: {str(e)}")
+
+
+# Opens after consecutive Gemini outages (not rejected keys or local rate
+# limits) so generation falls back to the local template without waiting
+generation_breaker = CircuitBreaker('generation', counts=gemini_client.retry_policy.retryable)
+
+
+def android_code_prompt(app_name, app_description):
+    return f"""
+        Generate complete Android Studio project files for an app called "{app_name}".
+        App description: {app_description}
+        
+        Please provide:
+        1. MainActivity.java - Main activity with proper imports and functionality
+        2. activity_main.xml - Layout file with UI elements
+        3. AndroidManifest.xml - App manifest with proper permissions
+        4. build.gradle (app level) - Build configuration
+        5. strings.xml - String resources
+        6. colors.xml - Color resources
+        
+        Make it a functional, complete Android app. Use modern Android development practices.
+        Return the response in JSON format with each file as a separate key.
+        """
+
+
+def local_android_code(app_name, app_description):
+    """Pre-generated Android code used while the Gemini API is unavailable."""
+    # Create a mock response with basic Android app structure based on the app name and description
+    return {
+            "MainActivity.java": f"""package com.example.{app_name.lower()};
+
+import androidx.appcompat.app.AppCompatActivity;
+import android.os.Bundle;
+import android.widget.TextView;
+
+public class MainActivity extends AppCompatActivity {{
+    
+    private TextView welcomeTextView;
+    
+    @Override
+    protected void onCreate(Bundle savedInstanceState) {{
+        super.onCreate(savedInstanceState);
+        setContentView(R.layout.activity_main);
+        
+        welcomeTextView = findViewById(R.id.welcomeTextView);
+        welcomeTextView.setText("Welcome to {app_name}!");
+        
+        // TODO: Implement functionality based on: {app_description}
+    }}
+}}""",
+            "activity_main.xml": f"""<?xml version="1.0" encoding="utf-8"?>
+<androidx.constraintlayout.widget.ConstraintLayout 
+    xmlns:android="http://schemas.android.com/apk/res/android"
+    xmlns:app="http://schemas.android.com/apk/res-auto"
+    xmlns:tools="http://schemas.android.com/tools"
+    android:layout_width="match_parent"
+    android:layout_height="match_parent"
+    tools:context=".MainActivity">
+
+    <TextView
+        android:id="@+id/welcomeTextView"
+        android:layout_width="wrap_content"
+        android:layout_height="wrap_content"
+        android:text="Welcome to {app_name}!"
+        android:textSize="24sp"
+        android:textStyle="bold"
+        app:layout_constraintBottom_toBottomOf="parent"
+        app:layout_constraintLeft_toLeftOf="parent"
+        app:layout_constraintRight_toRightOf="parent"
+        app:layout_constraintTop_toTopOf="parent" />
+
+    <TextView
+        android:id="@+id/descriptionTextView"
+        android:layout_width="0dp"
+        android:layout_height="wrap_content"
+        android:layout_marginStart="16dp"
+        android:layout_marginEnd="16dp"
+        android:layout_marginTop="16dp"
+        android:text="{app_description}"
+        android:textAlignment="center"
+        app:layout_constraintLeft_toLeftOf="parent"
+        app:layout_constraintRight_toRightOf="parent"
+        app:layout_constraintTop_toBottomOf="@+id/welcomeTextView" />
+
+</androidx.constraintlayout.widget.ConstraintLayout>""",
+            "AndroidManifest.xml": f"""<?xml version="1.0" encoding="utf-8"?>
+<manifest xmlns:android="http://schemas.android.com/apk/res/android"
+    package="com.example.{app_name.lower()}">
+
+    <application
+        android:allowBackup="true"
+        android:icon="@mipmap/ic_launcher"
+        android:label="@string/app_name"
+        android:roundIcon="@mipmap/ic_launcher_round"
+        android:supportsRtl="true"
+        android:theme="@style/Theme.{app_name}">
+        <activity
+            android:name=".MainActivity"
+            android:exported="true">
+            <intent-filter>
+                <action android:name="android.intent.action.MAIN" />
+                <category android:name="android.intent.category.LAUNCHER" />
+            </intent-filter>
+        </activity>
+    </application>
+
+</manifest>""",
+            "build.gradle": skeleton_file(ProjectModel(app_name=app_name), 'app/build.gradle'),
+            "strings.xml": f"""<resources>
+    <string name="app_name">{app_name}</string>
+    <string name="welcome_message">Welcome to {app_name}!</string>
+    <string name="app_description">{app_description}</string>
+</resources>""",
+            "colors.xml": """<resources>
+    <color name="purple_200">#FFBB86FC</color>
+    <color name="purple_500">#FF6200EE</color>
+    <color name="purple_700">#FF3700B3</color>
+    <color name="teal_200">#FF03DAC5</color>
+    <color name="teal_700">#FF018786</color>
+    <color name="black">#FF000000</color>
+    <color name="white">#FFFFFFFF</color>
+</resources>""",
+            "styles.xml": f"""<resources>
+    <!-- Base application theme. -->
+    <style name="Theme.{app_name}" parent="Theme.MaterialComponents.DayNight.DarkActionBar">
+        <!-- Primary brand color. -->
+        <item name="colorPrimary">@color/purple_500</item>
+        <item name="colorPrimaryVariant">@color/purple_700</item>
+        <item name="colorOnPrimary">@color/white</item>
+        <!-- Secondary brand color. -->
+        <item name="colorSecondary">@color/teal_200</item>
+        <item name="colorSecondaryVariant">@color/teal_700</item>
+        <item name="colorOnSecondary">@color/black</item>
+        <!-- Status bar color. -->
+        <item name="android:statusBarColor">?attr/colorPrimaryVariant</item>
+    </style>
+</resources>"""
+        }
+
+
+def test_gemini(data):
+    api_key = data.get('api_key')
+    prompt = data.get('prompt')
+    # Only a key the client sent can be saved
+    save_key = data.get('save_key', False) and bool(api_key)
+
+    if not api_key and not (TEST_WITH_POOLED_KEYS and key_pool.keys()):
+        return {'status': 'error', 'message': 'API key required'}
+
+    # Test Gemini API connection
+    try:
+        try:
+            content = yield Generate(api_key, prompt)
+        except GeminiError as e:
+            return {'status': 'error', 'message': str(e)}
+
+        # Save API key if requested
+        if save_key:
+            yield SaveKey(api_key)
+
+        return {
+            'status': 'success',
+            'message': 'API connection successful' + (' and saved' if save_key else ''),
+            'response': content
+        }
+
+    except Exception as e:
+        return {'status': 'error', 'message': f'Connection failed: {str(e)}'}
+
+
+def generate_android_code(data):
+    api_key = data.get('api_key')
+    app_description = data.get('description', '')
+    app_name = data.get('appName', 'MyApp')
+
+    if not api_key and not key_pool.keys():
+        return {'status': 'error', 'message': 'API key required'}
+
+    try:
+        # Gemini unless the breaker is open or the call fails; the local
+        # template always answers, and the response says which one did
+        reason = 'Gemini is unavailable'
+        if generation_breaker.allow():
+            try:
+                content = yield Generate(api_key, android_code_prompt(app_name, app_description))
+            except Exception as e:
+                generation_breaker.record(e)
+                if isinstance(e, GeminiError) and e.status_code in REJECTED_STATUS:
+                    # The request itself was refused (bad key, bad prompt)
+                    return {'status': 'error', 'message': str(e)}
+                reason = str(e)
+            else:
+                generation_breaker.record()
+                return {
+                    'status': 'success',
+                    'code': content,
+                    'backend': 'gemini',
+                    'message': 'Android code generated successfully'
+                }
+
+        content = json.dumps(local_android_code(app_name, app_description), indent=2)
+        return {
+            'status': 'success',
+            'code': content,
+            'backend': 'local-template',
+            'fallbackReason': reason,
+            'message': 'Android code generated successfully (using local template)'
+        }
+
+    except Exception as e:
+        return {'status': 'error', 'message': f'Generation failed: {str(e)}'}
+
+
+def regenerate_files(data):
+    api_key = data.get('api_key')
+    app_description = data.get('description', '')
+    app_name = data.get('appName', 'MyApp')
+    targets = data.get('files') or []
+    instructions = data.get('instructions', '')
+
+    if not api_key and not key_pool.keys():
+        return {'status': 'error', 'message': 'API key required'}
+    if not isinstance(targets, list) or not targets:
+        return {'status': 'error', 'message': 'Select the files to regenerate'}
+
+    try:
+        # Only the selected files are generated; the others are context
+        current = parse_code_files(data.get('code') or {})
+        if not generation_breaker.allow():
+            return {'status': 'error',
+                    'message': f'Gemini is unavailable, retry in {generation_breaker.retry_after():.0f} s'}
+        try:
+            output = yield Generate(
+                api_key, regeneration_prompt(app_name, app_description, current, targets, instructions))
+        except Exception as e:
+            generation_breaker.record(e)
+            return {'status': 'error', 'message': str(e)}
+        generation_breaker.record()
+
+        merged, missing = merge_files(current, parse_code_files(output), targets)
+        regenerated = [name for name in targets if name not in missing]
+        return {
+            'status': 'success',
+            'code': json.dumps(merged, indent=2),
+            'regenerated': regenerated,
+            'missing': missing,
+            'backend': 'gemini',
+            'message': f'Regenerated {len(regenerated)} of {len(targets)} files'
+        }
+
+    except RegenerationError as e:
+        return {'status': 'error', 'message': str(e)}
+    except Exception as e:
+        return {'status': 'error', 'message': f'Regeneration failed: {str(e)}'}
+
+
+def import_from_github(data):
+    github_url = data.get('github_url', '')
+    app_name = data.get('appName', 'ImportedApp')
+    branch = data.get('branch', 'main')
+
+    if not github_url:
+        return {'status': 'error', 'message': 'GitHub URL is required'}
+
+    # Extract repository owner and name from GitHub URL
+    try:
+        owner, repo = parse_github_url(github_url)
+    except GitHubImportError as e:
+        return {'status': 'error', 'message': str(e)}
+    except Exception as e:
+        return {'status': 'error', 'message': f'Failed to parse GitHub URL: {str(e)}'}
+
+    try:
+        # Download the repository as a zip file and repackage it; the
+        # download is keyed by content, since a branch moves
+        archive = yield Download(owner, repo, branch)
+        build = Build(
+            artifact_key('github-import', archive=hashlib.sha256(archive).hexdigest(),
+                         app_name=app_name, github_url=github_url, branch=branch),
+            'import_zip', build_import_zip, (archive, app_name, github_url, branch),
+            f'{app_name}_android_studio_project.zip', 'application/zip')
+        artifact, hit = yield build
+        return Attachment(build, artifact, hit)
+
+    except GitHubImportError as e:
+        return {'status': 'error', 'message': str(e)}
+    except Exception as e:
+        return {'status': 'error', 'message': f'Failed to process repository: {str(e)}'}
+
+
+def build_artifact(build, func=None):
+    """``(artifact, hit)`` for ``build``, calling ``func`` (default ``build.func``) on a miss."""
+    func = func or build.func
+    return artifacts.get_or_build(build.key, lambda: metrics.produced(build.kind, func(*build.args)),
+                                  build.download_name, build.mimetype)
+
+
+def perform(op):
+    """Carry out ``op`` with blocking calls."""
+    if isinstance(op, Generate):
+        return gemini_client.generate(op.api_key, op.prompt)
+    if isinstance(op, SaveKey):
+        return save_api_key(op.api_key)
+    if isinstance(op, Download):
+        return download_archive(op.owner, op.repo, op.branch)
+    if isinstance(op, Build):
+        return build_artifact(op)
+    raise TypeError(f'Unknown handler request: {op!r}')
+
+
+async def aperform(op, processes=None, route=None):
+    """Carry out ``op`` on the event loop; CPU-bound builds run in ``processes``.
+
+    On a ``route`` that ``memory_guard`` tracks, downloads are held to the
+    memory ceiling and builds are accounted like the Flask route's.
+    """
+    tracked = memory_guard.tracker.enabled and route in memory_guard.TRACKED_ROUTES
+    if isinstance(op, Generate):
+        return await gemini_client.agenerate(op.api_key, op.prompt)
+    if isinstance(op, SaveKey):
+        return await asyncio.to_thread(save_api_key, op.api_key)
+    if isinstance(op, Download):
+        with metrics.upstream('github'):
+            ceiling = memory_guard.tracker.ceiling if tracked else 0
+            try:
+                response = await async_http.request('GET', archive_url(op.owner, op.repo, op.branch),
+                                                    timeout=DOWNLOAD_TIMEOUT, max_bytes=ceiling or None)
+            except async_http.ResponseTooLarge:
+                memory_guard.ceiling_aborts.inc((route,))
+                raise memory_guard.MemoryCeilingExceeded(memory_guard.ceiling_message(ceiling))
+            check_download(response.status_code)
+        return response.content
+    if isinstance(op, Build):
+        if processes is None:
+            call = lambda func, *args: func(*args)
+        else:
+            # The store runs on a thread; only the build itself goes to a process
+            call = lambda func, *args: processes.submit(func, *args).result()
+        if tracked:
+            build = lambda *args: memory_guard.run_tracked(route, call, op.func, *args)
+        else:
+            build = lambda *args: call(op.func, *args)
+        return await asyncio.to_thread(build_artifact, op, build)
+    raise TypeError(f'Unknown handler request: {op!r}')
+
+
+def run(handler):
+    """Drive the generator ``handler`` with blocking I/O; returns its response."""
+    value, error = None, None
+    while True:
+        try:
+            op = handler.send(value) if error is None else handler.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = perform(op), None
+        except Exception as e:
+            value, error = None, e
+
+
+async def arun(handler, processes=None, route=None):
+    """Drive the generator ``handler`` for ``route`` on the event loop; returns its response."""
+    value, error = None, None
+    while True:
+        try:
+            op = handler.send(value) if error is None else handler.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, error = await aperform(op, processes, route), None
+        except Exception as e:
+            value, error = None, e
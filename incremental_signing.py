@@ -0,0 +1,312 @@
+"""Incremental re-signing of an APK after a small change.
+
+A full build digests every entry for the v1 manifest, writes the whole zip
+and digests every 1 MiB chunk of it for v2/v3.  ``resign`` keeps a state
+file next to the APK recording, per entry, a change stamp, its SHA-256
+digest and where its local header sits, plus the v2 digest of each chunk
+of the entries section.  The stamp of an in-memory entry is its SHA-256
+(the same digest v1 needs); files and entries copied from another zip
+use their size and mtime or CRC and sizes, so they are not re-read.  On the next build only entries whose stamp
+changed are read, digested and compressed; when each new entry fits the
+slot of the old one it is written over it in place, and only the chunks
+those writes touched are digested again.
+
+The layout is kept patchable by two choices made on the full build: the v1
+signature files are stored uncompressed, so they keep their size when only
+digests change, and every compressed entry gets ``RESERVE`` spare header
+bytes to absorb modest growth.  Anything that does not fit (added or
+removed entries, large growth, a missing or stale state file) falls back
+to a full build, which also restores the spare bytes.
+
+``/api/sign-apk`` keeps one signed APK per project in ``SignedApks``
+(under ``SIGNED_APK_DIR``) and brings it up to date with ``resign``.
+"""
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import metrics
+
+from apk_signing import (
+    CONTENT_CHUNK_SIZE, ApkLayout, ApkSource, chunk_digests, digest_entries,
+    is_signature_entry, open_entry, signed_tail, v1_signature_files,
+)
+from apk_writer import (
+    ApkWriter, RawEntry, alignment_for, central_directory, entry_order,
+    local_header, padding_extra, should_store,
+)
+from workspaces import workspace_name
+
+STATE_VERSION = 2
+STATE_SUFFIX = '.signstate'
+
+SIGNED_APK_DIR = os.environ.get('SIGNED_APK_DIR', os.path.join('data', 'signed'))
+
+# Spare header bytes given to every compressed entry on a full build
+RESERVE = 256
+
+_LOCAL_HEADER_SIZE = 30
+
+# Central directory fields of one entry, as kept in the state file
+_Entry = namedtuple('_Entry', 'name flags method crc compress_size file_size offset')
+
+signings = metrics.register(metrics.Counter(
+    'apk_signings_total', 'APK signings by how much work they took.', ('mode',)))
+
+
+def state_path_for(apk_path):
+    return os.fspath(apk_path) + STATE_SUFFIX
+
+
+def entry_stamp(source, digest=None):
+    """A value that changes whenever the entry's content does.
+
+    In-memory content is stamped with its SHA-256: pass ``digest`` when
+    it is already known.
+    """
+    if isinstance(source, RawEntry):
+        info = source.info
+        return ['raw', info.CRC, info.compress_size, info.file_size]
+    if isinstance(source, os.PathLike):
+        st = os.stat(source)
+        return ['file', st.st_size, st.st_mtime_ns]
+    if digest is None:
+        digest = hashlib.sha256(source.encode('utf-8') if isinstance(source, str) else source).digest()
+    return ['sha256', digest.hex()]
+
+
+def _signer_id(signer):
+    return hashlib.sha256(signer.certificate.der).hexdigest()
+
+
+def _encode(name, source, compress, compresslevel=6):
+    """Digest and compress one entry: ``(digest, method, crc, payload, size)``."""
+    with open_entry(source) as stream:
+        data = stream.read()
+    payload = data
+    method = 0
+    if compress:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+        payload = compressor.compress(data) + compressor.flush()
+        method = 8
+    return hashlib.sha256(data).digest(), method, zlib.crc32(data), payload, len(data)
+
+
+def load_state(state_path, apk_path):
+    """The saved state, or ``None`` if missing or not for the APK on disk."""
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        st = os.stat(apk_path)
+    except (OSError, ValueError):
+        return None
+    if state.get('version') != STATE_VERSION or \
+            [st.st_size, st.st_mtime_ns] != [state.get('size'), state.get('mtime_ns')]:
+        return None
+    return state
+
+
+def _save_state(state_path, apk_path, state):
+    st = os.stat(apk_path)
+    state.update(version=STATE_VERSION, size=st.st_size, mtime_ns=st.st_mtime_ns)
+    tmp = state_path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, state_path)
+
+
+def _entry_states(records, entries_end, digests, stamps):
+    """Per-entry state in central directory order, with each entry's slot."""
+    by_offset = sorted(records, key=lambda r: r.offset)
+    ends = {r.offset: nxt.offset for r, nxt in zip(by_offset, by_offset[1:])}
+    states = []
+    for r in records:
+        name = r.name.decode('utf-8')
+        states.append({
+            'name': name,
+            'flags': r.flags,
+            'method': r.method,
+            'crc': r.crc,
+            'compress_size': r.compress_size,
+            'file_size': r.file_size,
+            'offset': r.offset,
+            'slot': ends.get(r.offset, entries_end) - r.offset,
+            'digest': digests[name].hex() if name in digests else None,
+            'stamp': stamps.get(name),
+        })
+    return states
+
+
+def sign_full(apk_path, entries, signer, schemes=(2, 3), workers=None,
+              reserve=RESERVE, state_path=None):
+    """Build and sign ``apk_path`` from scratch and save its re-signing state."""
+    state_path = state_path or state_path_for(apk_path)
+    unsigned = {name: source for name, source in entries.items() if not is_signature_entry(name)}
+    digests = digest_entries(unsigned, workers)
+    signature_files = v1_signature_files(digests, signer, schemes)
+
+    with open(apk_path, 'w+b') as f:
+        writer = ApkWriter(f, reserve=reserve)
+        for name in sorted([*unsigned, *signature_files], key=entry_order):
+            if name in signature_files:
+                writer.write_bytes(name, signature_files[name], compress=False)
+            else:
+                writer.write_entry(name, unsigned[name])
+        writer.close()
+        f.flush()
+
+        source = ApkSource(fd=f.fileno())
+        layout = ApkLayout(source)
+        chunks = chunk_digests(source, layout.block_offset, workers=workers)
+        f.seek(layout.block_offset)
+        f.write(signed_tail(signer, source, layout, schemes, workers, chunks))
+        f.truncate()
+
+    stamps = {name: entry_stamp(source, digests[name]) for name, source in unsigned.items()}
+    _save_state(state_path, apk_path, {
+        'signer': _signer_id(signer),
+        'schemes': list(schemes),
+        'entries_end': layout.block_offset,
+        'entries': _entry_states(writer.records, layout.block_offset, digests, stamps),
+        'chunks': [digest.hex() for digest in chunks],
+    })
+    return {'mode': 'full', 'changed': sorted(unsigned), 'chunks': len(chunks)}
+
+
+def _fits(name, entry, payload, method):
+    """Extra field size that makes the new entry fill the old slot, or None."""
+    header_size = _LOCAL_HEADER_SIZE + len(name.encode('utf-8'))
+    extra = entry['slot'] - header_size - len(payload)
+    if extra < 0 or 0 < extra < 6:
+        return None
+    if method == 0 and (entry['offset'] + header_size + extra) % alignment_for(name):
+        return None
+    return extra
+
+
+def resign(apk_path, entries, signer, schemes=(2, 3), workers=None,
+           reserve=RESERVE, state_path=None):
+    """Bring the signed APK at ``apk_path`` up to date with ``entries``.
+
+    ``entries`` is the full entry map, as for ``write_apk``.  Returns a
+    summary with ``mode`` (``'unchanged'``, ``'patched'`` or ``'full'``),
+    the entries that were re-read and the number of chunks digested.
+    """
+    state_path = state_path or state_path_for(apk_path)
+    state = load_state(state_path, apk_path)
+    unsigned = {name: source for name, source in entries.items() if not is_signature_entry(name)}
+
+    def full():
+        return sign_full(apk_path, entries, signer, schemes, workers, reserve, state_path)
+
+    if state is None:
+        return full()
+    known = {e['name']: e for e in state['entries'] if e['stamp'] is not None}
+    if set(known) != set(unsigned):
+        return full()
+
+    stamps = {name: entry_stamp(source) for name, source in unsigned.items()}
+    changed = sorted(name for name in unsigned if stamps[name] != known[name]['stamp'])
+    same_signer = state['signer'] == _signer_id(signer) and state['schemes'] == list(schemes)
+    if not changed and same_signer:
+        return {'mode': 'unchanged', 'changed': [], 'chunks': 0}
+
+    workers = workers or min(32, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        encoded = dict(zip(changed, pool.map(
+            lambda name: _encode(name, unsigned[name], not should_store(name)), changed)))
+
+    digests = {e['name']: bytes.fromhex(e['digest']) for e in known.values()}
+    digests.update((name, value[0]) for name, value in encoded.items())
+    for name, data in v1_signature_files(digests, signer, schemes).items():
+        encoded[name] = (None, 0, zlib.crc32(data), data, len(data))
+
+    by_name = {e['name']: e for e in state['entries']}
+    if set(by_name) != set(known) | {n for n in encoded if is_signature_entry(n)}:
+        return full()
+    patches = []
+    for name, (digest, method, crc, payload, file_size) in encoded.items():
+        entry = by_name[name]
+        extra = _fits(name, entry, payload, method)
+        if extra is None:
+            return full()
+        header = local_header(name.encode('utf-8'), method, crc, len(payload), file_size,
+                              padding_extra(extra, alignment_for(name) if method == 0 else 1),
+                              entry['flags'])
+        patches.append((entry['offset'], header + payload))
+        entry.update(method=method, crc=crc, compress_size=len(payload), file_size=file_size,
+                     digest=digest.hex() if digest else None, stamp=stamps.get(name))
+
+    entries_end = state['entries_end']
+    chunks = [bytes.fromhex(digest) for digest in state['chunks']]
+    dirty = set()
+    with open(apk_path, 'r+b') as f:
+        for offset, data in patches:
+            f.seek(offset)
+            f.write(data)
+            dirty.update(range(offset // CONTENT_CHUNK_SIZE,
+                               (offset + len(data) - 1) // CONTENT_CHUNK_SIZE + 1))
+        f.flush()
+
+        source = ApkSource(fd=f.fileno())
+        layout = ApkLayout(source)
+        records = [_Entry(e['name'].encode('utf-8'), e['flags'], e['method'], e['crc'],
+                          e['compress_size'], e['file_size'], e['offset'])
+                   for e in state['entries']]
+        directory = central_directory(records, layout.cd_offset)
+        layout.central_directory, layout.eocd = directory[:-22], directory[-22:]
+
+        indices = sorted(dirty)
+        for index, digest in zip(indices, chunk_digests(source, entries_end, indices, workers)):
+            chunks[index] = digest
+        f.seek(entries_end)
+        f.write(signed_tail(signer, source, layout, schemes, workers, chunks))
+        f.truncate()
+
+    state.update(signer=_signer_id(signer), schemes=list(schemes),
+                 chunks=[digest.hex() for digest in chunks])
+    _save_state(state_path, apk_path, state)
+    return {'mode': 'patched', 'changed': changed, 'chunks': len(indices)}
+
+
+class SignedApks:
+    """One signed APK per project, re-signed incrementally as it changes.
+
+    Calls for the same project are serialized, across worker processes
+    too where ``fcntl`` is available.
+    """
+
+    def __init__(self, directory=SIGNED_APK_DIR):
+        self.directory = directory
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, project):
+        return os.path.join(self.directory, workspace_name(project) + '.apk')
+
+    def sign(self, project, entries, signer, schemes=(2, 3)):
+        """``(signed APK bytes, resign summary)`` for ``entries``."""
+        path = self.path_for(project)
+        with self._lock:
+            lock = self._locks.setdefault(path, threading.Lock())
+        os.makedirs(self.directory, exist_ok=True)
+        with lock, open(path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            summary = resign(path, entries, signer, schemes)
+            with open(path, 'rb') as f:
+                data = f.read()
+        signings.inc((summary['mode'],))
+        return data, summary
+
+
+signed_apks = SignedApks()
@@ -0,0 +1,205 @@
+"""Pool of server-side Gemini API keys with load balancing and quarantine.
+
+Keys come from ``data/config.json``: the saved ``api_key`` plus an
+optional ``api_keys`` list of strings or ``{"key": ..., "weight": n}``
+objects, and from ``GEMINI_API_KEYS`` (``key[:weight],...``).  The file
+is re-read when it changes.
+
+A call whose request carries no key, or one of the pooled keys (the
+browser sends the saved key back), is served by the pool: every attempt
+takes a key by smooth weighted round-robin or, with ``key_selection`` /
+``GEMINI_KEY_SELECTION`` set to ``least_loaded``, the key with the fewest
+calls in flight per unit of weight.  Any other key is used as given.
+Each key has its own ``rate_limits`` budget, so throughput grows with
+the number of keys.
+
+A key that hits its quota (429) is quarantined for
+``GEMINI_KEY_QUARANTINE`` seconds, doubling while it keeps failing, and
+skipped until then; a key Gemini refuses as invalid is set aside for
+``MAX_QUARANTINE``.  Requests, failures and quarantines are tracked
+per key and served at ``/api/key-pool`` and on ``/metrics``, with keys
+shown only by ``rate_limits.key_id``.
+"""
+import json
+import os
+import threading
+import time
+
+import metrics
+from rate_limits import key_id
+
+CONFIG_PATH = os.path.join('data', 'config.json')
+GEMINI_API_KEYS = os.environ.get('GEMINI_API_KEYS', '')
+GEMINI_KEY_SELECTION = os.environ.get('GEMINI_KEY_SELECTION', '')
+GEMINI_KEY_QUARANTINE = float(os.environ.get('GEMINI_KEY_QUARANTINE', 60))
+MAX_QUARANTINE = 3600
+
+SELECTIONS = ('round_robin', 'least_loaded')
+QUOTA_STATUS = frozenset((429,))
+REFUSED_STATUS = frozenset((401, 403))
+
+key_calls = metrics.register(metrics.Counter(
+    'gemini_key_calls_total', 'Gemini calls made with pooled keys, by key and outcome.', ('key', 'outcome')))
+
+
+class PoolExhausted(Exception):
+    error_class = 'keys_quarantined'
+
+
+class PooledKey:
+    def __init__(self, key, weight=1):
+        self.key = key
+        self.id = key_id(key)
+        self.weight = max(1, int(weight))
+        self.current = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.quarantines = 0
+        self.strikes = 0
+        self.quarantined_until = 0.0
+
+    def available(self, now):
+        return self.quarantined_until <= now
+
+    def to_dict(self, now):
+        return {
+            'id': self.id,
+            'weight': self.weight,
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'failures': self.failures,
+            'quarantines': self.quarantines,
+            'quarantined_for': round(max(0.0, self.quarantined_until - now), 1),
+        }
+
+
+def parse_keys(entries):
+    """``[(key, weight)]`` from config entries: strings, ``key:weight`` or dicts."""
+    keys = []
+    for entry in entries:
+        if isinstance(entry, dict):
+            if entry.get('key'):
+                keys.append((entry['key'], entry.get('weight', 1)))
+        elif isinstance(entry, str) and entry.strip():
+            key, _, weight = entry.strip().partition(':')
+            keys.append((key, int(weight) if weight.isdigit() else 1))
+    return keys
+
+
+class KeyPool:
+    def __init__(self, config_path=CONFIG_PATH, env_keys=GEMINI_API_KEYS, selection=GEMINI_KEY_SELECTION,
+                 quarantine=GEMINI_KEY_QUARANTINE):
+        self.config_path = config_path
+        self.env_keys = parse_keys(env_keys.split(','))
+        self.env_selection = selection
+        self.selection = selection or 'round_robin'
+        self.quarantine = quarantine
+        self._keys = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Re-read the config if it changed; call with the lock held."""
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._loaded:
+            return
+        config = {}
+        if mtime is not None:
+            try:
+                with open(self.config_path) as f:
+                    config = json.load(f)
+            except (OSError, ValueError):
+                # Likely caught mid-write: keep the old keys and retry next call
+                return
+        entries = [config['api_key']] if config.get('api_key') else []
+        keys = parse_keys(entries + list(config.get('api_keys') or [])) + self.env_keys
+        selection = self.env_selection or config.get('key_selection') or 'round_robin'
+        if selection not in SELECTIONS:
+            raise ValueError(f'Unknown key selection: {selection}')
+        self.selection = selection
+        previous, self._keys = self._keys, {}
+        for key, weight in keys:
+            # Keep the usage and quarantine of keys that stay in the pool
+            pooled = previous.get(key) or PooledKey(key, weight)
+            pooled.weight = max(1, int(weight))
+            self._keys[key] = pooled
+        self._loaded = mtime
+
+    def keys(self):
+        with self._lock:
+            self._load()
+            return list(self._keys.values())
+
+    def serves(self, api_key):
+        """Whether calls with ``api_key`` (possibly empty) go through the pool."""
+        with self._lock:
+            self._load()
+            return bool(self._keys) and (not api_key or api_key in self._keys)
+
+    def acquire(self):
+        """Take a key for one call; must be followed by ``release``."""
+        with self._lock:
+            self._load()
+            now = time.monotonic()
+            candidates = [k for k in self._keys.values() if k.available(now)]
+            if not candidates:
+                wait = min((k.quarantined_until - now for k in self._keys.values()), default=0)
+                raise PoolExhausted(f'All Gemini API keys are quarantined; the next one is back in {wait:.0f} s')
+            if self.selection == 'least_loaded':
+                chosen = min(candidates, key=lambda k: (k.in_flight / k.weight, k.requests / k.weight))
+            else:
+                # Smooth weighted round-robin: spreads a heavy key's turns out
+                total = sum(k.weight for k in candidates)
+                for k in candidates:
+                    k.current += k.weight
+                chosen = max(candidates, key=lambda k: k.current)
+                chosen.current -= total
+            chosen.in_flight += 1
+            chosen.requests += 1
+            return chosen
+
+    def release(self, pooled, exc=None):
+        """Record the outcome of a call made with ``pooled``."""
+        status = getattr(exc, 'status_code', None)
+        refused = status in REFUSED_STATUS or (status == 400 and 'API_KEY_INVALID' in str(exc))
+        with self._lock:
+            pooled.in_flight -= 1
+            if exc is None:
+                pooled.strikes = 0
+                key_calls.inc((pooled.id, 'ok'))
+                return
+            pooled.failures += 1
+            if status in QUOTA_STATUS or refused:
+                pooled.strikes += 1
+                pooled.quarantines += 1
+                seconds = MAX_QUARANTINE if refused else min(
+                    MAX_QUARANTINE, self.quarantine * 2 ** (pooled.strikes - 1))
+                pooled.quarantined_until = time.monotonic() + seconds
+                key_calls.inc((pooled.id, 'quarantined'))
+            else:
+                key_calls.inc((pooled.id, 'error'))
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            now = time.monotonic()
+            return {
+                'selection': self.selection,
+                'keys': [k.to_dict(now) for k in self._keys.values()],
+            }
+
+    def collect(self, field):
+        return lambda: {(k['id'],): k[field] for k in self.stats()['keys']}
+
+
+key_pool = KeyPool()
+
+metrics.register(metrics.Collector(
+    'gemini_key_in_flight', 'Gemini calls in flight per pooled key.', ('key',), key_pool.collect('in_flight')))
+metrics.register(metrics.Collector(
+    'gemini_key_quarantine_seconds', 'Seconds until a quarantined pooled key is used again.', ('key',),
+    key_pool.collect('quarantined_for')))
@@ -0,0 +1,173 @@
+"""Per-request memory accounting and ceiling for the archive-building routes.
+
+The zip and APK builders hold whole archives in memory, so one big import
+can grow the process by gigabytes.  With ``MEMORY_TRACKING=1`` (implied
+by a ``MEMORY_CEILING_BYTES``) the routes in ``TRACKED_ROUTES`` run under
+``tracemalloc``; each request records how far traced memory peaked above
+where it started, as the ``request_peak_memory_bytes`` metric and, in
+debug mode, the ``X-Peak-Memory`` response header.
+
+The builders call ``checkpoint()`` between entries.  Once a request has
+grown traced memory by more than ``MEMORY_CEILING_BYTES`` it raises
+``MemoryCeilingExceeded``, which the route reports like any other build
+error, and the partial archive is garbage-collected.  ``checkpoint`` is
+a thread-local lookup when tracking is off, and tracing only runs while
+a tracked request is in progress.
+
+``async_app`` serves ``/api/import-from-github`` itself: the build runs
+through ``run_tracked`` in its worker process, under the same ceiling,
+and the archive download is cut off once it alone exceeds the ceiling.
+
+tracemalloc sees the whole process, so requests that overlap share
+growth: the figures are an upper bound for each, and a ceiling should be
+sized for the concurrency the server runs with.  tracemalloc also slows
+allocation noticeably, which is why it is opt-in.
+"""
+import os
+import threading
+import tracemalloc
+
+import metrics
+
+MEMORY_CEILING_BYTES = int(os.environ.get('MEMORY_CEILING_BYTES', 0))
+MEMORY_TRACKING = os.environ.get('MEMORY_TRACKING', '') not in ('', '0', 'false') or MEMORY_CEILING_BYTES > 0
+
+TRACKED_ROUTES = frozenset((
+    '/api/export-project',
+    '/api/prepare-for-android-studio',
+    '/api/import-from-github',
+    '/api/build-apk',
+    '/api/sign-apk',
+))
+
+_local = threading.local()
+
+peak_memory = metrics.register(metrics.Histogram(
+    'request_peak_memory_bytes', 'Traced memory growth at the peak of a request.', ('route',),
+    buckets=[2 ** n for n in range(20, 34)]))
+ceiling_aborts = metrics.register(metrics.Counter(
+    'memory_ceiling_aborts_total', 'Requests aborted for exceeding the memory ceiling.', ('route',)))
+
+
+class MemoryCeilingExceeded(MemoryError):
+    pass
+
+
+def checkpoint():
+    """Raise ``MemoryCeilingExceeded`` if this request is over its ceiling."""
+    limit = getattr(_local, 'limit', None)
+    if limit is not None and tracemalloc.get_traced_memory()[0] > limit:
+        _local.aborted = True
+        raise MemoryCeilingExceeded(ceiling_message(_local.ceiling))
+
+
+def ceiling_message(ceiling):
+    return f'request exceeded the memory ceiling of {ceiling // (1024 * 1024)} MiB'
+
+
+def record(route, peak, aborted):
+    """Record the peak growth of a tracked request on ``route``."""
+    peak_memory.observe(peak, (route,))
+    if aborted:
+        ceiling_aborts.inc((route,))
+
+
+class MemoryTracker:
+    def __init__(self, ceiling=MEMORY_CEILING_BYTES, enabled=MEMORY_TRACKING):
+        self.ceiling = ceiling
+        self.enabled = enabled
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def begin(self):
+        """Start accounting for the current request; returns a token."""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            if self._active == 0:
+                # Only reset the shared peak when no other request is measuring
+                tracemalloc.reset_peak()
+            self._active += 1
+            start = tracemalloc.get_traced_memory()[0]
+        if self.ceiling:
+            _local.limit = start + self.ceiling
+            _local.ceiling = self.ceiling
+        _local.aborted = False
+        return start
+
+    def end(self, start):
+        """Stop accounting; returns ``(peak growth in bytes, aborted)``."""
+        _local.limit = None
+        with self._lock:
+            peak = max(0, tracemalloc.get_traced_memory()[1] - start)
+            self._active -= 1
+            if self._active == 0:
+                # Nothing is measuring: stop tracing so other requests run at full speed
+                tracemalloc.stop()
+        return peak, _local.aborted
+
+    def call(self, func, *args):
+        """``(func(*args), peak, aborted)``, accounting the call on this thread.
+
+        An exception from ``func`` is re-raised with ``(peak, aborted)`` as
+        its ``memory`` attribute.
+        """
+        start = self.begin()
+        try:
+            result = func(*args)
+        except BaseException as e:
+            e.memory = self.end(start)
+            raise
+        return (result,) + self.end(start)
+
+    def install(self, app, routes=TRACKED_ROUTES):
+        """Register request hooks on a Flask ``app``."""
+        from flask import g, request
+
+        @app.before_request
+        def start_memory_tracking():
+            if request.url_rule is not None and request.url_rule.rule in routes:
+                g.memory_start = self.begin()
+
+        @app.after_request
+        def report_memory(response):
+            start = g.pop('memory_start', None)
+            if start is not None:
+                peak, aborted = self.end(start)
+                record(request.url_rule.rule, peak, aborted)
+                if app.debug:
+                    response.headers['X-Peak-Memory'] = str(peak)
+            return response
+
+        @app.teardown_request
+        def stop_memory_tracking(exc):
+            # Still pending only if the request failed before after_request ran
+            start = g.pop('memory_start', None)
+            if start is not None:
+                self.end(start)
+
+
+tracker = MemoryTracker()
+
+
+def tracked_call(func, *args):
+    """``tracker.call(func, *args)``; top-level, so a process pool can run it."""
+    return tracker.call(func, *args)
+
+
+def run_tracked(route, call, func, *args):
+    """Run ``func(*args)`` through ``call(tracked_call, func, *args)`` and record it.
+
+    ``call`` may run ``tracked_call`` in a worker process, as ``async_app``
+    does with archive builds; that process then applies the ceiling and
+    its peak is recorded here under ``route``.
+    """
+    try:
+        result, peak, aborted = call(tracked_call, func, *args)
+    except Exception as e:
+        memory = getattr(e, 'memory', None)
+        if memory is not None:
+            record(route, *memory)
+        raise
+    record(route, peak, aborted)
+    return result
@@ -0,0 +1,272 @@
+"""In-process metrics rendered in the Prometheus text format at ``/metrics``.
+
+Recording is lock-free on the hot path: every thread writes to its own
+shard (a plain dict reached through ``threading.local``), and only a
+scrape walks all shards and adds them up.  A shard is created once per
+thread and metric under a lock; shards of threads that have exited are
+folded into a retired shard at the next scrape, so per-request threads
+do not accumulate.
+
+Values are per process.  Under the pre-forking ``serve.py`` each scrape
+is answered by one worker, so scrape every worker (or run one) when
+exact totals matter.
+
+Three kinds of metric are supported: ``Counter`` and ``Histogram``
+record events, and ``Collector`` reports values computed at scrape time
+(cache statistics, queue lengths) from a callback.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+# Seconds; covers fast cache hits up to slow generations and big imports
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Sharded:
+    """Per-thread ``{labels: value}`` shards merged on read."""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _merge(self, into, shard):
+        raise NotImplementedError
+
+    def values(self):
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = live
+            total = {}
+            self._merge(total, self._retired)
+            for _, shard in live:
+                self._merge(total, shard)
+        return total
+
+
+class Counter(_Sharded):
+    """Monotonic count; ``inc`` also takes negative amounts for gauges."""
+
+    type = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _merge(self, into, shard):
+        for labels, value in list(shard.items()):
+            into[labels] = into.get(labels, 0) + value
+
+    def render(self):
+        return [f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+                for labels, value in sorted(self.values().items())]
+
+
+class Gauge(Counter):
+    """Up/down value such as requests in flight."""
+
+    type = 'gauge'
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class Histogram(_Sharded):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            # One slot per bucket, +Inf, then the sum
+            counts = shard[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def _merge(self, into, shard):
+        for labels, counts in list(shard.items()):
+            total = into.setdefault(labels, [0] * (len(self.buckets) + 2))
+            for i, value in enumerate(list(counts)):
+                total[i] += value
+
+    def render(self):
+        lines = []
+        for labels, counts in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = (('le', _number(bound)),)
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(counts[-1])}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Collector:
+    """Gauge whose ``{labels: value}`` comes from ``collect()`` at scrape time."""
+
+    def __init__(self, name, help, labelnames, collect, type='gauge'):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.type = type
+
+    def render(self):
+        return [f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+                for labels, value in sorted(self.collect().items())]
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        try:
+            samples = metric.render()
+        except Exception:
+            # A failing collector must not take the whole scrape down
+            continue
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+http_requests = register(Counter(
+    'http_requests_total', 'HTTP requests by route, method and status code.',
+    ('route', 'method', 'status')))
+http_latency = register(Histogram(
+    'http_request_duration_seconds', 'Time from request start until the response is closed.',
+    ('route', 'method')))
+http_in_flight = register(Gauge(
+    'http_requests_in_flight', 'Requests currently being handled.'))
+upstream_latency = register(Histogram(
+    'upstream_request_duration_seconds', 'Latency of calls to Gemini and GitHub.',
+    ('service', 'outcome')))
+upstream_errors = register(Counter(
+    'upstream_errors_total', 'Failed calls to Gemini and GitHub by error class.',
+    ('service', 'error_class')))
+archive_bytes = register(Counter(
+    'archive_bytes_total', 'Bytes of archives (zip, APK, HTML) produced, by kind.', ('kind',)))
+
+
+def error_class(exc):
+    """Coarse, low-cardinality class of an upstream failure."""
+    if getattr(exc, 'error_class', None):
+        return exc.error_class
+    status = getattr(exc, 'status_code', None)
+    if status == 429:
+        return 'rate_limited'
+    if status is not None:
+        return 'server_error' if status >= 500 else 'client_error'
+    if isinstance(exc, (TimeoutError, requests.Timeout)):
+        return 'timeout'
+    if isinstance(exc, (ConnectionError, requests.ConnectionError)):
+        return 'connection'
+    if isinstance(exc, ValueError):
+        return 'invalid_response'
+    # aiohttp is optional; classify its errors by name
+    name = type(exc).__name__
+    if 'Timeout' in name:
+        return 'timeout'
+    if 'Connect' in name or 'Connection' in name:
+        return 'connection'
+    return 'other'
+
+
+@contextmanager
+def upstream(service):
+    """Time a call to ``service`` and count it as an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        upstream_latency.observe(time.perf_counter() - start, (service, 'error'))
+        upstream_errors.inc((service, error_class(e)))
+        raise
+    upstream_latency.observe(time.perf_counter() - start, (service, 'ok'))
+
+
+def produced(kind, data):
+    """Count ``data`` as an archive of ``kind`` and return it."""
+    archive_bytes.inc((kind,), len(data))
+    return data
+
+
+def register_caches(stats):
+    """Register cache hit/miss counters and hit ratios from ``stats()``.
+
+    ``stats`` returns ``{'<cache>_hits': n, '<cache>_misses': n, ...}``.
+    """
+    def caches():
+        found = {}
+        for key, value in stats().items():
+            cache, _, kind = key.rpartition('_')
+            if kind in ('hits', 'misses'):
+                found.setdefault(cache, {})[kind] = value
+        return found
+
+    def lookups(kind):
+        return lambda: {(cache,): counts.get(kind, 0) for cache, counts in caches().items()}
+
+    def ratios():
+        ratio = {}
+        for cache, counts in caches().items():
+            total = counts.get('hits', 0) + counts.get('misses', 0)
+            ratio[(cache,)] = counts.get('hits', 0) / total if total else 0.0
+        return ratio
+
+    register(Collector('cache_hits_total', 'Cache hits.', ('cache',), lookups('hits'), 'counter'))
+    register(Collector('cache_misses_total', 'Cache misses.', ('cache',), lookups('misses'), 'counter'))
+    register(Collector('cache_hit_ratio', 'Cache hits / lookups since start.', ('cache',), ratios))
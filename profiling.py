@@ -0,0 +1,216 @@
+"""Opt-in sampling profiler for Flask routes, served at ``/debug/profiles``.
+
+Off unless ``PROFILE_SAMPLE_EVERY`` is set: then one request in every N
+per route (optionally only the routes listed in ``PROFILE_ROUTES``) is
+profiled, and the last ``PROFILE_KEEP`` profiles are kept in a ring
+buffer.  When disabled no hooks are installed at all, so requests pay
+nothing.
+
+Two modes (``PROFILE_MODE``):
+
+* ``cprofile`` (default) runs the request under ``cProfile`` and serves a
+  pstats file (``python -m pstats``, snakeviz).  Only one cProfile can be
+  active per process, so a sample that would overlap another is skipped.
+* ``stack`` samples the request thread's Python stack every
+  ``PROFILE_INTERVAL`` seconds from a background thread and serves the
+  collapsed stacks that flamegraph.pl and speedscope read.  Overhead is
+  independent of call counts and concurrent requests are sampled
+  separately.
+
+Only the view runs under the profiler; streamed response bodies do not.
+"""
+import cProfile
+import io
+import itertools
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+PROFILE_SAMPLE_EVERY = int(os.environ.get('PROFILE_SAMPLE_EVERY', 0))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 20))
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+PROFILE_ROUTES = frozenset(r for r in os.environ.get('PROFILE_ROUTES', '').split(',') if r)
+
+MODES = ('cprofile', 'stack')
+
+
+class Profile:
+    """One profiled request."""
+
+    def __init__(self, route, method, path, mode, started, duration, data):
+        self.id = uuid.uuid4().hex[:12]
+        self.route = route
+        self.method = method
+        self.path = path
+        self.mode = mode
+        self.started = started
+        self.duration = duration
+        self.data = data
+
+    @property
+    def formats(self):
+        return ('pstats',) if self.mode == 'cprofile' else ('collapsed',)
+
+    def pstats_bytes(self):
+        self.data.create_stats()
+        return marshal.dumps(self.data.stats)
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.data.most_common())
+
+    def summary(self, limit=25):
+        """Human-readable top functions (cprofile) or stacks (stack)."""
+        if self.mode == 'stack':
+            return ''.join(f'{count:>6} {stack}\n' for stack, count in self.data.most_common(limit))
+        out = io.StringIO()
+        stats = pstats.Stats(self.data, stream=out)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'route': self.route,
+            'method': self.method,
+            'path': self.path,
+            'mode': self.mode,
+            'started': self.started,
+            'duration': self.duration,
+            'formats': self.formats,
+        }
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Background thread sampling the stacks of registered threads."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._targets = {}
+        self._lock = threading.Condition()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._targets[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+            self._lock.notify()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._targets.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._targets:
+                    self._lock.wait()
+                targets = list(self._targets.items())
+            frames = sys._current_frames()
+            for thread_id, counts in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    counts[_collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class Profiler:
+    def __init__(self, every=PROFILE_SAMPLE_EVERY, keep=PROFILE_KEEP, mode=PROFILE_MODE,
+                 routes=PROFILE_ROUTES, interval=PROFILE_INTERVAL):
+        if mode not in MODES:
+            raise ValueError(f'Unknown profile mode: {mode}')
+        self.every = every
+        self.mode = mode
+        self.routes = routes
+        self.sampler = StackSampler(interval) if mode == 'stack' else None
+        self._counters = {}
+        self._profiles = deque(maxlen=keep)
+        self._cprofile = threading.Lock()
+        self.skipped = 0
+
+    @property
+    def enabled(self):
+        return self.every > 0
+
+    def should_sample(self, route):
+        if self.routes and route not in self.routes:
+            return False
+        counter = self._counters.get(route)
+        if counter is None:
+            counter = self._counters.setdefault(route, itertools.count(1))
+        return next(counter) % self.every == 0
+
+    def start(self, route):
+        """Begin profiling the current request if sampled; returns a token."""
+        if not self.should_sample(route):
+            return None
+        if self.sampler is not None:
+            self.sampler.start(threading.get_ident())
+            return (time.time(), time.perf_counter(), None)
+        if not self._cprofile.acquire(blocking=False):
+            self.skipped += 1
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another tool (a debugger, coverage) owns the profiling hook
+            self._cprofile.release()
+            self.skipped += 1
+            return None
+        return (time.time(), time.perf_counter(), profile)
+
+    def finish(self, token, route, method, path):
+        started, start, profile = token
+        if profile is None:
+            data = self.sampler.stop(threading.get_ident())
+        else:
+            profile.disable()
+            self._cprofile.release()
+            data = profile
+        duration = time.perf_counter() - start
+        self._profiles.append(Profile(route, method, path, self.mode, started, duration, data))
+
+    def profiles(self):
+        return list(self._profiles)
+
+    def get(self, profile_id):
+        for profile in list(self._profiles):
+            if profile.id == profile_id:
+                return profile
+        return None
+
+    def install(self, app):
+        """Register request hooks on a Flask ``app``."""
+        from flask import g, request
+
+        @app.before_request
+        def start_profile():
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            token = self.start(route)
+            if token is not None:
+                g.profile = (token, route)
+
+        @app.teardown_request
+        def finish_profile(exc):
+            sampled = g.pop('profile', None)
+            if sampled is not None:
+                token, route = sampled
+                self.finish(token, route, request.method, request.path)
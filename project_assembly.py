@@ -0,0 +1,474 @@
+"""Shared Android Studio project skeleton and assembler.
+
+Every route that hands out a project (export, prepare-for-Android-Studio,
+GitHub import, APK and preview builds) describes it as a ``ProjectModel``
+and asks ``assemble_project`` for the rendered file map.  The skeleton and
+its toolchain versions live here once, so the routes can no longer drift
+apart, and rendered output is cached by the model's content hash.
+"""
+import hashlib
+import os
+import re
+import zipfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
+from io import BytesIO
+
+from caching import LRUCache
+from file_roles import build_index, normalize_path
+from memory_guard import checkpoint
+
+# Toolchain versions used by every generated project
+AGP_VERSION = '8.0.0'
+GRADLE_VERSION = '8.4'
+COMPILE_SDK = 34
+TARGET_SDK = 34
+MIN_SDK = 24
+
+DEPENDENCIES = (
+    ('implementation', 'androidx.appcompat:appcompat:1.6.1'),
+    ('implementation', 'com.google.android.material:material:1.9.0'),
+    ('implementation', 'androidx.constraintlayout:constraintlayout:2.1.4'),
+    ('testImplementation', 'junit:junit:4.13.2'),
+    ('androidTestImplementation', 'androidx.test.ext:junit:1.1.5'),
+    ('androidTestImplementation', 'androidx.test.espresso:espresso-core:3.5.1'),
+)
+
+# Number of rendered projects / zip archives kept in memory, and the
+# bytes each cache may hold: imports of whole repositories are large
+CACHE_SIZE = 64
+CACHE_BYTES = int(os.environ.get('PROJECT_CACHE_BYTES', 32 * 1024 * 1024))
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _read_repo_file(name, fallback):
+    # Ship the real wrapper scripts from the repository root when available
+    try:
+        with open(os.path.join(_HERE, name), 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return fallback
+
+
+GRADLEW = _read_repo_file('gradlew', '#!/usr/bin/env sh\nexec gradle "$@"\n')
+GRADLEW_BAT = _read_repo_file('gradlew.bat', '@echo off\r\ngradle %*\r\n')
+GRADLE_WRAPPER_JAR = b'# Gradle wrapper JAR file placeholder'
+
+
+def package_name(app_name):
+    """Return the Java package used for ``app_name`` (``com.example.<name>``)."""
+    name = re.sub(r'[^a-z0-9_]', '', app_name.lower())
+    if not name or name[0].isdigit():
+        name = 'app' + name
+    return f'com.example.{name}'
+
+
+@dataclass(frozen=True)
+class ProjectModel:
+    """In-memory description of an Android Studio project.
+
+    ``files`` holds ``(path, content)`` pairs relative to the project root,
+    sorted by path so that equal projects hash equally.  Skeleton files are
+    only rendered for the parts of the project that ``files`` does not
+    already provide.
+    """
+    app_name: str
+    files: tuple = ()
+    readme: str = ''
+    skeleton: bool = True
+
+    @classmethod
+    def from_files(cls, app_name, files, **kwargs):
+        """Build a model from a ``{name: content}`` map, routing bare names."""
+        files = files or {}
+        routes = build_index(files, package_name(app_name)).routes
+        routed = {}
+        explicit = set()
+        for name, content in files.items():
+            path = routes[name]
+            # A path given in full wins over a bare name routed to the same place
+            if '/' in normalize_path(name):
+                explicit.add(path)
+            elif path in explicit:
+                continue
+            routed[path] = content
+        return cls(app_name=app_name, files=tuple(sorted(routed.items())), **kwargs)
+
+    @property
+    def package(self):
+        return package_name(self.app_name)
+
+    @cached_property
+    def digest(self):
+        h = hashlib.sha256()
+        for part in (self.app_name, self.readme, str(self.skeleton)):
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+        for path, content in self.files:
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            h.update(path.encode('utf-8'))
+            h.update(b'\0')
+            h.update(len(content).to_bytes(8, 'big'))
+            h.update(content)
+        return h.hexdigest()
+
+
+def _app_build_gradle(model):
+    deps = '\n'.join(f"    {scope} '{coord}'" for scope, coord in DEPENDENCIES)
+    return f"""plugins {{
+    id 'com.android.application'
+}}
+
+android {{
+    namespace '{model.package}'
+    compileSdk {COMPILE_SDK}
+
+    defaultConfig {{
+        applicationId "{model.package}"
+        minSdk {MIN_SDK}
+        targetSdk {TARGET_SDK}
+        versionCode 1
+        versionName "1.0"
+
+        testInstrumentationRunner "androidx.test.runner.AndroidJUnitRunner"
+    }}
+
+    buildTypes {{
+        release {{
+            minifyEnabled false
+            proguardFiles getDefaultProguardFile('proguard-android-optimize.txt'), 'proguard-rules.pro'
+        }}
+    }}
+
+    compileOptions {{
+        sourceCompatibility JavaVersion.VERSION_1_8
+        targetCompatibility JavaVersion.VERSION_1_8
+    }}
+}}
+
+dependencies {{
+{deps}
+}}
+"""
+
+
+def _root_build_gradle(model):
+    return f"""// Top-level build file where you can add configuration options common to all sub-projects/modules.
+buildscript {{
+    repositories {{
+        google()
+        mavenCentral()
+    }}
+    dependencies {{
+        classpath 'com.android.tools.build:gradle:{AGP_VERSION}'
+    }}
+}}
+
+// Note: repositories are defined in settings.gradle using dependencyResolutionManagement
+
+task clean(type: Delete) {{
+    delete rootProject.buildDir
+}}
+"""
+
+
+def _settings_gradle(model):
+    return f"""pluginManagement {{
+    repositories {{
+        google()
+        mavenCentral()
+        gradlePluginPortal()
+    }}
+}}
+
+dependencyResolutionManagement {{
+    repositoriesMode.set(RepositoriesMode.FAIL_ON_PROJECT_REPOS)
+    repositories {{
+        google()
+        mavenCentral()
+    }}
+}}
+
+rootProject.name = "{model.app_name}"
+include ":app"
+"""
+
+
+def _gradle_properties(model):
+    return """org.gradle.jvmargs=-Xmx2048m -Dfile.encoding=UTF-8
+android.useAndroidX=true
+android.enableJetifier=true
+android.nonTransitiveRClass=false
+"""
+
+
+def _wrapper_properties(model):
+    return f"""distributionBase=GRADLE_USER_HOME
+distributionPath=wrapper/dists
+distributionUrl=https\\://services.gradle.org/distributions/gradle-{GRADLE_VERSION}-bin.zip
+zipStoreBase=GRADLE_USER_HOME
+zipStorePath=wrapper/dists
+"""
+
+
+def _manifest(model):
+    # AGP 8 takes the package from the namespace in app/build.gradle
+    return """<?xml version="1.0" encoding="utf-8"?>
+<manifest xmlns:android="http://schemas.android.com/apk/res/android">
+
+    <application
+        android:allowBackup="true"
+        android:icon="@mipmap/ic_launcher"
+        android:label="@string/app_name"
+        android:roundIcon="@mipmap/ic_launcher_round"
+        android:supportsRtl="true"
+        android:theme="@style/AppTheme">
+        <activity
+            android:name=".MainActivity"
+            android:exported="true">
+            <intent-filter>
+                <action android:name="android.intent.action.MAIN" />
+                <category android:name="android.intent.category.LAUNCHER" />
+            </intent-filter>
+        </activity>
+    </application>
+
+</manifest>
+"""
+
+
+def _main_activity(model):
+    return f"""package {model.package};
+
+import android.os.Bundle;
+import androidx.appcompat.app.AppCompatActivity;
+
+public class MainActivity extends AppCompatActivity {{
+    @Override
+    protected void onCreate(Bundle savedInstanceState) {{
+        super.onCreate(savedInstanceState);
+        setContentView(R.layout.activity_main);
+    }}
+}}
+"""
+
+
+def _layout(model):
+    return """<?xml version="1.0" encoding="utf-8"?>
+<androidx.constraintlayout.widget.ConstraintLayout xmlns:android="http://schemas.android.com/apk/res/android"
+    xmlns:app="http://schemas.android.com/apk/res-auto"
+    xmlns:tools="http://schemas.android.com/tools"
+    android:layout_width="match_parent"
+    android:layout_height="match_parent"
+    tools:context=".MainActivity">
+
+    <TextView
+        android:layout_width="wrap_content"
+        android:layout_height="wrap_content"
+        android:text="@string/app_name"
+        app:layout_constraintBottom_toBottomOf="parent"
+        app:layout_constraintLeft_toLeftOf="parent"
+        app:layout_constraintRight_toRightOf="parent"
+        app:layout_constraintTop_toTopOf="parent" />
+
+</androidx.constraintlayout.widget.ConstraintLayout>
+"""
+
+
+def _string_resource(text):
+    """Escape ``text`` for a ``<string>`` element (XML, then aapt quoting)."""
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    return re.sub(r'([\\\'"@?])', r'\\\1', text)
+
+
+def _strings(model):
+    return f"""<resources>
+    <string name="app_name">{_string_resource(model.app_name)}</string>
+</resources>
+"""
+
+
+def _colors(model):
+    return """<resources>
+    <color name="colorPrimary">#6200EE</color>
+    <color name="colorPrimaryDark">#3700B3</color>
+    <color name="colorAccent">#03DAC5</color>
+</resources>
+"""
+
+
+def _styles(model):
+    return """<resources>
+    <style name="AppTheme" parent="Theme.AppCompat.Light.DarkActionBar">
+        <item name="colorPrimary">@color/colorPrimary</item>
+        <item name="colorPrimaryDark">@color/colorPrimaryDark</item>
+        <item name="colorAccent">@color/colorAccent</item>
+    </style>
+</resources>
+"""
+
+
+def _readme(model):
+    notes = f'\n{model.readme.strip()}\n' if model.readme else ''
+    return f"""# {model.app_name}
+
+This project has been prepared for Android Studio.
+{notes}
+## Project Structure
+- app/ - Contains the Android application code
+- build.gradle - Project level build file
+- app/build.gradle - App module build file
+- settings.gradle - Project settings
+
+## Toolchain
+- Android Gradle Plugin {AGP_VERSION}, Gradle {GRADLE_VERSION}
+- compileSdk {COMPILE_SDK}, targetSdk {TARGET_SDK}, minSdk {MIN_SDK}
+
+## Opening in Android Studio
+1. Open Android Studio
+2. Select "Open an existing Android Studio project"
+3. Navigate to the extracted folder and select it
+4. Wait for the project to sync and build
+"""
+
+
+def _gitignore(model):
+    return """*.iml
+.gradle
+/local.properties
+/.idea/caches
+/.idea/libraries
+/.idea/modules.xml
+/.idea/workspace.xml
+/.idea/navEditor.xml
+/.idea/assetWizardSettings.xml
+.DS_Store
+/build
+/captures
+.externalNativeBuild
+.cxx
+"""
+
+
+# Skeleton files: (role, path, renderer).  A skeleton file is only rendered
+# when no provided file has its role.  The path may contain {package_dir}.
+# The skeleton manifest uses @style/AppTheme, so styles.xml is also left out
+# only when a provided themes.xml defines it (see ``_defines_app_theme``).
+SKELETON = (
+    ('root_build', 'build.gradle', _root_build_gradle),
+    ('settings', 'settings.gradle', _settings_gradle),
+    ('gradle_properties', 'gradle.properties', _gradle_properties),
+    ('wrapper_properties', 'gradle/wrapper/gradle-wrapper.properties', _wrapper_properties),
+    ('wrapper_jar', 'gradle/wrapper/gradle-wrapper.jar', lambda model: GRADLE_WRAPPER_JAR),
+    ('gradlew', 'gradlew', lambda model: GRADLEW),
+    ('gradlew_bat', 'gradlew.bat', lambda model: GRADLEW_BAT),
+    ('module_build', 'app/build.gradle', _app_build_gradle),
+    ('manifest', 'app/src/main/AndroidManifest.xml', _manifest),
+    ('main_activity', 'app/src/main/java/{package_dir}/MainActivity.java', _main_activity),
+    ('main_layout', 'app/src/main/res/layout/activity_main.xml', _layout),
+    ('strings', 'app/src/main/res/values/strings.xml', _strings),
+    ('colors', 'app/src/main/res/values/colors.xml', _colors),
+    ('styles', 'app/src/main/res/values/styles.xml', _styles),
+    ('gitignore', '.gitignore', _gitignore),
+    ('readme', 'README.md', _readme),
+)
+
+
+_APP_THEME = re.compile(r"""<style\s+name\s*=\s*["']AppTheme["']""")
+
+
+def _defines_app_theme(model, index):
+    """True if a provided themes.xml defines the AppTheme the manifest uses."""
+    themes = set(index.paths('themes'))
+    for path, content in model.files:
+        if path in themes:
+            if isinstance(content, bytes):
+                content = content.decode('utf-8', 'replace')
+            if _APP_THEME.search(content):
+                return True
+    return False
+
+
+def _files_size(files):
+    return sum(len(content) for content in files.values())
+
+
+_rendered = LRUCache(CACHE_SIZE, CACHE_BYTES, _files_size)
+_zipped = LRUCache(CACHE_SIZE, CACHE_BYTES)
+
+
+def assemble_project(model):
+    """Render ``model`` into an ordered ``{relative path: content}`` map.
+
+    The result is shared between callers and must not be mutated.
+    """
+    cached = _rendered.get(model.digest)
+    if cached is not None:
+        return cached
+
+    files = OrderedDict()
+    if model.skeleton:
+        index = build_index((path for path, _ in model.files), model.package, route=False)
+        package_dir = model.package.replace('.', '/')
+        for role, path, render in SKELETON:
+            if role == 'styles' and _defines_app_theme(model, index):
+                continue
+            if not index.has(role):
+                files[path.format(package_dir=package_dir)] = render(model)
+    for path, content in model.files:
+        files[path] = content
+
+    _rendered.put(model.digest, files)
+    return files
+
+
+def skeleton_file(model, path):
+    """Render a single skeleton file, e.g. ``'app/build.gradle'``."""
+    package_dir = model.package.replace('.', '/')
+    for _, skeleton_path, render in SKELETON:
+        if skeleton_path.format(package_dir=package_dir) == path:
+            return render(model)
+    raise KeyError(path)
+
+
+def build_project_zip(model, root=None):
+    """Return the project as zip bytes with every entry under ``root/``."""
+    root = model.app_name if root is None else root
+    key = (model.digest, root)
+    cached = _zipped.get(key)
+    if cached is not None:
+        return cached
+
+    prefix = f'{root}/' if root else ''
+    memory_file = BytesIO()
+    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for path, content in assemble_project(model).items():
+            checkpoint()
+            info = zipfile.ZipInfo(prefix + path, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            if path == 'gradlew':
+                info.external_attr = 0o100755 << 16
+            zf.writestr(info, content)
+    data = memory_file.getvalue()
+
+    _zipped.put(key, data)
+    return data
+
+
+def cache_stats():
+    return {
+        'render_hits': _rendered.hits,
+        'render_misses': _rendered.misses,
+        'render_bytes': _rendered.bytes,
+        'zip_hits': _zipped.hits,
+        'zip_misses': _zipped.misses,
+        'zip_bytes': _zipped.bytes,
+    }
+
+
+def clear_caches():
+    _rendered.clear()
+    _zipped.clear()
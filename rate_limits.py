@@ -0,0 +1,234 @@
+"""Client-side token buckets for Gemini, per API key and model.
+
+Gemini enforces requests-per-minute and tokens-per-minute quotas and
+answers a burst over them with 429s.  Every call first reserves one
+request and its estimated tokens (``estimate_tokens``: about four
+characters per prompt token plus ``GEMINI_OUTPUT_TOKENS``) from the
+budget of its key and model.  When the budget is short the call waits
+until the buckets have refilled enough, in arrival order, instead of
+failing; only a wait longer than ``GEMINI_QUEUE_TIMEOUT`` seconds fails,
+with a ``RateLimitExceeded``.  The estimate is settled against the
+``usageMetadata`` of the response, and an upstream 429 empties the
+request bucket so queued calls back off.
+
+Limits default to ``GEMINI_RPM`` and ``GEMINI_TPM`` (0 disables one) and
+can be set per model with ``GEMINI_MODEL_LIMITS``, e.g.
+``gemini-1.5-pro:2:32000,gemini-2.0-flash-exp:10:4000000``.  Buckets hold
+one minute of budget, so an idle key can burst a full minute's quota.
+
+The remaining budget is exported as ``gemini_budget_remaining`` on
+``/metrics`` and, for the budget a request used, as ``X-RateLimit-*``
+response headers.  Keys appear only as a short hash.  Budgets are per
+process, so with several workers each gets the full limits; divide them
+by the worker count to stay under a shared quota.
+"""
+import contextvars
+import hashlib
+import os
+import threading
+import time
+
+import metrics
+
+GEMINI_RPM = float(os.environ.get('GEMINI_RPM', 15))
+GEMINI_TPM = float(os.environ.get('GEMINI_TPM', 1000000))
+GEMINI_MODEL_LIMITS = os.environ.get('GEMINI_MODEL_LIMITS', '')
+GEMINI_QUEUE_TIMEOUT = float(os.environ.get('GEMINI_QUEUE_TIMEOUT', 60))
+GEMINI_OUTPUT_TOKENS = int(os.environ.get('GEMINI_OUTPUT_TOKENS', 2048))
+
+# Idle, refilled budgets are dropped once more than this many keys were seen
+MAX_BUDGETS = 1000
+
+_current = contextvars.ContextVar('gemini_budget', default=None)
+
+queue_wait = metrics.register(metrics.Histogram(
+    'gemini_queue_wait_seconds', 'Time Gemini calls waited for rate-limit budget.', ('model',)))
+tokens_used = metrics.register(metrics.Counter(
+    'gemini_tokens_total', 'Gemini tokens used (reported, else estimated) by key and model.', ('key', 'model')))
+queue_rejections = metrics.register(metrics.Counter(
+    'gemini_queue_rejections_total', 'Gemini calls rejected for waiting too long for budget.', ('model',)))
+
+
+class RateLimitExceeded(Exception):
+    error_class = 'rate_limited'
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_model_limits(spec):
+    """``{model: (rpm, tpm)}`` from ``'model:rpm:tpm,...'``."""
+    limits = {}
+    for item in spec.split(','):
+        if item.strip():
+            model, rpm, tpm = item.strip().rsplit(':', 2)
+            limits[model] = (float(rpm), float(tpm))
+    return limits
+
+
+def estimate_tokens(prompt, output_tokens=GEMINI_OUTPUT_TOKENS):
+    return len(prompt or '') // 4 + 1 + output_tokens
+
+
+def key_id(api_key):
+    """Short, non-reversible label for an API key."""
+    return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:8]
+
+
+class TokenBucket:
+    """``per_minute`` units refilled continuously, holding at most a minute's worth.
+
+    The level may go negative: a reservation takes its units at once and
+    the caller waits until the bucket would have held them.
+    """
+
+    def __init__(self, per_minute, now):
+        self.limit = per_minute
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = now
+
+    def refill(self, now):
+        self.level = min(self.limit, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount):
+        """Seconds until ``amount`` units are available; call ``refill`` first."""
+        amount = min(amount, self.limit)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= min(amount, self.limit)
+
+
+class Budget:
+    """Request and token buckets of one API key and model."""
+
+    def __init__(self, key, model, rpm, tpm):
+        now = time.monotonic()
+        self.key = key
+        self.model = model
+        self.requests = TokenBucket(rpm, now) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm, now) if tpm > 0 else None
+        self._lock = threading.Lock()
+
+    def _buckets(self):
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+    def reserve(self, tokens, max_wait):
+        """Take one request and ``tokens``; returns the seconds to wait before calling."""
+        with self._lock:
+            now = time.monotonic()
+            for bucket in self._buckets():
+                bucket.refill(now)
+            wait = max([0.0] + [bucket.wait_for(amount) for bucket, amount in
+                                ((self.requests, 1), (self.tokens, tokens)) if bucket is not None])
+            if wait > max_wait:
+                queue_rejections.inc((self.model,))
+                raise RateLimitExceeded(
+                    f'Gemini rate limit for {self.model} exhausted; retry in {wait:.0f} s', wait)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+        queue_wait.observe(wait, (self.model,))
+        return wait
+
+    def settle(self, estimated, actual):
+        """Correct a reservation of ``estimated`` tokens to the ``actual`` usage."""
+        tokens_used.inc((self.key, self.model), estimated if actual is None else actual)
+        if self.tokens is not None and actual is not None:
+            with self._lock:
+                self.tokens.level = min(self.tokens.limit, self.tokens.level + estimated - actual)
+
+    def throttled(self):
+        """Upstream said 429: spend what is left of the request bucket."""
+        if self.requests is not None:
+            with self._lock:
+                self.requests.level = min(self.requests.level, 0.0)
+
+    def remaining(self):
+        """``{'requests': n, 'tokens': n}`` available now (limited kinds only)."""
+        with self._lock:
+            now = time.monotonic()
+            remaining = {}
+            for kind, bucket in (('requests', self.requests), ('tokens', self.tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    remaining[kind] = max(0, int(bucket.level))
+            return remaining
+
+    def idle(self):
+        self.remaining()
+        return all(bucket.level >= bucket.limit for bucket in self._buckets())
+
+    def headers(self, wait=0.0):
+        headers = {}
+        for kind, amount in self.remaining().items():
+            bucket = getattr(self, kind)
+            headers[f'X-RateLimit-Limit-{kind.capitalize()}'] = str(int(bucket.limit))
+            headers[f'X-RateLimit-Remaining-{kind.capitalize()}'] = str(amount)
+        if wait:
+            headers['X-RateLimit-Queued-Ms'] = str(int(wait * 1000))
+        return headers
+
+
+class RateLimiter:
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM, model_limits=GEMINI_MODEL_LIMITS,
+                 max_wait=GEMINI_QUEUE_TIMEOUT):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.model_limits = parse_model_limits(model_limits) if isinstance(model_limits, str) else model_limits
+        self.max_wait = max_wait
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    def budget(self, api_key, model):
+        key = (key_id(api_key), model)
+        budget = self._budgets.get(key)
+        if budget is None:
+            with self._lock:
+                budget = self._budgets.get(key)
+                if budget is None:
+                    if len(self._budgets) >= MAX_BUDGETS:
+                        self._budgets = {k: b for k, b in self._budgets.items() if not b.idle()}
+                    rpm, tpm = self.model_limits.get(model, (self.rpm, self.tpm))
+                    budget = self._budgets[key] = Budget(key[0], model, rpm, tpm)
+        return budget
+
+    def reserve(self, api_key, model, tokens):
+        """``(budget, seconds to wait)`` for a call, remembered as this context's budget."""
+        budget = self.budget(api_key, model)
+        wait = budget.reserve(tokens, self.max_wait)
+        _current.set((budget, wait))
+        return budget, wait
+
+    def remaining(self):
+        """``{(key, model, kind): remaining}`` for ``/metrics``."""
+        values = {}
+        for (key, model), budget in list(self._budgets.items()):
+            for kind, amount in budget.remaining().items():
+                values[(key, model, kind)] = amount
+        return values
+
+
+def reset_current():
+    """Forget the budget of the previous request handled in this context."""
+    _current.set(None)
+
+
+def current_headers():
+    """``X-RateLimit-*`` headers of the budget used by this request, if any."""
+    current = _current.get()
+    if current is None:
+        return {}
+    budget, wait = current
+    return budget.headers(wait)
+
+
+limiter = RateLimiter()
+
+metrics.register(metrics.Collector(
+    'gemini_budget_remaining', 'Gemini requests and tokens left in the current rate-limit window.',
+    ('key', 'model', 'kind'), limiter.remaining))
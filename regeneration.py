@@ -0,0 +1,98 @@
+"""Regenerating a subset of a generated app's files.
+
+``/api/regenerate-files`` asks Gemini for only the files being changed.
+The rest of the app goes into the prompt as read-only context, so the
+answer stays consistent with it while the output, which dominates
+latency and token use, covers just the selected files.  Context beyond
+``REGENERATION_CONTEXT_CHARS`` is left out, largest files first, and
+listed by name only.
+
+Model output is parsed here rather than in the browser (``parse_code_files``
+accepts bare JSON or JSON in a fenced code block) and merged into the
+current file map by ``merge_files``.
+"""
+import json
+import os
+import re
+
+REGENERATION_CONTEXT_CHARS = int(os.environ.get('REGENERATION_CONTEXT_CHARS', 60000))
+
+_FENCE = re.compile(r'```(?:json)?\s*\n(.*?)\n?```', re.DOTALL)
+
+
+class RegenerationError(ValueError):
+    pass
+
+
+def parse_code_files(text):
+    """``{file name: content}`` from model output or a stored ``code`` string."""
+    if isinstance(text, dict):
+        files = text
+    else:
+        candidates = [text.strip()] + [m.group(1) for m in _FENCE.finditer(text)]
+        for candidate in candidates:
+            try:
+                files = json.loads(candidate)
+            except ValueError:
+                continue
+            if isinstance(files, dict):
+                break
+        else:
+            raise RegenerationError('Code is not a JSON map of file names to contents')
+    if not all(isinstance(name, str) and isinstance(content, str) for name, content in files.items()):
+        raise RegenerationError('Every file must map a name to its content')
+    return files
+
+
+def context_files(files, targets, budget=REGENERATION_CONTEXT_CHARS):
+    """``(included, omitted)``: the non-target files that fit ``budget`` characters."""
+    others = sorted((name for name in files if name not in targets), key=lambda name: len(files[name]))
+    included, omitted, used = {}, [], 0
+    for name in others:
+        if used + len(files[name]) <= budget:
+            included[name] = files[name]
+            used += len(files[name])
+        else:
+            omitted.append(name)
+    return included, sorted(omitted)
+
+
+def regeneration_prompt(app_name, app_description, files, targets, instructions=''):
+    included, omitted = context_files(files, targets)
+    current = {name: files[name] for name in targets if name in files}
+    parts = [f'You are editing the Android app "{app_name}".']
+    if app_description:
+        parts.append(f'App description: {app_description}')
+    if instructions:
+        parts.append(f'Change requested: {instructions}')
+    parts += [
+        '',
+        f'Rewrite only these files: {", ".join(targets)}.',
+        'Keep them consistent with the rest of the app (ids, resource names, package, class names).',
+        'Return a JSON object mapping each of these file names to its complete new content, and nothing else.',
+        '',
+        'Current content of the files to rewrite (a missing one is new):',
+        json.dumps(current, indent=2),
+        '',
+        'Other files of the app, for reference only (do not return them):',
+        json.dumps(included, indent=2),
+    ]
+    if omitted:
+        parts.append(f'Also in the app, not shown: {", ".join(omitted)}')
+    return '\n'.join(parts)
+
+
+def merge_files(files, regenerated, targets):
+    """``(merged, missing)``: ``files`` with the targets replaced by ``regenerated``.
+
+    Files the model returned that were not asked for are ignored, and
+    targets it left out keep their current content and are reported.
+    """
+    merged = dict(files)
+    missing = []
+    for name in targets:
+        if name in regenerated:
+            merged[name] = regenerated[name]
+        else:
+            missing.append(name)
+    return merged, missing
@@ -0,0 +1,594 @@
+"""Compile a project's ``res/`` directory into ``resources.arsc``.
+
+Every ``res/values*/`` file is merged into one resource table: a global
+string pool shared by all values and file paths, and a single ``0x7f``
+package whose types and entries get stable IDs.  Type IDs come from the
+fixed ``TYPE_IDS`` table and entry IDs are assigned in name order, or kept
+from ``stable_ids`` when an earlier build's map is supplied, so adding a
+resource never renumbers the existing ones.  ``ResourceIdStore`` keeps
+that map per project between builds (``resource_ids``), under
+``RESOURCE_IDS_DIR``.  Output is deterministic: the same inputs give
+byte-identical tables, which keeps the downstream AXML, APK and artifact
+caches hot.
+
+File resources (layouts, drawables, mipmaps ...) get an entry pointing at
+their path in the APK; XML files among them are compiled with ``axml``.
+
+The table is self-contained and does not link AndroidX libraries, so
+``Theme.AppCompat.*`` / ``Theme.MaterialComponents.*`` parents fall back to
+the matching framework Material theme and un-namespaced theme attributes
+such as ``colorPrimary`` use the framework attribute of the same name.
+Anything else that cannot be resolved is dropped and listed in
+``CompiledResources.warnings``.
+"""
+import hashlib
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+from axml import (
+    FRAMEWORK_ATTR_IDS, FRAMEWORK_RESOURCES, TYPE_INT_BOOLEAN, TYPE_INT_DEC,
+    TYPE_INT_HEX, TYPE_REFERENCE, TYPE_STRING, StringPool, compile_value,
+    encode_batch, resolve_reference,
+)
+from caching import LRUCache
+from workspaces import workspace_name
+
+RES_TABLE_TYPE = 0x0002
+RES_TABLE_PACKAGE_TYPE = 0x0200
+RES_TABLE_TYPE_TYPE = 0x0201
+RES_TABLE_TYPE_SPEC_TYPE = 0x0202
+
+PACKAGE_ID = 0x7F
+NO_ENTRY = 0xFFFFFFFF
+FLAG_COMPLEX = 0x0001
+CONFIG_SIZE = 64
+
+# Fixed type IDs, so a type keeps its ID whatever else the project defines
+TYPE_IDS = {
+    'attr': 0x01, 'id': 0x02, 'style': 0x03, 'string': 0x04, 'color': 0x05,
+    'dimen': 0x06, 'integer': 0x07, 'bool': 0x08, 'array': 0x09, 'plurals': 0x0A,
+    'fraction': 0x0B, 'layout': 0x0C, 'drawable': 0x0D, 'mipmap': 0x0E,
+    'xml': 0x0F, 'raw': 0x10, 'menu': 0x11, 'anim': 0x12, 'animator': 0x13,
+    'interpolator': 0x14, 'font': 0x15, 'navigation': 0x16, 'transition': 0x17,
+}
+TYPE_NAMES = sorted(TYPE_IDS, key=TYPE_IDS.get)
+
+# Value formats of the simple values elements
+VALUE_FORMATS = {
+    'color': 'color',
+    'dimen': 'dimension',
+    'integer': 'integer',
+    'bool': 'boolean',
+    'fraction': 'dimension',
+}
+ANY_FORMAT = 'boolean|color|dimension|integer|float|string'
+
+# Keys of bag entries (ResTable_map)
+ATTR_TYPE = 0x01000000
+ATTR_MIN = 0x01000001
+ATTR_MAX = 0x01000002
+PLURAL_KEYS = {
+    'other': 0x01000004, 'zero': 0x01000005, 'one': 0x01000006,
+    'two': 0x01000007, 'few': 0x01000008, 'many': 0x01000009,
+}
+ATTR_FORMATS = {
+    'reference': 0x01, 'string': 0x02, 'integer': 0x04, 'boolean': 0x08,
+    'color': 0x10, 'float': 0x20, 'dimension': 0x40, 'fraction': 0x80,
+    'enum': 0x10000, 'flags': 0x20000,
+}
+ATTR_ANY = 0xFFFF
+
+# AndroidX theme families mapped onto framework themes
+LIBRARY_THEME_PREFIXES = (
+    ('Theme.AppCompat.', 'Theme.Material.'),
+    ('Theme.MaterialComponents.', 'Theme.Material.'),
+    ('Theme.Material3.', 'Theme.Material.'),
+)
+LIBRARY_THEMES = {
+    'Theme.AppCompat': 'Theme.Material',
+    'Theme.MaterialComponents': 'Theme.Material',
+    'Theme.Material3': 'Theme.Material',
+    'Theme.Material.DayNight': 'Theme.Material.Light',
+    'Theme.Material.DayNight.DarkActionBar': 'Theme.Material.Light.DarkActionBar',
+    'Theme.Material.DayNight.NoActionBar': 'Theme.Material.Light.NoActionBar',
+}
+
+# ResTable_config dimensions (ConfigDescription) and their spec flags
+DENSITIES = {
+    'ldpi': 120, 'mdpi': 160, 'tvdpi': 213, 'hdpi': 240, 'xhdpi': 320,
+    'xxhdpi': 480, 'xxxhdpi': 640, 'nodpi': 0xFFFF, 'anydpi': 0xFFFE,
+}
+CONFIG_LOCALE = 0x0004
+CONFIG_ORIENTATION = 0x0080
+CONFIG_DENSITY = 0x0100
+CONFIG_VERSION = 0x0400
+CONFIG_UI_MODE = 0x1000
+CONFIG_SMALLEST_SCREEN_SIZE = 0x2000
+CONFIG_SCREEN_SIZE = 0x0200
+
+CACHE_SIZE = 64
+
+RESOURCE_IDS_DIR = os.environ.get('RESOURCE_IDS_DIR', os.path.join('data', 'resource-ids'))
+
+_SCREEN_DP = re.compile(r'^(sw|w|h)(\d+)dp$')
+
+Resource = namedtuple('Resource', 'type name config value')
+CompiledResources = namedtuple('CompiledResources', 'table files ids warnings')
+
+_compiled = LRUCache(CACHE_SIZE)
+
+
+class Config:
+    """A parsed ``values-<qualifiers>`` configuration."""
+
+    def __init__(self, qualifiers=''):
+        self.qualifiers = qualifiers
+        self.language = self.region = b''
+        self.orientation = self.density = self.sdk = self.ui_mode = 0
+        self.smallest_width = self.width = self.height = 0
+        self.flags = 0
+        for qualifier in qualifiers.split('-') if qualifiers else ():
+            self._parse(qualifier)
+
+    def _parse(self, q):
+        screen = _SCREEN_DP.match(q)
+        if re.fullmatch(r'[a-z]{2}', q):
+            self.language = q.encode('ascii')
+            self.flags |= CONFIG_LOCALE
+        elif re.fullmatch(r'r[A-Z]{2}', q):
+            self.region = q[1:].encode('ascii')
+            self.flags |= CONFIG_LOCALE
+        elif q in ('port', 'land'):
+            self.orientation = 1 if q == 'port' else 2
+            self.flags |= CONFIG_ORIENTATION
+        elif q in ('night', 'notnight'):
+            self.ui_mode = 0x20 if q == 'night' else 0x10
+            self.flags |= CONFIG_UI_MODE
+        elif q in DENSITIES:
+            self.density = DENSITIES[q]
+            self.flags |= CONFIG_DENSITY
+        elif re.fullmatch(r'v\d+', q):
+            self.sdk = int(q[1:])
+            self.flags |= CONFIG_VERSION
+        elif screen:
+            kind, value = screen.group(1), int(screen.group(2))
+            if kind == 'sw':
+                self.smallest_width = value
+                self.flags |= CONFIG_SMALLEST_SCREEN_SIZE
+            else:
+                setattr(self, 'width' if kind == 'w' else 'height', value)
+                self.flags |= CONFIG_SCREEN_SIZE
+        else:
+            raise ValueError(f'Unsupported resource qualifier: {q}')
+
+    def encode(self):
+        data = struct.pack(
+            '<IHH2s2sBBHBBBBHHHHBBHHH',
+            CONFIG_SIZE, 0, 0, self.language, self.region,
+            self.orientation, 0, self.density, 0, 0, 0, 0, 0, 0, self.sdk, 0,
+            0, self.ui_mode, self.smallest_width, self.width, self.height)
+        return data + b'\0' * (CONFIG_SIZE - len(data))
+
+
+def _chunk(chunk_type, header, body):
+    header_size = 8 + len(header)
+    return struct.pack('<HHI', chunk_type, header_size, header_size + len(body)) + header + body
+
+
+def res_path(path):
+    """``app/src/main/res/values/strings.xml`` -> ``res/values/strings.xml``."""
+    path = path.replace('\\', '/')
+    if path.startswith('res/'):
+        return path
+    index = path.rfind('/res/')
+    return path[index + 1:] if index >= 0 else None
+
+
+_ESCAPES = {'n': '\n', 't': '\t', '\'': '\'', '"': '"', '\\': '\\', '@': '@', '?': '?'}
+
+
+def string_value(text):
+    """Apply aapt's string rules: quoting, whitespace folding and escapes."""
+    out = []
+    quoted = False
+    space = False
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if c == '\\' and i + 1 < len(text):
+            n = text[i + 1]
+            if n == 'u' and re.fullmatch(r'[0-9a-fA-F]{4}', text[i + 2:i + 6]):
+                out.append(chr(int(text[i + 2:i + 6], 16)))
+                i += 6
+            else:
+                out.append(_ESCAPES.get(n, n))
+                i += 2
+            space = False
+            continue
+        if c == '"':
+            quoted = not quoted
+        elif c.isspace() and not quoted:
+            if not space:
+                out.append(' ')
+            space = True
+        else:
+            out.append(c)
+            space = False
+        i += 1
+    return ''.join(out).strip(' ') if not text.strip().startswith('"') else ''.join(out)
+
+
+def _text(element):
+    return ''.join(element.itertext())
+
+
+class _Builder:
+    """Collects resources from a project, then assigns IDs and encodes them."""
+
+    def __init__(self, package, stable_ids=None):
+        self.package = package
+        self.stable_ids = stable_ids or {}
+        self.resources = {}
+        self.warnings = []
+        self.ids = {}
+
+    def add(self, res_type, name, config, value):
+        self.resources[(res_type, name, config.qualifiers)] = Resource(res_type, name, config, value)
+
+    def add_values(self, path, data, config):
+        root = ET.fromstring(data)
+        for element in root:
+            tag = element.tag
+            name = element.get('name')
+            if not isinstance(tag, str) or name is None:
+                continue
+            if tag == 'item':
+                res_type = element.get('type')
+                if res_type is None:
+                    raise ValueError(f'{path}: <item name="{name}"> needs a type')
+                self.add(res_type, name, config, ('value', _text(element), element.get('format')))
+            elif tag in ('string', 'color', 'dimen', 'integer', 'bool', 'fraction'):
+                self.add(tag, name, config, ('value', _text(element), None))
+            elif tag in ('string-array', 'integer-array', 'array'):
+                items = [_text(item) for item in element.findall('item')]
+                self.add('array', name, config, ('array', tag, items))
+            elif tag == 'plurals':
+                items = [(item.get('quantity'), _text(item)) for item in element.findall('item')]
+                self.add('plurals', name, config, ('plurals', items))
+            elif tag == 'style':
+                items = [(item.get('name'), _text(item)) for item in element.findall('item')]
+                self.add('style', name, config, ('style', element.get('parent'), items))
+            elif tag == 'attr':
+                self._add_attr(element, config)
+            elif tag == 'declare-styleable':
+                for attr in element.findall('attr'):
+                    if attr.get('format') or len(attr):
+                        self._add_attr(attr, config)
+            elif tag not in ('eat-comment', 'public', 'skip'):
+                self.warnings.append(f'{path}: ignored <{tag} name="{name}">')
+
+    def _add_attr(self, element, config):
+        name = element.get('name')
+        if name.startswith('android:'):
+            return
+        symbols = []
+        for child in element:
+            if child.tag in ('enum', 'flag'):
+                symbols.append((child.get('name'), child.get('value')))
+                self.add('id', child.get('name'), Config(), ('id',))
+        self.add('attr', name, config, ('attr', element.get('format'), element[0].tag if len(element) else None,
+                                        symbols))
+
+    def add_layout_ids(self, data):
+        for match in re.finditer(rb'"@\+id/([\w.]+)"', data):
+            self.add('id', match.group(1).decode('utf-8'), Config(), ('id',))
+
+    def assign_ids(self):
+        names = {}
+        for res_type, name, _ in self.resources:
+            if res_type not in TYPE_IDS:
+                raise ValueError(f'Unsupported resource type: {res_type}')
+            names.setdefault(res_type, set()).add(name)
+        for res_type, type_names in names.items():
+            prefix = (PACKAGE_ID << 24) | (TYPE_IDS[res_type] << 16)
+            # Every saved ID of this type stays reserved, including those of
+            # resources missing from this build, so none is handed out twice
+            reserved = {i for i in self.stable_ids.values() if i & 0xFFFF0000 == prefix}
+            taken = {}
+            used = set()
+            for name in sorted(type_names):
+                previous = self.stable_ids.get(f'{res_type}/{name}')
+                if previous is not None and previous & 0xFFFF0000 == prefix and previous not in used:
+                    taken[name] = previous
+                    used.add(previous)
+            next_index = max((i & 0xFFFF for i in reserved), default=-1) + 1
+            used |= reserved
+            for name in sorted(type_names - set(taken)):
+                while prefix | next_index in used:
+                    next_index += 1
+                taken[name] = prefix | next_index
+                next_index += 1
+            for name, resource_id in taken.items():
+                self.ids[f'{res_type}/{name}'] = resource_id
+
+    # --- value compilation
+
+    def _attr_id(self, name):
+        if name.startswith('android:'):
+            return FRAMEWORK_ATTR_IDS.get(name[len('android:'):])
+        return self.ids.get(f'attr/{name}') or FRAMEWORK_ATTR_IDS.get(name)
+
+    def _value(self, text, fmt, strings):
+        """``(data_type, data)`` with string values interned in the pool."""
+        if text.strip()[:1] in ('@', '?'):
+            try:
+                reference = resolve_reference(text.strip(), self.ids)
+            except ValueError as e:
+                self.warnings.append(str(e))
+                return TYPE_REFERENCE, 0
+            if reference is not None:
+                return reference
+        data_type, data = compile_value(text, fmt, self.ids)
+        if data_type == TYPE_STRING:
+            if 'string' not in fmt.split('|'):
+                raise ValueError(f'Invalid value {text!r} for format {fmt}')
+            data = strings.add(string_value(text))
+        return data_type, data
+
+    def _style_parent(self, resource):
+        _, parent, _ = resource.value
+        name = resource.name
+        if parent is None:
+            prefix = name.rpartition('.')[0]
+            return self.ids.get(f'style/{prefix}', 0) if prefix else 0
+        if parent == '':
+            return 0
+        parent = parent.lstrip('@').replace('style/', '', 1)
+        framework = parent.startswith('android:')
+        parent = parent[len('android:'):] if framework else parent
+        if not framework and f'style/{parent}' in self.ids:
+            return self.ids[f'style/{parent}']
+        fallback = LIBRARY_THEMES.get(parent, parent)
+        for library, target in LIBRARY_THEME_PREFIXES:
+            if fallback.startswith(library):
+                fallback = target + fallback[len(library):]
+        fallback = LIBRARY_THEMES.get(fallback, fallback)
+        resource_id = FRAMEWORK_RESOURCES.get(f'style/{fallback}')
+        if resource_id is None:
+            self.warnings.append(f'Unresolved parent style {parent} of {name}')
+            return 0
+        return resource_id
+
+    def entry(self, resource, strings):
+        """``(is_bag, value)`` where value is a Res_value or (parent, map items)."""
+        kind = resource.value[0]
+        if kind == 'id':
+            return False, (TYPE_INT_BOOLEAN, 0)
+        if kind == 'file':
+            return False, (TYPE_STRING, strings.add(resource.value[1]))
+        if kind == 'value':
+            _, text, fmt = resource.value
+            if resource.type == 'string':
+                return False, (TYPE_STRING, strings.add(string_value(text)))
+            fmt = fmt or VALUE_FORMATS.get(resource.type, ANY_FORMAT)
+            return False, self._value(text, fmt + '|reference' if 'reference' not in fmt else fmt, strings)
+        if kind == 'array':
+            _, tag, items = resource.value
+            fmt = 'integer' if tag == 'integer-array' else ('string' if tag == 'string-array' else ANY_FORMAT)
+            return True, (0, [(0x02000000 | i, self._value(item, fmt, strings))
+                              for i, item in enumerate(items)])
+        if kind == 'plurals':
+            return True, (0, [(PLURAL_KEYS[quantity], (TYPE_STRING, strings.add(string_value(text))))
+                              for quantity, text in resource.value[1]])
+        if kind == 'style':
+            items = []
+            for attr, text in resource.value[2]:
+                attr_id = self._attr_id(attr)
+                if attr_id is None:
+                    self.warnings.append(f'Unknown attribute {attr} in style {resource.name}')
+                    continue
+                items.append((attr_id, self._value(text, ANY_FORMAT + '|reference', strings)))
+            return True, (self._style_parent(resource), items)
+        if kind == 'attr':
+            _, fmt, symbol_kind, symbols = resource.value
+            mask = 0
+            for part in (fmt or '').split('|'):
+                mask |= ATTR_FORMATS.get(part.strip(), 0)
+            if symbol_kind in ('enum', 'flag'):
+                mask |= ATTR_FORMATS['enum' if symbol_kind == 'enum' else 'flags']
+            items = [(ATTR_TYPE, (TYPE_INT_DEC, mask or ATTR_ANY))]
+            for name, value in symbols:
+                data = int(value, 0) & 0xFFFFFFFF
+                items.append((self.ids[f'id/{name}'], (TYPE_INT_HEX if symbol_kind == 'flag' else TYPE_INT_DEC, data)))
+            return True, (0, items)
+        raise ValueError(f'Unknown resource kind {kind}')
+
+    # --- encoding
+
+    def encode(self):
+        strings = StringPool()
+        keys = StringPool()
+        by_type = {}
+        for key in sorted(self.resources, key=lambda k: (TYPE_IDS[k[0]], self.ids[f'{k[0]}/{k[1]}'], k[2])):
+            resource = self.resources[key]
+            by_type.setdefault(resource.type, []).append(resource)
+
+        packages = []
+        for res_type in sorted(by_type, key=TYPE_IDS.get):
+            resources = by_type[res_type]
+            type_id = TYPE_IDS[res_type]
+            entry_count = max(self.ids[f'{res_type}/{r.name}'] & 0xFFFF for r in resources) + 1
+            spec_flags = [0] * entry_count
+            configs = {}
+            for resource in resources:
+                index = self.ids[f'{res_type}/{resource.name}'] & 0xFFFF
+                spec_flags[index] |= resource.config.flags
+                configs.setdefault(resource.config.qualifiers, (resource.config, {}))[1][index] = resource
+
+            spec = _chunk(RES_TABLE_TYPE_SPEC_TYPE, struct.pack('<BBHI', type_id, 0, 0, entry_count),
+                          struct.pack(f'<{entry_count}I', *spec_flags))
+            packages.append(spec)
+            for qualifiers in sorted(configs, key=lambda q: configs[q][0].encode()):
+                config, entries = configs[qualifiers]
+                packages.append(self._type_chunk(type_id, entry_count, config, entries, strings, keys))
+
+        type_strings = StringPool()
+        for name in TYPE_NAMES[:max(TYPE_IDS[t] for t in by_type)] if by_type else ():
+            type_strings.add(name)
+        type_pool = type_strings.encode(utf8=True)
+        key_pool = keys.encode(utf8=True)
+        name = self.package.encode('utf-16-le')[:254]
+        header = struct.pack('<I256sIIIII', PACKAGE_ID, name, 288, len(type_strings),
+                             288 + len(type_pool), len(keys), 0)
+        package = _chunk(RES_TABLE_PACKAGE_TYPE, header, type_pool + key_pool + b''.join(packages))
+        return _chunk(RES_TABLE_TYPE, struct.pack('<I', 1), strings.encode(utf8=True) + package)
+
+    def _type_chunk(self, type_id, entry_count, config, entries, strings, keys):
+        offsets = []
+        data = bytearray()
+        for index in range(entry_count):
+            resource = entries.get(index)
+            if resource is None:
+                offsets.append(NO_ENTRY)
+                continue
+            offsets.append(len(data))
+            key = keys.add(resource.name)
+            is_bag, value = self.entry(resource, strings)
+            if is_bag:
+                parent, items = value
+                items.sort(key=lambda item: item[0])
+                data += struct.pack('<HHIII', 16, FLAG_COMPLEX, key, parent, len(items))
+                for item_name, (data_type, item_data) in items:
+                    data += struct.pack('<IHBBI', item_name, 8, 0, data_type, item_data)
+            else:
+                data_type, item_data = value
+                data += struct.pack('<HHIHBBI', 8, 0, key, 8, 0, data_type, item_data)
+        config_bytes = config.encode()
+        entries_start = 8 + 12 + len(config_bytes) + 4 * entry_count
+        header = struct.pack('<BBHII', type_id, 0, 0, entry_count, entries_start) + config_bytes
+        return _chunk(RES_TABLE_TYPE_TYPE, header, struct.pack(f'<{entry_count}I', *offsets) + bytes(data))
+
+
+def _split_res(path):
+    """``res/<dir>/<file>`` -> ``(type, qualifiers, file name)``."""
+    parts = path.split('/')
+    if len(parts) != 3:
+        return None
+    directory, _, qualifiers = parts[1].partition('-')
+    return directory, qualifiers, parts[2]
+
+
+def _inputs_key(files, package, manifest, stable_ids):
+    h = hashlib.sha256(package.encode('utf-8'))
+    for path in sorted(files):
+        content = files[path]
+        h.update(path.encode('utf-8') + b'\0')
+        h.update(hashlib.sha256(content.encode('utf-8') if isinstance(content, str) else content).digest())
+    h.update(hashlib.sha256(manifest or b'').digest())
+    for key, resource_id in sorted((stable_ids or {}).items()):
+        h.update(f'{key}={resource_id}'.encode('utf-8'))
+    return h.digest()
+
+
+def compile_resources(files, package, manifest=None, stable_ids=None):
+    """Compile the ``res/`` files of a project for packaging into an APK.
+
+    ``files`` maps project paths to content; anything outside a ``res/``
+    directory is ignored.  ``manifest`` (source XML) is compiled against
+    the resulting IDs when given.  ``stable_ids`` is the ``ids`` map of a
+    previous build, whose IDs are kept for resources that still exist.
+
+    Returns ``CompiledResources(table, files, ids, warnings)``, where
+    ``files`` maps APK paths (including ``AndroidManifest.xml``) to
+    compiled content.
+    """
+    if isinstance(manifest, str):
+        manifest = manifest.encode('utf-8')
+    key = _inputs_key(files, package, manifest, stable_ids)
+    cached = _compiled.get(key)
+    if cached is not None:
+        return cached
+
+    builder = _Builder(package, stable_ids)
+    xml_files = {}
+    apk_files = {}
+    for path, content in files.items():
+        path = res_path(path)
+        split = path and _split_res(path)
+        if not split:
+            continue
+        directory, qualifiers, file_name = split
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        config = Config(qualifiers)
+        if directory == 'values':
+            builder.add_values(path, content, config)
+            continue
+        res_type = directory
+        builder.add(res_type, file_name.partition('.')[0], config, ('file', path))
+        if file_name.endswith('.xml'):
+            builder.add_layout_ids(content)
+            xml_files[path] = content
+        else:
+            apk_files[path] = content
+
+    builder.assign_ids()
+    if manifest is not None:
+        xml_files['AndroidManifest.xml'] = manifest
+    apk_files.update(encode_batch(xml_files, builder.ids))
+    table = builder.encode()
+    result = CompiledResources(table, apk_files, dict(builder.ids), tuple(builder.warnings))
+    _compiled.put(key, result)
+    return result
+
+
+def cache_stats():
+    return {'arsc_hits': _compiled.hits, 'arsc_misses': _compiled.misses}
+
+
+class ResourceIdStore:
+    """Resource ID map of each project, kept on disk between builds.
+
+    ``save`` merges into the saved map, so a resource that is removed and
+    later added back gets its old ID again; ``assign_ids`` keeps every
+    saved ID reserved, so no other resource is given it meanwhile.
+    """
+
+    def __init__(self, directory=RESOURCE_IDS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def path_for(self, project):
+        return os.path.join(self.directory, workspace_name(project) + '.json')
+
+    def load(self, project):
+        try:
+            with open(self.path_for(project)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, project, ids):
+        with self._lock:
+            saved = self.load(project)
+            merged = dict(saved, **ids)
+            if merged == saved:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(merged, f, sort_keys=True)
+                os.replace(tmp, self.path_for(project))
+            except BaseException:
+                os.remove(tmp)
+                raise
+
+
+resource_ids = ResourceIdStore()
@@ -0,0 +1,202 @@
+"""Retries with backoff, a deadline and optional hedging for upstream calls.
+
+``RetryPolicy.call(func, timeout)`` runs ``func(timeout=...)`` and, when it
+fails with a transient error (``retryable``: a 429 or 5xx from upstream, a
+timeout or a connection error), runs it again after an exponential
+backoff with full jitter: a random delay between 0 and
+``base_delay * 2 ** attempt``, capped at ``max_delay``.  Every attempt
+and delay must fit in ``deadline`` seconds from the first call; each
+attempt's timeout is cut to what is left of it.  Client errors and empty
+responses are not retried, since asking again gives the same answer.
+Only calls that are safe to repeat should go through a policy.
+
+With ``hedge`` on, an attempt that has not answered after the p95
+latency of recent successful calls gets a duplicate, and whichever
+answers first wins; the loser is cancelled (async) or left to finish
+and discarded (threads).  This trims the latency tail at the cost of
+extra upstream calls, so it is off by default and needs
+``hedge_min_samples`` successful calls before it starts.
+
+``call`` is for threads and ``acall`` for coroutines.
+"""
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+
+GEMINI_RETRY_ATTEMPTS = int(os.environ.get('GEMINI_RETRY_ATTEMPTS', 3))
+GEMINI_RETRY_BASE_DELAY = float(os.environ.get('GEMINI_RETRY_BASE_DELAY', 0.5))
+GEMINI_RETRY_MAX_DELAY = float(os.environ.get('GEMINI_RETRY_MAX_DELAY', 8))
+GEMINI_DEADLINE = float(os.environ.get('GEMINI_DEADLINE', 90))
+GEMINI_HEDGE = os.environ.get('GEMINI_HEDGE', '') not in ('', '0', 'false')
+GEMINI_HEDGE_MIN_SAMPLES = int(os.environ.get('GEMINI_HEDGE_MIN_SAMPLES', 20))
+
+RETRYABLE_STATUS = frozenset((429, 500, 502, 503, 504))
+RETRYABLE_CLASSES = frozenset(('timeout', 'connection'))
+
+# Threads running hedged attempts
+HEDGE_THREADS = 16
+
+retries = metrics.register(metrics.Counter(
+    'upstream_retries_total', 'Upstream calls retried, by the error class of the failed attempt.',
+    ('service', 'error_class')))
+hedges = metrics.register(metrics.Counter(
+    'upstream_hedges_total', 'Hedged upstream attempts, by which attempt answered first.',
+    ('service', 'winner')))
+
+
+class LatencyWindow:
+    """Latencies of the last ``size`` successful calls."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, q):
+        samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+
+class RetryPolicy:
+    def __init__(self, service, attempts=GEMINI_RETRY_ATTEMPTS, base_delay=GEMINI_RETRY_BASE_DELAY,
+                 max_delay=GEMINI_RETRY_MAX_DELAY, deadline=GEMINI_DEADLINE, hedge=GEMINI_HEDGE,
+                 hedge_min_samples=GEMINI_HEDGE_MIN_SAMPLES):
+        self.service = service
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyWindow()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def retryable(self, exc):
+        status = getattr(exc, 'status_code', None)
+        if status is not None:
+            return status in RETRYABLE_STATUS
+        return metrics.error_class(exc) in RETRYABLE_CLASSES
+
+    def backoff(self, attempt):
+        """Full-jitter delay before retry number ``attempt`` (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def hedge_after(self):
+        """Seconds after which an attempt is hedged, or ``None``."""
+        if not self.hedge or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(95)
+
+    def _give_up(self, exc, attempt, deadline):
+        """Delay before the next attempt, or ``None`` to re-raise ``exc``."""
+        if attempt >= self.attempts or not self.retryable(exc):
+            return None
+        delay = self.backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return None
+        retries.inc((self.service, metrics.error_class(exc)))
+        return delay
+
+    def _timed(self, func, timeout):
+        start = time.monotonic()
+        result = func(timeout=timeout)
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    def _hedge_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(HEDGE_THREADS, thread_name_prefix=f'{self.service}-hedge')
+            return self._pool
+
+    def _attempt(self, func, timeout):
+        hedge_after = self.hedge_after()
+        if hedge_after is None or hedge_after >= timeout:
+            return self._timed(func, timeout)
+        pool = self._hedge_pool()
+        # Run in a copy of the caller's context so context variables carry over
+        first = pool.submit(contextvars.copy_context().run, self._timed, func, timeout)
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+        second = pool.submit(contextvars.copy_context().run, self._timed, func, timeout - hedge_after)
+        pending = [first, second]
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    hedges.inc((self.service, 'hedge' if future is second else 'primary'))
+                    return future.result()
+        return first.result()
+
+    def call(self, func, timeout):
+        """``func(timeout=...)`` with retries; re-raises the last error."""
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return self._attempt(func, max(0.001, min(timeout, deadline - time.monotonic())))
+            except Exception as e:
+                delay = self._give_up(e, attempt, deadline)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+
+    async def _atimed(self, func, timeout):
+        start = time.monotonic()
+        result = await func(timeout=timeout)
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    async def _aattempt(self, func, timeout):
+        hedge_after = self.hedge_after()
+        if hedge_after is None or hedge_after >= timeout:
+            return await self._atimed(func, timeout)
+        first = asyncio.ensure_future(self._atimed(func, timeout))
+        second = None
+        try:
+            done, _ = await asyncio.wait([first], timeout=hedge_after)
+            if done:
+                return first.result()
+            second = asyncio.ensure_future(self._atimed(func, timeout - hedge_after))
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        hedges.inc((self.service, 'hedge' if task is second else 'primary'))
+                        return task.result()
+            return first.result()
+        finally:
+            for task in (first, second):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def acall(self, func, timeout):
+        """Coroutine version of ``call``; ``func(timeout=...)`` returns an awaitable."""
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await self._aattempt(func, max(0.001, min(timeout, deadline - time.monotonic())))
+            except Exception as e:
+                delay = self._give_up(e, attempt, deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
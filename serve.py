@@ -0,0 +1,323 @@
+"""Production entry point: a pre-forking, multi-threaded WSGI server.
+
+    python serve.py [--workers 4] [--threads 8] [--max-requests 1000]
+    python serve.py --server gunicorn      # use gunicorn if installed
+    python serve.py --server uvicorn       # async_app (asyncio routes) on uvicorn
+    python serve.py --dev                  # Flask dev server with debugger and reloader
+
+``python server.py`` runs this too.  The Werkzeug development server of
+``--dev`` handles one request at a time, and its debugger executes code
+for anyone who can reach it, so it is for local development only.  Here a
+master process binds the listening socket once and forks ``--workers``
+worker processes that accept on it; each worker answers up to
+``--threads`` requests concurrently.  The master restarts workers that exit, so:
+
+* a worker is recycled after ``--max-requests`` requests (plus a random
+  ``--max-requests-jitter`` so workers do not all restart together),
+  bounding the memory any one process can accumulate;
+* ``SIGHUP`` performs a graceful restart: new workers are started (and,
+  without ``--preload``, re-import the application, picking up new code)
+  before the old ones are asked to stop;
+* ``SIGTERM`` / ``SIGINT`` stop the server gracefully.  A worker asked to
+  stop closes its listener and finishes the requests it already accepted;
+  workers still busy after ``--graceful-timeout`` seconds are killed.
+
+Workers share no memory and a client's requests may reach different
+ones, so state that outlives a request (build jobs and their logs,
+artifacts, signed APKs, resource IDs) is kept on disk under ``data/``.
+
+Every option also reads a ``WEB_*`` environment variable.  ``--server
+gunicorn`` and ``--server waitress`` hand the same settings to those
+servers when they are installed; neither is required.  ``--server
+uvicorn`` serves the ASGI ``async_app`` instead, whose I/O-bound routes
+run on an event loop.  Platforms without
+``fork`` (Windows) fall back to a single multi-threaded process.
+"""
+import argparse
+import importlib
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+APP = os.environ.get('WEB_APP', 'server:app')
+ASYNC_APP = os.environ.get('WEB_ASYNC_APP', 'async_app:app')
+HOST = os.environ.get('WEB_HOST', '0.0.0.0')
+PORT = int(os.environ.get('WEB_PORT', 5000))
+WORKERS = int(os.environ.get('WEB_WORKERS', min(os.cpu_count() or 1, 4)))
+THREADS = int(os.environ.get('WEB_THREADS', 8))
+MAX_REQUESTS = int(os.environ.get('WEB_MAX_REQUESTS', 1000))
+MAX_REQUESTS_JITTER = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 100))
+GRACEFUL_TIMEOUT = float(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+KEEPALIVE = float(os.environ.get('WEB_KEEPALIVE', 5))
+BACKLOG = 2048
+
+# How often the master and idle workers check for signals, in seconds
+POLL_INTERVAL = 0.5
+
+
+def load_app(spec):
+    """Import ``'module:attribute'``."""
+    module, _, attr = spec.partition(':')
+    return getattr(importlib.import_module(module), attr or 'app')
+
+
+class RequestHandler(WSGIRequestHandler):
+    # Idle keep-alive connections release their thread after this long
+    timeout = KEEPALIVE
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug WSGI server handing requests to a bounded thread pool.
+
+    Connections beyond ``threads`` wait in the pool's queue (and then in
+    the socket backlog) instead of each getting a new thread.
+    """
+
+    multithread = True
+
+    def __init__(self, app, threads, max_requests=0, fd=None, host=HOST, port=PORT):
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+        self.max_requests = max_requests
+        self.requests = 0
+        self.stopping = False
+        self.timeout = POLL_INTERVAL
+        # Several workers accept on one socket; the losers of a race must
+        # not block in accept()
+        self.socket.setblocking(False)
+
+    def process_request(self, request, client_address):
+        self.requests += 1
+        if self.max_requests and self.requests >= self.max_requests:
+            self.stopping = True
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def serve(self):
+        """Serve until ``stopping``, then finish accepted requests."""
+        try:
+            while not self.stopping:
+                self.handle_request()
+        finally:
+            self.server_close()
+            self.pool.shutdown(wait=True)
+
+
+def _worker(spec, app, listener, threads, max_requests):
+    """Body of a forked worker process; never returns."""
+    code = 0
+    try:
+        if app is None:
+            app = load_app(spec)
+        server = PooledWSGIServer(app, threads, max_requests, fd=listener.fileno())
+        listener.close()
+
+        def stop(signum, frame):
+            server.stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        server.serve()
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+class Master:
+    """Keeps ``workers`` worker processes running on one listening socket."""
+
+    def __init__(self, spec, host, port, workers, threads, max_requests, jitter,
+                 graceful_timeout, preload):
+        self.spec = spec
+        self.workers = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.jitter = jitter
+        self.graceful_timeout = graceful_timeout
+        self.app = load_app(spec) if preload else None
+        self.listener = socket.create_server((host, port), backlog=BACKLOG, reuse_port=False)
+        self.address = self.listener.getsockname()
+        self.children = {}
+        self.retiring = {}
+        self.stopping = False
+        self.reload = False
+
+    def _spawn(self):
+        max_requests = self.max_requests + random.randint(0, self.jitter) if self.max_requests else 0
+        pid = os.fork()
+        if pid == 0:
+            _worker(self.spec, self.app, self.listener, self.threads, max_requests)
+        self.children[pid] = time.time()
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.children.pop(pid, None)
+            self.retiring.pop(pid, None)
+
+    def _signal(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reload = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        print(f'Serving {self.spec} on http://{self.address[0]}:{self.address[1]} with '
+              f'{self.workers} workers x {self.threads} threads (pid {os.getpid()})', flush=True)
+        try:
+            while not self.stopping:
+                self._reap()
+                if self.reload:
+                    self.reload = False
+                    old = dict(self.children)
+                    self.children.clear()
+                    for _ in range(self.workers):
+                        self._spawn()
+                    self.retiring.update({pid: time.time() for pid in old})
+                    self._signal(old, signal.SIGTERM)
+                while len(self.children) < self.workers:
+                    self._spawn()
+                self._kill_stragglers()
+                time.sleep(POLL_INTERVAL)
+        finally:
+            self.listener.close()
+            self._shutdown()
+
+    def _kill_stragglers(self):
+        deadline = time.time() - self.graceful_timeout
+        self._signal([pid for pid, since in self.retiring.items() if since < deadline], signal.SIGKILL)
+
+    def _shutdown(self):
+        self._signal(list(self.children) + list(self.retiring), signal.SIGTERM)
+        deadline = time.time() + self.graceful_timeout
+        while (self.children or self.retiring) and time.time() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        self._signal(list(self.children) + list(self.retiring), signal.SIGKILL)
+        self._reap()
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{args.host}:{args.port}')
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('max_requests', args.max_requests)
+            self.cfg.set('max_requests_jitter', args.max_requests_jitter)
+            self.cfg.set('graceful_timeout', args.graceful_timeout)
+            self.cfg.set('keepalive', args.keepalive)
+            self.cfg.set('preload_app', args.preload)
+
+        def load(self):
+            return load_app(args.app)
+
+    Application().run()
+
+
+def run_waitress(args):
+    from waitress import serve
+
+    # waitress is single-process; give it the whole thread budget
+    serve(load_app(args.app), host=args.host, port=args.port,
+          threads=args.workers * args.threads, channel_timeout=args.keepalive)
+
+
+def run_uvicorn(args):
+    import uvicorn
+
+    uvicorn.run(args.app, host=args.host, port=args.port, workers=args.workers,
+                timeout_keep_alive=int(args.keepalive), limit_max_requests=args.max_requests or None,
+                timeout_graceful_shutdown=int(args.graceful_timeout))
+
+
+def run_stdlib(args):
+    RequestHandler.timeout = args.keepalive
+    if not hasattr(os, 'fork'):
+        server = PooledWSGIServer(load_app(args.app), args.workers * args.threads,
+                                  host=args.host, port=args.port)
+        print(f'Serving {args.app} on http://{args.host}:{args.port} (single process, '
+              f'{args.workers * args.threads} threads)', flush=True)
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            pass
+        return
+    Master(args.app, args.host, args.port, args.workers, args.threads, args.max_requests,
+           args.max_requests_jitter, args.graceful_timeout, args.preload).run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', help="application as 'module:attribute' (default: "
+                        f"{APP}, or {ASYNC_APP} with --server uvicorn)")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--threads', type=int, default=THREADS)
+    parser.add_argument('--max-requests', type=int, default=MAX_REQUESTS,
+                        help='recycle a worker after this many requests (0 = never)')
+    parser.add_argument('--max-requests-jitter', type=int, default=MAX_REQUESTS_JITTER)
+    parser.add_argument('--graceful-timeout', type=float, default=GRACEFUL_TIMEOUT)
+    parser.add_argument('--keepalive', type=float, default=KEEPALIVE)
+    parser.add_argument('--preload', action='store_true',
+                        help='import the app once in the master (less memory, no code reload on SIGHUP)')
+    parser.add_argument('--server', choices=('stdlib', 'gunicorn', 'waitress', 'uvicorn'),
+                        default=os.environ.get('WEB_SERVER', 'stdlib'))
+    parser.add_argument('--dev', action='store_true',
+                        help='run the Flask development server with debugger and reloader')
+    args = parser.parse_args(argv)
+    if args.app is None:
+        args.app = ASYNC_APP if args.server == 'uvicorn' else APP
+
+    if args.dev:
+        load_app(args.app).run(host=args.host, port=args.port, debug=True)
+    elif args.server == 'gunicorn':
+        run_gunicorn(args)
+    elif args.server == 'waitress':
+        run_waitress(args)
+    elif args.server == 'uvicorn':
+        run_uvicorn(args)
+    else:
+        run_stdlib(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+"""RSA signing keys and X.509 certificates for APK signing, stdlib only.
+
+Only what APK signing needs is implemented: a small DER encoder/decoder,
+RSA key generation and PKCS#1 v1.5 SHA-256 signatures, loading of
+unencrypted PEM keys (PKCS#1 or PKCS#8) and certificates, and a
+self-signed debug certificate like the one Android Studio creates for
+debug builds.
+"""
+import base64
+import datetime
+import hashlib
+import math
+import os
+import secrets
+from dataclasses import dataclass
+
+# Object identifiers
+OID_RSA_ENCRYPTION = '1.2.840.113549.1.1.1'
+OID_SHA256_WITH_RSA = '1.2.840.113549.1.1.11'
+OID_SHA256 = '2.16.840.1.101.3.4.2.1'
+OID_PKCS7_DATA = '1.2.840.113549.1.7.1'
+OID_PKCS7_SIGNED_DATA = '1.2.840.113549.1.7.2'
+OID_COMMON_NAME = '2.5.4.3'
+OID_ORGANIZATION = '2.5.4.10'
+OID_COUNTRY = '2.5.4.6'
+
+# DER DigestInfo prefix for a SHA-256 hash (RFC 8017, section 9.2)
+SHA256_DIGEST_INFO = bytes.fromhex('3031300d060960864801650304020105000420')
+
+DEBUG_KEY_FILE = 'debug_signing_key.pem'
+DEBUG_CERT_FILE = 'debug_signing_cert.pem'
+
+
+# --- DER encoding ---------------------------------------------------------
+
+def _der_length(length):
+    if length < 0x80:
+        return bytes([length])
+    body = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([0x80 | len(body)]) + body
+
+
+def der(tag, content):
+    return bytes([tag]) + _der_length(len(content)) + content
+
+
+def der_int(value):
+    length = value.bit_length() // 8 + 1
+    return der(0x02, value.to_bytes(length, 'big', signed=True))
+
+
+def der_seq(*items):
+    return der(0x30, b''.join(items))
+
+
+def der_set(*items):
+    # DER requires SET OF members in sorted order
+    return der(0x31, b''.join(sorted(items)))
+
+
+def der_oid(oid):
+    parts = [int(p) for p in oid.split('.')]
+    body = bytearray([parts[0] * 40 + parts[1]])
+    for part in parts[2:]:
+        chunk = [part & 0x7F]
+        part >>= 7
+        while part:
+            chunk.append(0x80 | (part & 0x7F))
+            part >>= 7
+        body.extend(reversed(chunk))
+    return der(0x06, bytes(body))
+
+
+def der_null():
+    return b'\x05\x00'
+
+
+def der_octets(data):
+    return der(0x04, data)
+
+
+def der_bits(data):
+    return der(0x03, b'\x00' + data)
+
+
+def der_utf8(text):
+    return der(0x0C, text.encode('utf-8'))
+
+
+def der_printable(text):
+    return der(0x13, text.encode('ascii'))
+
+
+def der_time(when):
+    # UTCTime up to 2049, GeneralizedTime afterwards (RFC 5280, 4.1.2.5)
+    if when.year < 2050:
+        return der(0x17, when.strftime('%y%m%d%H%M%SZ').encode('ascii'))
+    return der(0x18, when.strftime('%Y%m%d%H%M%SZ').encode('ascii'))
+
+
+def der_explicit(number, content):
+    return der(0xA0 | number, content)
+
+
+def algorithm(oid, null_params=True):
+    return der_seq(der_oid(oid), der_null()) if null_params else der_seq(der_oid(oid))
+
+
+# --- DER decoding ---------------------------------------------------------
+
+def der_read(data, offset=0):
+    """Decode one TLV at ``offset``: ``(tag, content, end_offset)``."""
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        count = length & 0x7F
+        length = int.from_bytes(data[offset:offset + count], 'big')
+        offset += count
+    return tag, data[offset:offset + length], offset + length
+
+
+def der_children(content):
+    """Return ``(tag, content, raw_tlv)`` for each element of a constructed value."""
+    children = []
+    offset = 0
+    while offset < len(content):
+        tag, value, end = der_read(content, offset)
+        children.append((tag, value, content[offset:end]))
+        offset = end
+    return children
+
+
+def _int(content):
+    return int.from_bytes(content, 'big', signed=True)
+
+
+# --- RSA ------------------------------------------------------------------
+
+_SMALL_PRIMES = [p for p in range(3, 2000, 2) if all(p % d for d in range(3, int(p ** 0.5) + 1, 2))]
+
+
+def _probable_prime(n, rounds=40):
+    for p in _SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for _ in range(rounds):
+        x = pow(secrets.randbelow(n - 3) + 2, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def _random_prime(bits, e):
+    while True:
+        candidate = secrets.randbits(bits) | (3 << (bits - 2)) | 1
+        if math.gcd(candidate - 1, e) == 1 and _probable_prime(candidate):
+            return candidate
+
+
+@dataclass(frozen=True)
+class RsaKey:
+    n: int
+    e: int
+    d: int
+    p: int
+    q: int
+
+    @classmethod
+    def generate(cls, bits=2048, e=65537):
+        while True:
+            p = _random_prime(bits // 2, e)
+            q = _random_prime(bits - bits // 2, e)
+            if p != q and (p * q).bit_length() == bits:
+                break
+        d = pow(e, -1, (p - 1) * (q - 1))
+        return cls(p * q, e, d, max(p, q), min(p, q))
+
+    @property
+    def size(self):
+        return (self.n.bit_length() + 7) // 8
+
+    def sign_digest(self, digest):
+        """PKCS#1 v1.5 signature of a SHA-256 ``digest``."""
+        t = SHA256_DIGEST_INFO + digest
+        em = b'\x00\x01' + b'\xff' * (self.size - len(t) - 3) + b'\x00' + t
+        m = int.from_bytes(em, 'big')
+        # Chinese remainder theorem: about four times faster than pow(m, d, n)
+        s1 = pow(m, self.d % (self.p - 1), self.p)
+        s2 = pow(m, self.d % (self.q - 1), self.q)
+        h = (pow(self.q, -1, self.p) * (s1 - s2)) % self.p
+        return (s2 + h * self.q).to_bytes(self.size, 'big')
+
+    def sign(self, data):
+        return self.sign_digest(hashlib.sha256(data).digest())
+
+    def public_der(self):
+        """SubjectPublicKeyInfo."""
+        return der_seq(algorithm(OID_RSA_ENCRYPTION), der_bits(der_seq(der_int(self.n), der_int(self.e))))
+
+    def private_der(self):
+        """PKCS#8 PrivateKeyInfo."""
+        pkcs1 = der_seq(
+            der_int(0), der_int(self.n), der_int(self.e), der_int(self.d),
+            der_int(self.p), der_int(self.q),
+            der_int(self.d % (self.p - 1)), der_int(self.d % (self.q - 1)),
+            der_int(pow(self.q, -1, self.p)),
+        )
+        return der_seq(der_int(0), algorithm(OID_RSA_ENCRYPTION), der_octets(pkcs1))
+
+    @classmethod
+    def from_der(cls, data):
+        """Load a PKCS#1 RSAPrivateKey or PKCS#8 PrivateKeyInfo."""
+        _, content, _ = der_read(data)
+        children = der_children(content)
+        if children[1][0] == 0x30:
+            # PKCS#8: version, algorithm, OCTET STRING(PKCS#1 key)
+            return cls.from_der(children[2][1])
+        n, e, d, p, q = (_int(value) for _, value, _ in children[1:6])
+        return cls(n, e, d, p, q)
+
+
+def rsa_verify(n, e, data, signature):
+    """Check a PKCS#1 v1.5 SHA-256 signature against a public key."""
+    size = (n.bit_length() + 7) // 8
+    if len(signature) != size:
+        return False
+    em = pow(int.from_bytes(signature, 'big'), e, n).to_bytes(size, 'big')
+    t = SHA256_DIGEST_INFO + hashlib.sha256(data).digest()
+    return em == b'\x00\x01' + b'\xff' * (size - len(t) - 3) + b'\x00' + t
+
+
+# --- Certificates and PEM -------------------------------------------------
+
+@dataclass(frozen=True)
+class Certificate:
+    der: bytes
+    serial: int
+    issuer: bytes
+    public_key: bytes
+    n: int
+    e: int
+
+    @classmethod
+    def from_der(cls, data):
+        _, content, _ = der_read(data)
+        tbs = der_children(der_children(content)[0][1])
+        if tbs[0][0] == 0xA0:
+            # Skip the explicit version
+            tbs = tbs[1:]
+        serial = _int(tbs[0][1])
+        issuer = tbs[2][2]
+        spki = tbs[5][2]
+        key_bits = der_children(tbs[5][1])[1][1][1:]
+        n, e = (_int(value) for _, value, _ in der_children(der_read(key_bits)[1]))
+        return cls(data, serial, issuer, spki, n, e)
+
+
+def _name(common_name):
+    return der_seq(
+        der_set(der_seq(der_oid(OID_COUNTRY), der_printable('US'))),
+        der_set(der_seq(der_oid(OID_ORGANIZATION), der_utf8('Android'))),
+        der_set(der_seq(der_oid(OID_COMMON_NAME), der_utf8(common_name))),
+    )
+
+
+def self_signed_certificate(key, common_name='Android Debug', years=30):
+    now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    name = _name(common_name)
+    tbs = der_seq(
+        der_explicit(0, der_int(2)),
+        der_int(secrets.randbits(63) | 1),
+        algorithm(OID_SHA256_WITH_RSA),
+        name,
+        der_seq(der_time(now), der_time(now + datetime.timedelta(days=365 * years))),
+        name,
+        key.public_der(),
+    )
+    cert = der_seq(tbs, algorithm(OID_SHA256_WITH_RSA), der_bits(key.sign(tbs)))
+    return Certificate.from_der(cert)
+
+
+def pem_encode(label, data):
+    body = base64.encodebytes(data).decode('ascii').replace('\n', '')
+    lines = [body[i:i + 64] for i in range(0, len(body), 64)]
+    return f'-----BEGIN {label}-----\n' + '\n'.join(lines) + f'\n-----END {label}-----\n'
+
+
+def pem_decode(text):
+    """Return the DER bytes of the first PEM block in ``text``."""
+    lines = text.strip().splitlines()
+    start = next(i for i, line in enumerate(lines) if line.startswith('-----BEGIN'))
+    end = next(i for i, line in enumerate(lines) if line.startswith('-----END') and i > start)
+    return base64.b64decode(''.join(lines[start + 1:end]))
+
+
+def _read_der(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    return pem_decode(data.decode('ascii')) if data.lstrip().startswith(b'-----') else data
+
+
+@dataclass(frozen=True)
+class Signer:
+    """A private key together with its certificate."""
+    key: RsaKey
+    certificate: Certificate
+    name: str = 'CERT'
+
+    def sign(self, data):
+        return self.key.sign(data)
+
+
+def load_signer(key_path, cert_path, name='CERT'):
+    """Load a signer from PEM or DER key and certificate files."""
+    return Signer(RsaKey.from_der(_read_der(key_path)), Certificate.from_der(_read_der(cert_path)), name)
+
+
+def debug_signer(directory='data'):
+    """Return the local debug signer, creating and saving it on first use."""
+    key_path = os.path.join(directory, DEBUG_KEY_FILE)
+    cert_path = os.path.join(directory, DEBUG_CERT_FILE)
+    if os.path.exists(key_path) and os.path.exists(cert_path):
+        return load_signer(key_path, cert_path)
+
+    key = RsaKey.generate()
+    certificate = self_signed_certificate(key)
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(pem_encode('PRIVATE KEY', key.private_der()))
+    with open(cert_path, 'w') as f:
+        f.write(pem_encode('CERTIFICATE', certificate.der))
+    return Signer(key, certificate)
+
+
+def pkcs7_signature(signer, data):
+    """Detached PKCS#7 SignedData over ``data``, as used for JAR signatures.
+
+    There are no signed attributes: the RSA signature covers ``data``
+    directly, which is what Android's v1 verifier expects.
+    """
+    cert = signer.certificate
+    signer_info = der_seq(
+        der_int(1),
+        der_seq(cert.issuer, der_int(cert.serial)),
+        algorithm(OID_SHA256),
+        algorithm(OID_RSA_ENCRYPTION),
+        der_octets(signer.sign(data)),
+    )
+    signed_data = der_seq(
+        der_int(1),
+        der_set(algorithm(OID_SHA256)),
+        der_seq(der_oid(OID_PKCS7_DATA)),
+        der(0xA0, cert.der),
+        der_set(signer_info),
+    )
+    return der_seq(der_oid(OID_PKCS7_SIGNED_DATA), der_explicit(0, signed_data))
+
+
+def pkcs7_signer_info(block):
+    """Return ``(certificate, signature)`` from a PKCS#7 block made by ``pkcs7_signature``."""
+    _, content, _ = der_read(block)
+    _, signed_data, _ = der_read(der_children(content)[1][1])
+    children = der_children(signed_data)
+    certificate = Certificate.from_der(der_children(children[3][1])[0][2])
+    signer_info = der_children(der_children(children[4][1])[0][1])
+    return certificate, signer_info[4][1]
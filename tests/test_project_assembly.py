@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from project_assembly import ProjectModel, assemble_project  # noqa: E402
+
+STYLES = 'app/src/main/res/values/styles.xml'
+THEMES = 'app/src/main/res/values/themes.xml'
+
+
+def test_themes_without_app_theme_keeps_skeleton_styles():
+    themes = '<resources><style name="Theme.Other" parent="Theme.AppCompat"/></resources>'
+    files = assemble_project(ProjectModel.from_files('Themed', {'themes.xml': themes}))
+    assert files[THEMES] == themes
+    assert 'name="AppTheme"' in files[STYLES]
+
+
+def test_themes_defining_app_theme_replaces_skeleton_styles():
+    themes = '<resources><style name="AppTheme" parent="Theme.AppCompat"/></resources>'
+    files = assemble_project(ProjectModel.from_files('Themed', {'themes.xml': themes}))
+    assert STYLES not in files
+
+
+def test_explicit_path_wins_over_routed_bare_name():
+    path = 'app/src/main/res/values/strings.xml'
+    for files in ({'strings.xml': 'bare', path: 'explicit'}, {path: 'explicit', 'strings.xml': 'bare'}):
+        model = ProjectModel.from_files('Routed', files)
+        assert dict(model.files)[path] == 'explicit'
@@ -0,0 +1,39 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resource_table import ResourceIdStore, compile_resources  # noqa: E402
+
+PACKAGE = 'com.example.ids'
+
+
+def strings(*names):
+    body = ''.join(f'<string name="{name}">{name}</string>' for name in names)
+    return {'app/src/main/res/values/strings.xml': f'<resources>{body}</resources>'}
+
+
+def build(store, *names):
+    ids = compile_resources(strings(*names), PACKAGE, stable_ids=store.load(PACKAGE)).ids
+    store.save(PACKAGE, ids)
+    return ids
+
+
+def test_removed_resource_keeps_its_id_reserved(tmp_path):
+    store = ResourceIdStore(str(tmp_path))
+    first = build(store, 'a', 'x')
+    second = build(store, 'a', 'y')
+    assert second['string/y'] not in first.values()
+
+    third = build(store, 'a', 'x', 'y')
+    assert third['string/x'] == first['string/x']
+    assert third['string/y'] == second['string/y']
+    assert len(set(third.values())) == len(third)
+
+
+def test_duplicate_saved_ids_are_not_shared(tmp_path):
+    # A map written before IDs were reserved may give two names one ID
+    stable = {'string/x': 0x7f040001, 'string/y': 0x7f040001}
+    ids = compile_resources(strings('x', 'y'), PACKAGE, stable_ids=stable).ids
+    assert ids['string/x'] == 0x7f040001
+    assert ids['string/y'] != 0x7f040001
@@ -0,0 +1,281 @@
+"""Persistent per-project build workspaces kept in sync incrementally.
+
+Gradle's up-to-date checks and incremental Java compilation only help if
+a rebuild sees the same directory, with unchanged sources keeping their
+old timestamps.  ``WorkspacePool`` therefore keeps one directory per
+project under ``WORKSPACE_ROOT`` and ``sync`` writes only the files whose
+content changed: a one-line edit rewrites one file and leaves every other
+mtime (and Gradle's build/ and .gradle/ state) alone.
+
+Each workspace records the SHA-256, size and mtime of every file it wrote
+in ``MANIFEST``.  A file whose size and mtime still match is trusted
+without re-reading it; anything else is re-hashed, so edits made on disk
+behind the pool's back are repaired on the next sync.  Files that left
+the project are removed; files the pool never wrote (build outputs) are
+not touched.
+
+Idle workspaces are garbage-collected least recently used first once
+there are more than ``WORKSPACE_MAX_COUNT`` of them or they use more than
+``WORKSPACE_QUOTA_BYTES`` of disk.  Workspaces leased to a running build
+are never collected.  Leases also ``flock`` a ``<name>.lock`` file beside
+the workspace where ``fcntl`` is available, so the worker processes of
+``serve.py`` never sync into or build one workspace at the same time.
+
+The disk usage of a workspace is measured once when its lease ends, i.e.
+after the build that changed it, and kept in ``<name>.size``, so
+``collect`` and ``stats`` add up stored totals rather than walking every
+workspace.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+WORKSPACE_ROOT = os.environ.get('WORKSPACE_ROOT', os.path.join('data', 'builds', 'workspaces'))
+WORKSPACE_QUOTA_BYTES = int(os.environ.get('WORKSPACE_QUOTA_BYTES', 5 * 1024 * 1024 * 1024))
+WORKSPACE_MAX_COUNT = int(os.environ.get('WORKSPACE_MAX_COUNT', 20))
+
+MANIFEST = '.workspace-manifest.json'
+
+# Files written with the executable bit set
+EXECUTABLES = ('gradlew',)
+
+
+def workspace_name(project):
+    """Filesystem-safe, collision-free directory name for ``project``."""
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', project)[:48]
+    return f'{slug}-{hashlib.sha256(project.encode("utf-8")).hexdigest()[:12]}'
+
+
+def _encode(content):
+    return content.encode('utf-8') if isinstance(content, str) else content
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(directory, manifest):
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, sort_keys=True)
+    os.replace(tmp, os.path.join(directory, MANIFEST))
+
+
+def _unchanged(target, record, digest):
+    """True if ``target`` on disk still holds content ``digest``."""
+    if record is None or record[0] != digest:
+        return False
+    try:
+        st = os.stat(target)
+    except FileNotFoundError:
+        return False
+    if (st.st_size, st.st_mtime_ns) == (record[1], record[2]):
+        return True
+    return st.st_size == record[1] and _file_sha256(target) == digest
+
+
+def sync(directory, files):
+    """Make ``directory`` hold ``files`` ({relative path: content}).
+
+    Returns ``{'written': [...], 'removed': [...], 'unchanged': n}``.
+    """
+    os.makedirs(directory, exist_ok=True)
+    old = _load_manifest(directory)
+    manifest = {}
+    written = []
+    unchanged = 0
+    for path, content in files.items():
+        data = _encode(content)
+        digest = hashlib.sha256(data).hexdigest()
+        parts = path.split('/')
+        if path.startswith('/') or '..' in parts:
+            raise ValueError(f'Unsafe workspace path: {path}')
+        target = os.path.join(directory, *parts)
+        if _unchanged(target, old.get(path), digest):
+            st = os.stat(target)
+            unchanged += 1
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(tmp, 0o755 if path in EXECUTABLES else 0o644)
+            os.replace(tmp, target)
+            st = os.stat(target)
+            written.append(path)
+        manifest[path] = [digest, st.st_size, st.st_mtime_ns]
+
+    removed = []
+    for path in old:
+        if path not in manifest:
+            try:
+                os.remove(os.path.join(directory, *path.split('/')))
+            except FileNotFoundError:
+                pass
+            removed.append(path)
+    _save_manifest(directory, manifest)
+    return {'written': written, 'removed': removed, 'unchanged': unchanged}
+
+
+def disk_usage(directory):
+    total = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_blocks * 512
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class WorkspacePool:
+    """Named workspaces with exclusive leases and LRU / quota collection."""
+
+    def __init__(self, root=WORKSPACE_ROOT, quota_bytes=WORKSPACE_QUOTA_BYTES,
+                 max_count=WORKSPACE_MAX_COUNT):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.max_count = max_count
+        self.collected = 0
+        self._locks = {}
+        self._leased = set()
+        self._lock = threading.Lock()
+
+    def path_for(self, project):
+        return os.path.join(self.root, workspace_name(project))
+
+    def _lock_file(self, name):
+        # Beside the workspace, not in it, so removing one keeps the lock valid
+        os.makedirs(self.root, exist_ok=True)
+        return open(os.path.join(self.root, name + '.lock'), 'a')
+
+    @contextmanager
+    def lease(self, project):
+        """Hold the workspace of ``project`` exclusively; yields its path.
+
+        Two builds of the same project, in this process or another one,
+        run one after the other in the same directory instead of racing
+        each other.
+        """
+        name = workspace_name(project)
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock, self._lock_file(name) as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with self._lock:
+                self._leased.add(name)
+            path = os.path.join(self.root, name)
+            try:
+                os.makedirs(path, exist_ok=True)
+                os.utime(path)
+                yield path
+            finally:
+                os.utime(path)
+                self._measure(name)
+                with self._lock:
+                    self._leased.discard(name)
+
+    def _measure(self, name):
+        """Walk the workspace ``name`` and store its disk usage."""
+        size = disk_usage(os.path.join(self.root, name))
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(size))
+        os.replace(tmp, os.path.join(self.root, name + '.size'))
+        return size
+
+    def size_of(self, name):
+        """Disk usage of the workspace ``name`` as of its last lease."""
+        try:
+            with open(os.path.join(self.root, name + '.size')) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            # Not measured yet, e.g. left by an older version
+            return self._measure(name)
+
+    def _workspaces(self):
+        """``(last used, name)`` of every workspace, oldest first."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        found = []
+        for name in names:
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path):
+                found.append((os.stat(path).st_mtime, name))
+        return sorted(found)
+
+    def collect(self):
+        """Remove idle workspaces past the count or disk quota; returns names."""
+        workspaces = self._workspaces()
+        sizes = {name: self.size_of(name) for _, name in workspaces}
+        total = sum(sizes.values())
+        count = len(workspaces)
+        removed = []
+        for _, name in workspaces:
+            if count <= self.max_count and total <= self.quota_bytes:
+                break
+            with self._lock:
+                if name in self._leased:
+                    continue
+                # Keep the lock so a new lease waits for the removal
+                lock = self._locks.setdefault(name, threading.Lock())
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                with self._lock_file(name) as lock_file:
+                    if fcntl is not None:
+                        try:
+                            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        except BlockingIOError:
+                            # Leased by another process
+                            continue
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                    try:
+                        os.remove(os.path.join(self.root, name + '.size'))
+                    except FileNotFoundError:
+                        pass
+            finally:
+                lock.release()
+            total -= sizes[name]
+            count -= 1
+            removed.append(name)
+        self.collected += len(removed)
+        return removed
+
+    def stats(self):
+        workspaces = self._workspaces()
+        return {
+            'workspaces': len(workspaces),
+            'bytes': sum(self.size_of(name) for _, name in workspaces),
+            'quota_bytes': self.quota_bytes,
+            'max_count': self.max_count,
+            'leased': len(self._leased),
+            'collected': self.collected,
+            'oldest_idle_s': time.time() - workspaces[0][0] if workspaces else 0.0,
+        }